@@ -0,0 +1,119 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Benchmarks of the creation of super-matches, run with airspeed velocity; see
+https://asv.readthedocs.io. From the ``benchmarks`` folder, ``asv run``
+benchmarks the current commit, and ``asv continuous main HEAD`` compares it
+against ``main``.
+
+Synthetic inputs are written once per suite by ``setup_cache``, so their
+generation contributes neither to the timings nor to the peak memory of the
+benchmarked process.
+'''
+
+import resource
+import sys
+
+import numpy as np
+
+from birnam import SuperMatch, combine_probabilities  # pylint: disable=import-error
+
+from .synthetic import make_synthetic_inputs
+
+
+class ChunkSuite():
+    '''
+    Benchmarks of the loading and combination of a single chunk.
+    '''
+    params = [10000, 100000, 1000000]
+    param_names = ['n_rows']
+    timeout = 600
+
+    def setup_cache(self):
+        # Each set of inputs is run once here, which also creates each chunk's
+        # output folder.
+        chunk_args = {}
+        for n_rows in self.params:
+            args = make_synthetic_inputs(f'chunk_{n_rows}', n_chunks=1, n_rows=n_rows,
+                                         n_catalogues=3, seed=n_rows)
+            SuperMatch(*args)
+            chunk_args[n_rows] = args
+        return chunk_args
+
+    def setup(self, chunk_args, n_rows):
+        # pylint: disable-next=attribute-defined-outside-init
+        self.super_match = SuperMatch(*chunk_args[n_rows], lazy=True)
+
+    def _run_super_match(self):
+        sm = self.super_match
+        primary_location, secondary_folders, save_filename = sm.chunk_locations('chunk_0')
+        sm.run_super_match(
+            sm.primary_catalogue_name, primary_location, sm.primary_catalogue_input_column_id,
+            save_filename, sm.list_of_catalogue_names, secondary_folders, sm.list_of_match_filenames,
+            sm.list_of_non_match_filenames, sm.list_of_match_primary_column_ids,
+            sm.list_of_match_secondary_column_ids, sm.list_of_match_probability_ids,
+            sm.list_of_non_match_primary_column_ids, sm.list_of_non_match_probability_ids)
+
+    def time_load_catalogue_column(self, chunk_args, n_rows):  # pylint: disable=unused-argument
+        self.super_match.load_catalogue_column(self.super_match.chunk_locations('chunk_0')[0], 0)
+
+    def peakmem_load_catalogue_column(self, chunk_args, n_rows):  # pylint: disable=unused-argument
+        self.super_match.load_catalogue_column(self.super_match.chunk_locations('chunk_0')[0], 0)
+
+    def time_run_super_match(self, chunk_args, n_rows):  # pylint: disable=unused-argument
+        self._run_super_match()
+
+    def time_chunk_super_match(self, chunk_args, n_rows):  # pylint: disable=unused-argument
+        self.super_match.chunk_super_match('chunk_0', output='structured')
+
+    def peakmem_run_super_match(self, chunk_args, n_rows):  # pylint: disable=unused-argument
+        self._run_super_match()
+
+
+class CombineProbabilitiesSuite():
+    '''
+    Benchmarks of the combination of the probabilities of one chunk, in
+    isolation from its loading.
+    '''
+    params = ([3, 10, 50], [False, True])
+    param_names = ['n_catalogues', 'log_space']
+
+    def setup(self, n_catalogues, log_space):
+        probabilities = np.random.default_rng(n_catalogues).uniform(0, 1, (1000000, n_catalogues))
+        # pylint: disable-next=attribute-defined-outside-init
+        self.probabilities = np.log(probabilities) if log_space else probabilities
+
+    def time_combine_probabilities(self, n_catalogues, log_space):  # pylint: disable=unused-argument
+        combine_probabilities(self.probabilities, log_space=log_space)
+
+    def peakmem_combine_probabilities(self, n_catalogues,  # pylint: disable=unused-argument
+                                      log_space):
+        combine_probabilities(self.probabilities, log_space=log_space)
+
+
+class SuperMatchSuite():
+    '''
+    Benchmarks of the full, multi-chunk creation of a super-match.
+    '''
+    params = ([1, 10], [None, 4])
+    param_names = ['chunk_size_skew', 'n_io_threads']
+    timeout = 600
+
+    def setup_cache(self):
+        return {chunk_size_skew: make_synthetic_inputs(
+            f'skew_{chunk_size_skew}', n_chunks=8, n_rows=50000, n_catalogues=3,
+            chunk_size_skew=chunk_size_skew, seed=chunk_size_skew)
+            for chunk_size_skew in self.params[0]}
+
+    def time_super_match(self, args, chunk_size_skew, n_io_threads):
+        SuperMatch(*args[chunk_size_skew][:-1], 2, n_io_threads=n_io_threads)
+
+    def track_peak_worker_memory(self, args, chunk_size_skew, n_io_threads):
+        '''
+        The largest peak resident memory of any worker process, in bytes.
+        '''
+        SuperMatch(*args[chunk_size_skew][:-1], 2, n_io_threads=n_io_threads)
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        # Linux reports kilobytes, and macOS bytes.
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    track_peak_worker_memory.unit = 'bytes'
@@ -0,0 +1,106 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Generation of synthetic macauff cross-match outputs, laid out on disk as
+expected by `~birnam.SuperMatch`, for benchmarking.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['chunk_sizes', 'make_synthetic_inputs']
+
+
+def chunk_sizes(n_chunks, n_rows, chunk_size_skew=1):
+    '''
+    Determine the number of primary catalogue objects in each chunk.
+
+    Parameters
+    ----------
+    n_chunks : integer
+        The number of chunks.
+    n_rows : integer
+        The mean number of primary catalogue objects per chunk.
+    chunk_size_skew : float, optional
+        The ratio of the size of the largest chunk to that of the smallest,
+        sizes being spaced geometrically between the two.
+
+    Returns
+    -------
+    sizes : numpy.ndarray
+        The number of objects in each chunk, largest last.
+    '''
+    weights = np.geomspace(1, chunk_size_skew, n_chunks)
+    return np.maximum(np.round(weights / np.mean(weights) * n_rows), 1).astype(np.int64)
+
+
+def make_synthetic_inputs(folder, n_chunks=4, n_rows=10000, n_catalogues=3, match_fraction=0.7,
+                          chunk_size_skew=1, seed=None):
+    '''
+    Write a synthetic set of primary catalogue chunks and their cross-matches
+    to each of a number of secondary catalogues.
+
+    Each primary object is, for each catalogue, a match -- with a uniquely
+    numbered counterpart and a probability between 0.5 and 1 -- with chance
+    ``match_fraction``, and otherwise a non-match, with a probability between
+    0 and 1. Match and non-match tables are written in a random order.
+
+    Parameters
+    ----------
+    folder : string
+        Location on disk in which to save the files.
+    n_chunks : integer, optional
+        The number of chunks.
+    n_rows : integer, optional
+        The mean number of primary catalogue objects per chunk.
+    n_catalogues : integer, optional
+        The number of secondary catalogues cross-matched to the primary
+        catalogue.
+    match_fraction : float, optional
+        The fraction of primary objects with a counterpart in each catalogue.
+    chunk_size_skew : float, optional
+        The ratio of the size of the largest chunk to that of the smallest.
+    seed : integer, optional
+        The seed of the random number generator.
+
+    Returns
+    -------
+    args : list
+        The positional arguments of `~birnam.SuperMatch` creating the
+        super-match of the synthetic inputs, saved inside ``folder``, with
+        one process.
+    '''
+    rng = np.random.default_rng(seed)
+    primary_folder = os.path.join(folder, 'primary')
+    top_level_folder = os.path.join(folder, 'cross_matches')
+    catalogue_names = [f'cat_{j}' for j in range(n_catalogues)]
+    first_id = 0
+    for k, n in enumerate(chunk_sizes(n_chunks, n_rows, chunk_size_skew)):
+        chunk_folder = f'chunk_{k}'
+        primary_ids = np.arange(first_id, first_id + n, dtype=np.int64)
+        first_id += n
+        _write_csv(os.path.join(primary_folder, chunk_folder, 'primary.csv'), primary_ids,
+                   rng.uniform(0, 360, n), rng.uniform(-90, 90, n))
+        for j, name in enumerate(catalogue_names):
+            match = rng.random(n) < match_fraction
+            match_ids = rng.permutation(primary_ids[match])
+            non_match_ids = rng.permutation(primary_ids[~match])
+            cross_match_folder = os.path.join(top_level_folder, name, chunk_folder)
+            _write_csv(os.path.join(cross_match_folder, 'matches.csv'), match_ids,
+                       match_ids + (j + 1) * 10**12, rng.uniform(0.5, 1, len(match_ids)))
+            _write_csv(os.path.join(cross_match_folder, 'non_matches.csv'), non_match_ids,
+                       rng.uniform(0, 1, len(non_match_ids)))
+    return [top_level_folder, 'primary', primary_folder, 0, 'primary.csv',
+            os.path.join(folder, 'super_match'), catalogue_names, catalogue_names,
+            ['matches.csv'] * n_catalogues, ['non_matches.csv'] * n_catalogues,
+            [0] * n_catalogues, [1] * n_catalogues, [2] * n_catalogues, [0] * n_catalogues,
+            [1] * n_catalogues, 1]
+
+
+def _write_csv(loc, *columns):
+    '''
+    Save a set of columns to a headerless CSV file, creating its folder.
+    '''
+    os.makedirs(os.path.dirname(loc), exist_ok=True)
+    pd.DataFrame(dict(enumerate(columns))).to_csv(loc, header=False, index=False)
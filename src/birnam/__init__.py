@@ -1,2 +1,17 @@
 # pylint: disable=missing-module-docstring
+from .cache import *
+from .combine import *
+from .consolidate import *
+from .instrumentation import *
+from .join import *
+from .lookup import *
+from .manifest import *
+from .pipeline import *
+from .readers import *
+from .scheduler import *
+from .sharding import *
+from .streaming import *
 from .super_match import *
+from .table import *
+from .validation import *
+from .writers import *
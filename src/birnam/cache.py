@@ -0,0 +1,179 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the on-disk cache of columns parsed from text catalogues,
+so that unchanged inputs are not parsed again by later runs.
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+__all__ = ['ColumnCache']
+
+# The fraction of its maximum size to which a full cache is reduced.
+LOW_WATER_FRACTION = 0.8
+
+
+class ColumnCache():
+    '''
+    A cache, in a folder on disk, of the columns parsed from catalogue files,
+    each saved as a ``.npy`` array.
+
+    Entries are keyed by the location, size and modification time of the file
+    parsed, and the index and data type of the column, so a file changed in
+    place is parsed again. Entries are written atomically, so the cache may be
+    shared by concurrent processes. Once the cache exceeds ``max_bytes`` the
+    least recently used entries are deleted until it holds at most
+    ``LOW_WATER_FRACTION`` of ``max_bytes``.
+
+    Each instance keeps a running total of the size of the cache, counting the
+    entries it saves and recounted from disk only when entries are deleted, so
+    the cache folder is not listed on every save. Entries saved by other
+    processes are therefore only counted at the next deletion.
+
+    Parameters
+    ----------
+    cache_folder : string
+        Location on disk of the folder holding the cache, created if needed.
+    max_bytes : integer, optional
+        The maximum total size of the cache's entries, in bytes. If not given,
+        entries are never deleted.
+    '''
+
+    def __init__(self, cache_folder, max_bytes=None):
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        # Counted from disk when first needed.
+        self._total_bytes = None
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def get(self, loc, id_, dtype=None):
+        '''
+        Load a cached column, if present.
+
+        Parameters
+        ----------
+        loc : string
+            Full location on disk of the file the column was parsed from.
+        id_ : integer
+            The zero-indexed column of the file.
+        dtype : numpy.dtype, optional
+            The data type the column was loaded as, or ``None`` for an ID
+            column, as per `~birnam.read_catalogue_columns`.
+
+        Returns
+        -------
+        column : numpy.ndarray
+            The column, or ``None`` if it is not in the cache.
+        '''
+        path = self._entry_path(loc, id_, dtype)
+        if path is None:
+            return None
+        try:
+            column = np.load(path, allow_pickle=False)
+            # Mark the entry as recently used.
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            # Missing, evicted by another process since, or unreadable.
+            return None
+        # String IDs are saved at a fixed width, and loaded as Python strings.
+        return column.astype(object) if column.dtype.kind == 'U' else column
+
+    def put(self, loc, id_, dtype, column):
+        '''
+        Save a parsed column to the cache, then delete the least recently used
+        entries if the cache has grown too large.
+
+        Parameters
+        ----------
+        loc : string
+            Full location on disk of the file the column was parsed from.
+        id_ : integer
+            The zero-indexed column of the file.
+        dtype : numpy.dtype
+            The data type the column was loaded as, or ``None`` for an ID
+            column, as per `~birnam.read_catalogue_columns`.
+        column : numpy.ndarray
+            The parsed column.
+        '''
+        path = self._entry_path(loc, id_, dtype)
+        if path is None:
+            return
+        if column.dtype == object:
+            stored = column.astype(np.str_)
+            # Columns not entirely of strings, e.g. with missing values, are
+            # not cached, as they would not load unchanged.
+            if not np.array_equal(stored.astype(object), column):
+                return
+            column = stored
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.cache_folder, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as f:
+                np.save(f, column, allow_pickle=False)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        if self.max_bytes is None:
+            return
+        if self._total_bytes is None:
+            # The first count includes the entry just saved.
+            self._total_bytes = sum(size for _, size, _ in self._entries())
+        else:
+            self._total_bytes += os.path.getsize(path)
+        if self._total_bytes > self.max_bytes:
+            self.evict(int(LOW_WATER_FRACTION * self.max_bytes))
+
+    def evict(self, max_bytes):
+        '''
+        Delete the least recently used entries until the cache holds at most
+        ``max_bytes``.
+
+        Parameters
+        ----------
+        max_bytes : integer
+            The maximum total size of the entries to keep, in bytes.
+        '''
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_folder, name))
+            except FileNotFoundError:
+                # Already evicted by another process.
+                pass
+            total -= size
+        self._total_bytes = total
+
+    def _entries(self):
+        '''
+        List the modification time, size and name of each entry on disk.
+        '''
+        entries = []
+        for name in os.listdir(self.cache_folder):
+            if name.endswith('.npy'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_folder, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+        return entries
+
+    def _entry_path(self, loc, id_, dtype):
+        '''
+        Determine the location of the entry of a column of the current version
+        of a file, or ``None`` if the file does not exist.
+        '''
+        try:
+            stat = os.stat(loc)
+        except FileNotFoundError:
+            return None
+        key = json.dumps([os.path.abspath(loc), stat.st_size, stat.st_mtime_ns, int(id_),
+                          None if dtype is None else np.dtype(dtype).str])
+        return os.path.join(self.cache_folder, hashlib.sha256(key.encode('utf-8')).hexdigest() +
+                            '.npy')
@@ -0,0 +1,222 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the combination of the cross-matches of several
+catalogues to one primary catalogue into a super-match table.
+'''
+
+import numpy as np
+
+from .instrumentation import stage
+from .join import PrimaryIDIndex
+from .table import NO_BAD_CATALOGUE, SuperMatchTable
+
+__all__ = ['combine_probabilities', 'combine_super_match']
+
+
+def combine_probabilities(probabilities, threshold=0.5, log_space=False):
+    '''
+    Combine the probabilities of each object in each of several cross-matches
+    into its overall probability, bad catalogue, and probability without the
+    bad catalogue.
+
+    An object's bad catalogue is that in which it has its lowest probability,
+    provided that probability is below ``threshold``; ties go to the earliest
+    catalogue. Objects with no probability below ``threshold`` have no bad
+    catalogue, and their probability without bad catalogue is their overall
+    probability.
+
+    Parameters
+    ----------
+    probabilities : numpy.ndarray
+        The probability of each object in each cross-match, of shape
+        ``(n_objects, n_catalogues)``, with ``1`` for objects absent from a
+        cross-match.
+    threshold : float, optional
+        The probability below which a catalogue may be considered bad.
+    log_space : boolean, optional
+        If ``True``, ``probabilities`` are natural logarithms, with ``0`` for
+        absent objects, and are combined by summation rather than
+        multiplication, so products over many catalogues do not underflow;
+        the returned probabilities are then natural logarithms too.
+        ``threshold`` is always given as a probability.
+
+    Returns
+    -------
+    probability : numpy.ndarray
+        The product of each object's probabilities.
+    bad_catalogue : numpy.ndarray
+        The index of each object's bad catalogue into the columns of
+        ``probabilities``, or ``-1`` for objects without a bad catalogue.
+    probability_without_bad : numpy.ndarray
+        The product of each object's probabilities, excluding that of its bad
+        catalogue.
+    '''
+    if not 0 <= threshold <= 1:
+        raise ValueError(f'threshold must be between 0 and 1, not {threshold}.')
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    probability = (np.sum if log_space else np.prod)(probabilities, axis=1)
+    return (probability,
+            *_bad_catalogues(probability, _worst_catalogues(probabilities, log_space), threshold,
+                             log_space))
+
+
+def _worst_catalogues(probabilities, log_space=False):
+    '''
+    Find the lowest probability of each object, the index of the catalogue it
+    is in, ties going to the earliest, and the product of the object's other
+    probabilities, as held in `~birnam.SuperMatchTable.worst`.
+    '''
+    n_objects, n_catalogues = probabilities.shape
+    reduce, neutral = (np.sum, 0) if log_space else (np.prod, 1)
+    if n_catalogues == 0:
+        return (np.full(n_objects, np.inf), np.full(n_objects, NO_BAD_CATALOGUE, dtype=np.int16),
+                reduce(probabilities, axis=1))
+    rows = np.arange(n_objects)
+    worst_catalogue = np.argmin(probabilities, axis=1)
+    worst_probability = probabilities[rows, worst_catalogue]
+    # Multiplying out every other probability, rather than dividing out the
+    # worst, keeps zero probabilities exact.
+    others = probabilities.copy(order='F')
+    others[rows, worst_catalogue] = neutral
+    return worst_probability, worst_catalogue.astype(np.int16), reduce(others, axis=1)
+
+
+def _bad_catalogues(probability, worst, threshold, log_space=False):
+    '''
+    Determine the bad catalogue of each object, and its probability without
+    that catalogue, from its worst catalogue as per `_worst_catalogues`.
+    '''
+    worst_probability, worst_catalogue, probability_without_worst = worst
+    with np.errstate(divide='ignore'):
+        bad = worst_probability < (np.log(threshold) if log_space else threshold)
+    return (np.where(bad, worst_catalogue, NO_BAD_CATALOGUE).astype(np.int16),
+            np.where(bad, probability_without_worst, probability))
+
+
+def combine_super_match(primary_catalogue_name, primary_ids, list_of_catalogue_names,
+                        cross_matches, output='table', bad_catalogue_threshold=0.5):
+    '''
+    Combine the cross-matches of each secondary catalogue to one set of primary
+    catalogue objects into a super-match table.
+
+    This requires no files, so cross-matches already held in memory can be
+    combined directly.
+
+    Parameters
+    ----------
+    primary_catalogue_name : string
+        The name of the "primary" photometric catalogue.
+    primary_ids : numpy.ndarray
+        The IDs of each primary catalogue object.
+    list_of_catalogue_names : list or numpy.ndarray of strings
+        The names of each catalogue cross-matched to the primary catalogue.
+    cross_matches : iterable of tuples of numpy.ndarray
+        For each of ``list_of_catalogue_names`` in turn, the primary IDs,
+        secondary IDs and probabilities of the matches followed by the primary
+        IDs and probabilities of the non-matches, as returned by
+        `~birnam.SuperMatch.load_cross_match`.
+    output : string, optional
+        The form in which to return the table: ``'table'`` for the compact
+        `~birnam.SuperMatchTable`, ``'dataframe'`` for a `~pandas.DataFrame`,
+        or ``'structured'`` for a NumPy structured array.
+    bad_catalogue_threshold : float, optional
+        The probability below which a catalogue may be considered an object's
+        bad catalogue, as per `combine_probabilities`.
+
+    Returns
+    -------
+    super_match : SuperMatchTable, pandas.DataFrame or numpy.ndarray
+        The super-match table, with one row per object in ``primary_ids``.
+    '''
+    with stage('index primary'):
+        super_match = SuperMatchTable.initialise(primary_catalogue_name, list_of_catalogue_names,
+                                                 primary_ids)
+        # Build the primary ID index once, re-using it to place the rows of
+        # every cross-match table.
+        primary_index = PrimaryIDIndex(primary_ids)
+
+    # Column-major, so that each cross-match's probabilities are filled in
+    # contiguously.
+    probabilities = np.ones((len(super_match), len(list_of_catalogue_names)), dtype=np.float64,
+                            order='F')
+    # Loop over catalogues, placing the IDs and probabilities of each, then
+    # combine the probabilities of every catalogue at once.
+    for i, cross_match in zip(range(len(list_of_catalogue_names)), cross_matches):
+        with stage(f'combine {list_of_catalogue_names[i]}'):
+            rows, cross_match_probabilities = _fold_cross_match(super_match, primary_index, i,
+                                                                cross_match)
+            probabilities[rows, i] = cross_match_probabilities
+    _update_probabilities(super_match, bad_catalogue_threshold, probabilities)
+
+    return _convert_super_match(super_match, output)
+
+
+def _convert_super_match(super_match, output):
+    '''
+    Convert a compact super-match table to the requested form.
+    '''
+    if output == 'table':
+        return super_match
+    if output == 'dataframe':
+        return super_match.to_dataframe()
+    if output == 'structured':
+        return super_match.to_structured()
+    raise ValueError(f"output must be 'table', 'dataframe' or 'structured', not {output!r}.")
+
+
+def _fold_cross_match(super_match, primary_index, catalogue_index, cross_match):
+    '''
+    Update a super-match table in place with the counterparts of one
+    cross-match, returning the rows and probabilities of its objects. The
+    combined probability columns are left to `_update_probabilities`.
+
+    Parameters
+    ----------
+    super_match : SuperMatchTable
+        The table, already containing all previous cross-matches.
+    primary_index : PrimaryIDIndex
+        The index of the table's primary IDs.
+    catalogue_index : integer
+        The index into the table's ``list_of_catalogue_names`` of the
+        cross-match.
+    cross_match : tuple of numpy.ndarray
+        The primary IDs, secondary IDs and probabilities of the matches,
+        followed by the primary IDs and probabilities of the non-matches, as
+        returned by `~birnam.SuperMatch.load_cross_match`.
+
+    Returns
+    -------
+    rows : numpy.ndarray
+        The rows of the table in the cross-match's match or non-match tables.
+    probabilities : numpy.ndarray
+        The match or non-match probability of each of ``rows``.
+    '''
+    (primary_match_ids, secondary_match_ids, match_probs, primary_non_match_ids,
+     non_match_probs) = cross_match
+    # Each primary object may appear in at most one of the match and
+    # non-match tables for a given cross-match.
+    description = (f'{super_match.list_of_catalogue_names[catalogue_index]} match and non-match '
+                   'tables')
+    match_ind = primary_index.lookup(primary_match_ids, description)
+    non_match_ind = primary_index.lookup(primary_non_match_ids, description)
+    ind = np.concatenate((match_ind, non_match_ind))
+    primary_index.check_unique(ind, description)
+    super_match.set_secondary_ids(catalogue_index, match_ind, secondary_match_ids, non_match_ind)
+    return ind, np.concatenate((match_probs, non_match_probs))
+
+
+def _update_probabilities(super_match, bad_catalogue_threshold, probabilities=None):
+    '''
+    Compute the combined probability columns, and ``worst`` state, of a
+    super-match table from the probabilities of each of its cross-matches,
+    of shape ``(len(super_match), n_catalogues)``, or, if not given, the bad
+    catalogue columns alone from the state already updated by
+    `~birnam.SuperMatchTable.add_probabilities`.
+    '''
+    with stage('combine probabilities'):
+        if probabilities is not None:
+            super_match.columns['Probability'] = np.prod(probabilities, axis=1)
+            super_match.worst = _worst_catalogues(probabilities)
+        (super_match.columns['Bad catalogue'],
+         super_match.columns['Probability without bad catalogue']) = _bad_catalogues(
+            super_match.columns['Probability'], super_match.worst, bad_catalogue_threshold)
@@ -0,0 +1,318 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the consolidation of the per-chunk tables of a super-match
+into a single dataset, partitioned and sorted by primary ID, with the
+statistics of each partition recorded so that readers can skip partitions.
+'''
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .streaming import SpillFile, scatter_to_spill
+from .table import _decode_ids
+from .writers import CSVWriter, HDF5Writer, ParquetWriter, _import_optional, get_writer
+
+__all__ = ['consolidate_super_match', 'read_super_match', 'select_partitions']
+
+# Prefixed by an underscore, so that Parquet readers of the folder skip it.
+PARTITIONS_FILENAME = '_super_match_partitions.json'
+
+# One in every this many primary IDs of each chunk is sampled to determine the
+# boundaries of the partitions.
+SAMPLE_STRIDE = 100
+
+
+def consolidate_super_match(super_match, output_folder, output_format='parquet', compression=None,
+                            rows_per_partition=1000000, rows_per_group=100000, n_pool=None,
+                            n_histogram_bins=10):
+    '''
+    Merge the saved tables of every chunk of a super-match into one dataset of
+    partitions, each holding a contiguous range of primary IDs in sorted
+    order.
+
+    The chunks' tables are read twice, in parallel: once to sample their
+    primary IDs, from which the partitions' boundaries are chosen, and once
+    to distribute their rows to temporary files by partition. Each partition
+    is then sorted and saved, also in parallel, so no process holds more than
+    one chunk or one partition in memory at once.
+
+    The statistics of each partition -- its file, number of rows, smallest
+    and largest primary ID, and a histogram of its probabilities -- are saved
+    as ``_super_match_partitions.json`` inside ``output_folder``, once every
+    partition has been saved. See `select_partitions`.
+
+    Parameters
+    ----------
+    super_match : SuperMatch
+        The super-match, every chunk of which has been run.
+    output_folder : string
+        Location on disk of the folder in which to save the partitions.
+    output_format : string or SuperMatchWriter subclass, optional
+        The format of the partitions, as per `~birnam.get_writer`.
+    compression : string, optional
+        Compression passed to the writer of ``output_format``.
+    rows_per_partition : integer, optional
+        The approximate number of rows of each partition.
+    rows_per_group : integer, optional
+        The number of rows written to a partition at once, giving the size of
+        the row groups of Parquet partitions.
+    n_pool : integer, optional
+        The number of processes, by default the ``n_pool`` of
+        ``super_match``.
+    n_histogram_bins : integer, optional
+        The number of equal-width bins between 0 and 1 of each partition's
+        histogram of probabilities.
+
+    Returns
+    -------
+    statistics : dict
+        The contents of ``_super_match_partitions.json``: the ``columns`` of
+        the dataset, the edges of the ``histogram_bins``, and the statistics
+        of each of its ``partitions``.
+    '''
+    writer = get_writer(output_format)
+    n_pool = super_match.n_pool if n_pool is None else n_pool
+    column_names = _column_names(super_match)
+    header = super_match.writer_options.get('header', False)
+    paths = [super_match.chunk_locations(chunk_folder)[2]
+             for chunk_folder in super_match.all_chunk_folders]
+    os.makedirs(output_folder, exist_ok=True)
+    spill_folder = tempfile.mkdtemp(dir=output_folder, prefix='.spill_')
+    try:
+        with multiprocessing.Pool(n_pool) as pool:
+            samples = pool.starmap(_sample_chunk, [
+                (path, column_names, super_match.writer, header) for path in paths])
+            n_rows = sum(n for n, _ in samples)
+            boundaries = _partition_boundaries(
+                [sample for n, sample in samples if n > 0],
+                max(1, -(-n_rows // rows_per_partition)))
+            # Each chunk has its own spill file per partition, so no two
+            # processes ever write to the same file.
+            spill_prefixes = [os.path.join(spill_folder, f'chunk_{i}') for i in range(len(paths))]
+            pool.starmap(_scatter_chunk, [
+                (path, column_names, super_match.writer, header, boundaries, spill_prefix)
+                for path, spill_prefix in zip(paths, spill_prefixes)])
+            extension = writer.file_extension(compression)
+            partitions = pool.starmap(_save_partition, [
+                (spill_prefixes, k, column_names,
+                 os.path.join(output_folder, f'part_{k:05d}.{extension}'), writer, compression,
+                 rows_per_group, n_histogram_bins) for k in range(len(boundaries) + 1)])
+    finally:
+        shutil.rmtree(spill_folder)
+
+    statistics = {'columns': column_names,
+                  'histogram_bins': np.linspace(0, 1, n_histogram_bins + 1).tolist(),
+                  'partitions': [partition for partition in partitions if partition is not None]}
+    # Write under a temporary name, so the statistics are only ever seen
+    # complete, and only once every partition has been saved.
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=output_folder, suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as f:
+            json.dump(statistics, f, indent=1)
+        os.replace(temporary_path, os.path.join(output_folder, PARTITIONS_FILENAME))
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    return statistics
+
+
+def read_super_match(path, column_names, output_format='csv', header=False):
+    '''
+    Load a super-match table saved by one of the built-in writers.
+
+    Parameters
+    ----------
+    path : string
+        Location on disk of the saved table.
+    column_names : list of strings
+        The names of the columns of the table, in order.
+    output_format : string or SuperMatchWriter subclass, optional
+        The format the table was saved in, as per `~birnam.get_writer`.
+    header : boolean, optional
+        Whether a CSV table was saved with a header row.
+
+    Returns
+    -------
+    columns : dict
+        Mapping of column name to one-dimensional array, with primary IDs as
+        read, secondary IDs as Python strings -- or integers, if saved as
+        integers in a Parquet or HDF5 table -- with ``None`` for primary
+        objects absent from a cross-match, bad catalogues as Python strings,
+        and probabilities as floats. Non-matches are ``'N/A'``, except in the
+        integer ID columns of Parquet tables, in which they are ``None``.
+    '''
+    writer = get_writer(output_format)
+    if issubclass(writer, CSVWriter):
+        string_names = [*column_names[1:-3], 'Bad catalogue']
+        try:
+            table = pd.read_csv(path, header=0 if header else None, names=column_names,
+                                keep_default_na=False, dtype={name: object for name in string_names})
+        except pd.errors.EmptyDataError:
+            table = pd.DataFrame({name: np.empty(0, dtype=object) for name in column_names})
+        columns = {name: table[name].to_numpy() for name in column_names}
+    elif issubclass(writer, ParquetWriter):
+        # Integer IDs with nulls are read as integers, rather than floats.
+        table = _import_optional('pyarrow.parquet', 'Parquet').read_table(path).to_pandas(
+            integer_object_nulls=True)
+        columns = {name: table[name].to_numpy(dtype=object) if table[name].dtype != np.float64
+                   else table[name].to_numpy() for name in column_names}
+    elif issubclass(writer, HDF5Writer):
+        with _import_h5py().File(path, 'r') as f:
+            columns = {name: f[name][:] for name in column_names}
+    else:
+        raise ValueError(f'Tables saved by {writer.__qualname__} cannot be read.')
+    return _normalise_columns(columns, column_names)
+
+
+def select_partitions(output_folder, min_id=None, max_id=None, min_probability=None):
+    '''
+    Determine which partitions of a consolidated super-match may hold rows of
+    interest, from their recorded statistics, without reading them.
+
+    Parameters
+    ----------
+    output_folder : string
+        Location on disk of the folder of the consolidated super-match.
+    min_id, max_id : integer or string, optional
+        The range of primary IDs of interest, inclusive.
+    min_probability : float, optional
+        The smallest probability of interest.
+
+    Returns
+    -------
+    paths : list of strings
+        The full locations on disk of every partition that may hold a row
+        with a primary ID between ``min_id`` and ``max_id`` and a probability
+        of at least ``min_probability``.
+    '''
+    with open(os.path.join(output_folder, PARTITIONS_FILENAME), 'r', encoding='utf-8') as f:
+        statistics = json.load(f)
+    upper_edges = np.array(statistics['histogram_bins'][1:])
+    paths = []
+    for partition in statistics['partitions']:
+        if min_id is not None and partition['max_id'] < min_id:
+            continue
+        if max_id is not None and partition['min_id'] > max_id:
+            continue
+        if min_probability is not None and not np.any(
+                np.array(partition['probability_histogram'])[upper_edges >= min_probability]):
+            continue
+        paths.append(os.path.join(output_folder, partition['filename']))
+    return paths
+
+
+def _column_names(super_match):
+    '''
+    Determine the names of the columns of the tables of a super-match.
+    '''
+    return [f'{super_match.primary_catalogue_name} ID',
+            *(f'{name} ID' for name in super_match.list_of_catalogue_names),
+            'Probability', 'Bad catalogue', 'Probability without bad catalogue']
+
+
+def _normalise_columns(columns, column_names):
+    '''
+    Convert the columns of a table read from disk to a common form,
+    independent of the format it was saved in.
+    '''
+    for name in column_names:
+        if columns[name].dtype.kind in 'OS':
+            columns[name] = np.array([value.decode('utf-8') if isinstance(value, bytes) else value
+                                      for value in columns[name]], dtype=object)
+    for name in column_names[1:-3]:
+        # Absent entries are saved as empty strings, nulls, or the sentinels
+        # of integer IDs in HDF5 tables.
+        if columns[name].dtype.kind == 'i':
+            columns[name] = _decode_ids(columns[name], sentinels=True)
+        column = columns[name].astype(object)
+        column[pd.isna(column) | (column == '')] = None
+        columns[name] = column
+    if columns[column_names[0]].dtype == object:
+        columns[column_names[0]] = _as_primary_ids(columns[column_names[0]])
+    return columns
+
+
+def _import_h5py():
+    '''
+    Import the optional dependency needed to load HDF5 tables.
+    '''
+    try:
+        import h5py  # pylint: disable=import-outside-toplevel
+    except ImportError as e:
+        raise ImportError('h5py is required to load HDF5 super-matches.') from e
+    return h5py
+
+
+def _as_primary_ids(ids):
+    '''
+    Convert primary IDs read as strings to integers, if they all are.
+    '''
+    try:
+        return ids.astype(np.int64)
+    except (TypeError, ValueError):
+        return ids
+
+
+def _sample_chunk(path, column_names, writer, header):
+    '''
+    Count the rows of a chunk's table and sample its primary IDs.
+    '''
+    ids = read_super_match(path, column_names, writer, header)[column_names[0]]
+    return len(ids), np.sort(ids)[::SAMPLE_STRIDE]
+
+
+def _partition_boundaries(samples, n_partitions):
+    '''
+    Choose the primary IDs dividing partitions of approximately equal size
+    from samples of the IDs of each chunk.
+    '''
+    if not samples:
+        return np.empty(0, dtype=np.int64)
+    sample = np.sort(np.concatenate(samples))
+    return sample[(np.arange(1, n_partitions) * len(sample)) // n_partitions]
+
+
+def _scatter_chunk(path, column_names, writer, header, boundaries, spill_prefix):
+    '''
+    Distribute the rows of a chunk's table to the spill files of their
+    partitions.
+    '''
+    columns = read_super_match(path, column_names, writer, header)
+    if len(columns[column_names[0]]) == 0:
+        return
+    partitions = np.searchsorted(boundaries, columns[column_names[0]], side='right')
+    empty = [np.empty(0, dtype=object)] * len(column_names)
+    scatter_to_spill(list(columns.values()), partitions,
+                     [SpillFile(f'{spill_prefix}_{k}.npy', empty)
+                      for k in range(len(boundaries) + 1)])
+
+
+def _save_partition(spill_prefixes, partition, column_names, path, writer, compression,
+                    rows_per_group, n_histogram_bins):
+    '''
+    Sort and save the rows of one partition from the spill files of every
+    chunk, returning its statistics, or ``None`` if it is empty.
+    '''
+    empty = [np.empty(0, dtype=object)] * len(column_names)
+    blocks = [block for prefix in spill_prefixes for block in
+              SpillFile(f'{prefix}_{partition}.npy', empty).read_blocks()]
+    if not blocks:
+        return None
+    columns = [np.concatenate([block[j] for block in blocks]) for j in range(len(column_names))]
+    order = np.argsort(columns[0], kind='stable')
+    columns = [column[order] for column in columns]
+    with writer(path, compression=compression) as partition_writer:
+        for start in range(0, len(order), rows_per_group):
+            partition_writer.write({name: column[start:start + rows_per_group]
+                                    for name, column in zip(column_names, columns)})
+    histogram, _ = np.histogram(columns[-3], bins=n_histogram_bins, range=(0, 1))
+    # Convert NumPy integers to Python ones, for JSON.
+    min_id, max_id = columns[0][[0, -1]].tolist()
+    return {'filename': os.path.basename(path), 'rows': len(order), 'min_id': min_id,
+            'max_id': max_id, 'probability_histogram': histogram.tolist()}
@@ -0,0 +1,232 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the optional instrumentation of super-matches: the timing
+and memory use of each stage of each chunk, and the statistics of every file
+read.
+'''
+
+import contextlib
+import cProfile
+import json
+import os
+import time
+
+import pandas as pd
+
+__all__ = ['ChunkProfile', 'CProfileHook', 'write_run_report']
+
+REPORT_FILENAME = 'super_match_report.json'
+
+# The profile of the chunk currently being run in this process, if the run is
+# instrumented.
+_ACTIVE_PROFILE = None
+
+
+class ChunkProfile():  # pylint: disable=too-few-public-methods
+    '''
+    The record of the stages of, and files read by, the super-match of a
+    single chunk. Stages run more than once, such as the combination of each
+    partition of an out-of-core chunk, are recorded once, with their total
+    duration.
+
+    Parameters
+    ----------
+    chunk_folder : string
+        The name of the chunk's folder.
+    '''
+
+    def __init__(self, chunk_folder):
+        self.chunk_folder = chunk_folder
+        self.stages = {}
+        self.reads = []
+
+    def to_dict(self):
+        '''
+        Convert the profile to plain Python types.
+
+        Returns
+        -------
+        profile : dict
+            The chunk's ``stages``, in the order they were first run, each
+            with its total ``duration`` in seconds, the number of ``calls``, and
+            the ``rss_increase``, the largest increase over any one call in the
+            resident memory of the process, in bytes; and its ``reads``, each
+            with the ``location``, number of ``rows``, ``bytes`` and
+            ``duration`` of the read.
+        '''
+        return {'chunk': self.chunk_folder,
+                'stages': [{'stage': name, **record} for name, record in self.stages.items()],
+                'reads': self.reads}
+
+
+class CProfileHook():  # pylint: disable=too-few-public-methods
+    '''
+    A chunk hook, as per the ``chunk_hook`` of `~birnam.SuperMatch`, running
+    selected chunks under `cProfile`.
+
+    Parameters
+    ----------
+    chunk_folders : list of strings
+        The names of the folders of the chunks to profile.
+    save_folder : string
+        Location on disk of the folder in which to save the statistics of
+        each profiled chunk, as ``<chunk_folder>.prof``, readable with
+        `pstats`.
+    '''
+
+    def __init__(self, chunk_folders, save_folder):
+        self.chunk_folders = list(chunk_folders)
+        self.save_folder = save_folder
+
+    def __call__(self, chunk_folder):
+        if chunk_folder not in self.chunk_folders:
+            return None
+        return self._profile(chunk_folder)
+
+    @contextlib.contextmanager
+    def _profile(self, chunk_folder):
+        '''
+        Profile the code run inside the context, saving its statistics.
+        '''
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            os.makedirs(self.save_folder, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.save_folder, f'{chunk_folder}.prof'))
+
+
+@contextlib.contextmanager
+def profile_chunk(chunk_folder):
+    '''
+    Record the stages of, and files read by, one chunk run in this process.
+
+    Parameters
+    ----------
+    chunk_folder : string
+        The name of the chunk's folder.
+
+    Yields
+    ------
+    profile : ChunkProfile
+        The chunk's profile, complete once the context is exited.
+    '''
+    global _ACTIVE_PROFILE  # pylint: disable=global-statement
+    _ACTIVE_PROFILE = ChunkProfile(chunk_folder)
+    try:
+        with stage('total'):
+            yield _ACTIVE_PROFILE
+    finally:
+        _ACTIVE_PROFILE = None
+
+
+@contextlib.contextmanager
+def stage(name):
+    '''
+    Time one stage of the super-match of the chunk currently being profiled,
+    if any.
+
+    Parameters
+    ----------
+    name : string
+        The name of the stage.
+    '''
+    profile = _ACTIVE_PROFILE
+    if profile is None:
+        yield
+        return
+    start, start_rss = time.perf_counter(), current_rss()
+    try:
+        yield
+    finally:
+        record = profile.stages.setdefault(name, {'duration': 0, 'calls': 0, 'rss_increase': None})
+        record['duration'] += time.perf_counter() - start
+        record['calls'] += 1
+        end_rss = current_rss()
+        if start_rss is not None and end_rss is not None:
+            record['rss_increase'] = max(end_rss - start_rss, record['rss_increase'] or 0)
+
+
+def record_read(location, n_rows, duration):
+    '''
+    Record a file read by the chunk currently being profiled, if any.
+
+    Parameters
+    ----------
+    location : string
+        Full location on disk of the file.
+    n_rows : integer
+        The number of rows read.
+    duration : float
+        The time taken, in seconds, to read the file.
+    '''
+    if _ACTIVE_PROFILE is not None:
+        _ACTIVE_PROFILE.reads.append({'location': location, 'rows': int(n_rows),
+                                      'bytes': os.path.getsize(location), 'duration': duration})
+
+
+def current_rss():
+    '''
+    Determine the current resident memory of this process.
+
+    Unlike the peak resident memory, which only ever grows over the life of a
+    process, this attributes memory to the stages of each chunk run by a
+    reused worker process.
+
+    Returns
+    -------
+    rss : integer
+        The resident set size, in bytes, or ``None`` where not available.
+    '''
+    try:
+        with open('/proc/self/statm', 'r', encoding='utf-8') as f:
+            resident_pages = int(f.read().split()[1])
+    except OSError:  # Only available on Linux.
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def write_run_report(chunk_results, path):
+    '''
+    Save the outcome, timings and memory use of every chunk of a super-match.
+
+    Parameters
+    ----------
+    chunk_results : dict
+        Mapping of chunk folder name to `~birnam.ChunkResult`, as per the
+        ``chunk_results`` of `~birnam.SuperMatch`.
+    path : string
+        Location on disk to which to save the report. If the extension is
+        ``.csv``, one row is saved per chunk, stage and file read; otherwise
+        the report is saved as JSON.
+    '''
+    # Slowest chunks first, to surface stragglers.
+    results = sorted(chunk_results.values(), key=lambda result: -result.duration)
+    chunks = []
+    for result in results:
+        chunk = {'chunk': result.chunk_folder, 'cost': result.cost, 'duration': result.duration,
+                 'success': result.success, 'skipped': result.skipped, 'error': result.error}
+        if result.profile is not None:
+            chunk.update(result.profile.to_dict())
+        chunks.append(chunk)
+    if os.path.splitext(path)[1] == '.csv':
+        rows = []
+        for chunk in chunks:
+            rows.append({'chunk': chunk['chunk'], 'record': 'chunk', 'name': chunk['chunk'],
+                         'duration': chunk['duration'], 'success': chunk['success'],
+                         'skipped': chunk['skipped']})
+            rows.extend({'chunk': chunk['chunk'], 'record': 'stage', 'name': s['stage'],
+                         'duration': s['duration'], 'calls': s['calls'],
+                         'rss_increase': s['rss_increase']}
+                        for s in chunk.get('stages', []))
+            rows.extend({'chunk': chunk['chunk'], 'record': 'read', 'name': r['location'],
+                         'duration': r['duration'], 'rows': r['rows'], 'bytes': r['bytes']}
+                        for r in chunk.get('reads', []))
+        columns = ['chunk', 'record', 'name', 'duration', 'success', 'skipped', 'calls',
+                   'rss_increase', 'rows', 'bytes']
+        pd.DataFrame(rows, columns=columns).to_csv(path, index=False)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'chunks': chunks}, f, indent=1)
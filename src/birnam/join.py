@@ -0,0 +1,105 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the join engine used to place the rows of each cross-match
+output table against the rows of the primary catalogue.
+'''
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['PrimaryIDIndex']
+
+
+class PrimaryIDIndex():
+    '''
+    A hash-based index of the IDs of one chunk of the primary catalogue,
+    built once and re-used to locate the rows of every cross-match table.
+
+    Parameters
+    ----------
+    primary_ids : numpy.ndarray
+        The IDs of each object in the primary catalogue, in catalogue order.
+    '''
+
+    def __init__(self, primary_ids):
+        self.index = pd.Index(primary_ids)
+        if not self.index.is_unique:
+            duplicates = self.index[self.index.duplicated()].unique()
+            raise ValueError(f'Primary catalogue contains {len(duplicates)} duplicated ID(s), '
+                             f'e.g. {_preview(duplicates)}.')
+
+    def __len__(self):
+        return len(self.index)
+
+    def lookup(self, ids, description='input table'):
+        '''
+        Determine the primary catalogue row of each of a set of IDs.
+
+        Parameters
+        ----------
+        ids : numpy.ndarray
+            The primary catalogue IDs to locate.
+        description : string, optional
+            Human-readable name of the table ``ids`` came from, used in any
+            error message raised.
+
+        Returns
+        -------
+        rows : numpy.ndarray
+            The zero-indexed row in the primary catalogue of each of ``ids``.
+        '''
+        rows = self.index.get_indexer(ids)
+        missing = rows < 0
+        if np.any(missing):
+            raise ValueError(f'{np.sum(missing)} ID(s) in {description} are not present in the '
+                             f'primary catalogue, e.g. {_preview(np.asarray(ids)[missing])}.')
+        return rows
+
+    def lookup_unique(self, ids, description='input table'):
+        '''
+        Determine the primary catalogue row of each of a set of IDs, requiring
+        that each primary object appears at most once.
+
+        Parameters
+        ----------
+        ids : numpy.ndarray
+            The primary catalogue IDs to locate.
+        description : string, optional
+            Human-readable name of the table ``ids`` came from, used in any
+            error message raised.
+
+        Returns
+        -------
+        rows : numpy.ndarray
+            The zero-indexed row in the primary catalogue of each of ``ids``.
+        '''
+        rows = self.lookup(ids, description)
+        self.check_unique(rows, description)
+        return rows
+
+    def check_unique(self, rows, description='input table'):
+        '''
+        Check that no primary catalogue row is referenced more than once.
+
+        Parameters
+        ----------
+        rows : numpy.ndarray
+            Zero-indexed primary catalogue rows, as returned by ``lookup``.
+        description : string, optional
+            Human-readable name of the table(s) ``rows`` came from, used in any
+            error message raised.
+        '''
+        counts = np.bincount(rows, minlength=len(self.index))
+        if np.any(counts > 1):
+            duplicates = self.index[counts > 1]
+            raise ValueError(f'{len(duplicates)} primary ID(s) appear more than once in '
+                             f'{description}, e.g. {_preview(duplicates)}.')
+
+
+def _preview(values, n=5):
+    '''
+    Format the first few entries of an array for an error message.
+    '''
+    values = list(values)
+    text = ', '.join(str(v) for v in values[:n])
+    return text + (', ...' if len(values) > n else '')
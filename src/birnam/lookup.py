@@ -0,0 +1,281 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides an on-disk index of the primary IDs of every chunk of a
+super-match, from which the rows of given primary objects are found and read
+without scanning the chunks' tables.
+'''
+
+import gzip
+import io
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from .consolidate import _as_primary_ids, _column_names, _import_h5py, _normalise_columns, read_super_match
+from .manifest import fingerprint_files
+from .writers import WRITERS, CSVWriter, ParquetWriter, _import_optional
+
+__all__ = ['SuperMatchIndex', 'build_super_match_index']
+
+INDEX_FOLDER = 'super_match_index'
+
+
+def build_super_match_index(super_match, n_pool=None):
+    '''
+    Index the primary IDs of every chunk of a super-match, once run, by the
+    chunk and row of each, saving the index inside a ``super_match_index``
+    folder in the super-match's ``super_match_save_folder``.
+
+    The primary IDs are saved in sorted order, as a ``.npy`` array memory-mapped
+    by `SuperMatchIndex`, alongside the chunk and row number of each, and --
+    for CSV tables -- the offset of the row in the uncompressed file.
+
+    Parameters
+    ----------
+    super_match : SuperMatch
+        The super-match, every chunk of which has been run.
+    n_pool : integer, optional
+        The number of processes reading the chunks' tables, by default the
+        ``n_pool`` of ``super_match``.
+
+    Returns
+    -------
+    index : SuperMatchIndex
+        The index.
+    '''
+    output_format = next((name for name, writer in WRITERS.items()
+                          if issubclass(super_match.writer, writer)), None)
+    if output_format is None:
+        raise ValueError(f'Tables saved by {super_match.writer.__qualname__} cannot be indexed.')
+    index_folder = os.path.join(super_match.super_match_save_folder, INDEX_FOLDER)
+    os.makedirs(index_folder, exist_ok=True)
+    column_names = _column_names(super_match)
+    header = super_match.writer_options.get('header', False)
+    paths = [super_match.chunk_locations(chunk_folder)[2]
+             for chunk_folder in super_match.all_chunk_folders]
+    with multiprocessing.Pool(super_match.n_pool if n_pool is None else n_pool) as pool:
+        indexed = pool.starmap(_index_chunk, [(path, column_names, output_format, header,
+                                               super_match.compression) for path in paths])
+
+    ids = _as_primary_ids(np.concatenate([chunk_ids for chunk_ids, _ in indexed]).astype(object))
+    # Strings are saved at a fixed width, so they can be memory-mapped.
+    ids = ids.astype(np.int64 if ids.dtype.kind == 'i' else np.str_)
+    order = np.argsort(ids, kind='stable')
+    chunks = np.repeat(np.arange(len(paths), dtype=np.int32),
+                       [len(chunk_ids) for chunk_ids, _ in indexed])
+    rows = np.concatenate([np.arange(len(chunk_ids), dtype=np.int64) for chunk_ids, _ in indexed])
+    offsets = np.concatenate([chunk_offsets for _, chunk_offsets in indexed])
+    for name, array in [('ids', ids), ('chunks', chunks), ('rows', rows), ('offsets', offsets)]:
+        np.save(os.path.join(index_folder, f'{name}.npy'), array[order])
+    # The tables are fingerprinted so that a stale index is detected.
+    description = {'columns': column_names, 'output_format': output_format, 'header': header,
+                   'compression': super_match.compression,
+                   'chunks': [{'chunk': chunk_folder, 'path': os.path.relpath(path, index_folder),
+                               'fingerprint': fingerprint}
+                              for chunk_folder, path, fingerprint in zip(
+                                  super_match.all_chunk_folders, paths,
+                                  fingerprint_files(paths).values())]}
+    with open(os.path.join(index_folder, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(description, f, indent=1)
+    return SuperMatchIndex(index_folder)
+
+
+class SuperMatchIndex():
+    '''
+    The index of the primary IDs of a super-match, as saved by
+    `build_super_match_index`, from which rows are looked up in batches.
+
+    Parameters
+    ----------
+    index_folder : string
+        Location on disk of the ``super_match_index`` folder.
+    '''
+
+    def __init__(self, index_folder):
+        self.index_folder = index_folder
+        with open(os.path.join(index_folder, 'index.json'), 'r', encoding='utf-8') as f:
+            self.description = json.load(f)
+        self.ids, self.chunks, self.rows, self.offsets = (
+            np.load(os.path.join(index_folder, f'{name}.npy'), mmap_mode='r')
+            for name in ['ids', 'chunks', 'rows', 'offsets'])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def locate(self, ids):
+        '''
+        Find the chunks and rows of a set of primary IDs.
+
+        Parameters
+        ----------
+        ids : numpy.ndarray
+            The primary IDs to find.
+
+        Returns
+        -------
+        positions : numpy.ndarray
+            For each row found, the index into ``ids`` of its primary ID; IDs
+            not in the super-match have no rows, and IDs in several chunks
+            have one per chunk.
+        chunk_folders : numpy.ndarray
+            The name of the chunk folder of each row found.
+        rows : numpy.ndarray
+            The zero-indexed row of each row found within its chunk's table.
+        '''
+        positions, found = self._search(ids)
+        chunk_folders = np.array([chunk['chunk'] for chunk in self.description['chunks']],
+                                 dtype=object)
+        return positions, chunk_folders[self.chunks[found]], self.rows[found]
+
+    def lookup(self, ids):
+        '''
+        Read the super-match rows of a set of primary IDs, opening only the
+        tables of the chunks holding them, and reading only their rows: by
+        their offsets in CSV tables, the row groups holding them in Parquet
+        tables, and the rows themselves in HDF5 tables.
+
+        Parameters
+        ----------
+        ids : numpy.ndarray
+            The primary IDs whose rows to read.
+
+        Returns
+        -------
+        rows : pandas.DataFrame
+            The rows of each of ``ids`` found, in the order of ``ids``, as per
+            `~birnam.read_super_match`.
+        '''
+        positions, found = self._search(ids)
+        chunk_indices, rows, offsets = self.chunks[found], self.rows[found], self.offsets[found]
+        parts, part_positions = [], []
+        for chunk_index in np.unique(chunk_indices):
+            in_chunk = chunk_indices == chunk_index
+            chunk = self.description['chunks'][chunk_index]
+            path = os.path.join(self.index_folder, chunk['path'])
+            if fingerprint_files([path])[path] != chunk['fingerprint']:
+                raise RuntimeError(f'{path} has changed since the super-match index was built; '
+                                   'rebuild it with build_super_match_index.')
+            # Each row is read once, in the order it is saved.
+            chunk_rows, first, inverse = np.unique(rows[in_chunk], return_index=True,
+                                                   return_inverse=True)
+            columns = self._read_rows(path, chunk_rows, offsets[in_chunk][first])
+            parts.append(pd.DataFrame(columns).iloc[inverse])
+            part_positions.append(positions[in_chunk])
+        if not parts:
+            return pd.DataFrame({name: [] for name in self.description['columns']})
+        order = np.argsort(np.concatenate(part_positions), kind='stable')
+        return pd.concat(parts, ignore_index=True).iloc[order].reset_index(drop=True)
+
+    def _search(self, ids):
+        '''
+        Find, for each row of a set of primary IDs, the index into the IDs of
+        its ID and its position in the index.
+        '''
+        ids = np.asarray(ids)
+        try:
+            ids = ids.astype(self.ids.dtype if self.ids.dtype.kind == 'i' else np.str_)
+        except (TypeError, ValueError):
+            # IDs that are not integers cannot be in an index of integers.
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        first = np.searchsorted(self.ids, ids, side='left')
+        counts = np.searchsorted(self.ids, ids, side='right') - first
+        positions = np.repeat(np.arange(len(ids)), counts)
+        # Run over the range of each ID in the index in turn.
+        starts = np.cumsum(counts) - counts
+        return positions, np.arange(len(positions)) - np.repeat(starts - first, counts)
+
+    def _read_rows(self, path, rows, offsets):
+        '''
+        Read selected rows, in increasing order, of one chunk's table.
+        '''
+        column_names = self.description['columns']
+        output_format = self.description['output_format']
+        if issubclass(WRITERS[output_format], CSVWriter):
+            with _open_csv(path, self.description['compression']) as f:
+                if self.description['compression'] == 'zstd':
+                    # Zstandard streams can only be read forwards, line by line.
+                    lines = _read_lines_forwards(f, offsets)
+                else:
+                    lines = []
+                    for offset in offsets:
+                        f.seek(offset)
+                        lines.append(f.readline())
+            return read_super_match(io.BytesIO(b''.join(lines)), column_names, output_format)
+        if issubclass(WRITERS[output_format], ParquetWriter):
+            parquet_file = _import_optional('pyarrow.parquet', 'Parquet').ParquetFile(path)
+            group_starts = np.cumsum([0] + [parquet_file.metadata.row_group(i).num_rows
+                                            for i in range(parquet_file.num_row_groups)])
+            row_groups = np.searchsorted(group_starts, rows, side='right') - 1
+            groups, group_of_rows = np.unique(row_groups, return_inverse=True)
+            # The groups read are concatenated, so find the start of each.
+            sizes = np.diff(group_starts)[groups]
+            read_starts = np.cumsum(sizes) - sizes
+            table = parquet_file.read_row_groups(groups.tolist()).take(
+                rows - group_starts[row_groups] + read_starts[group_of_rows])
+            dataframe = table.to_pandas(integer_object_nulls=True)
+            columns = {name: dataframe[name].to_numpy(dtype=object)
+                       if dataframe[name].dtype != np.float64 else dataframe[name].to_numpy()
+                       for name in column_names}
+            return _normalise_columns(columns, column_names)
+        with _import_h5py().File(path, 'r') as f:
+            columns = {name: f[name][rows] for name in column_names}
+        return _normalise_columns(columns, column_names)
+
+
+def _index_chunk(path, column_names, output_format, header, compression):
+    '''
+    Read the primary IDs of one chunk's table, and the offsets of its rows.
+    '''
+    if not issubclass(WRITERS[output_format], CSVWriter):
+        ids = read_super_match(path, column_names, output_format)[column_names[0]]
+        return ids, np.full(len(ids), -1, dtype=np.int64)
+    with _open_csv(path, compression) as f:
+        data = f.read()
+    ids = read_super_match(io.BytesIO(data), column_names, output_format, header)[column_names[0]]
+    line_ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n'))
+    offsets = np.concatenate(([0], line_ends + 1))[int(header):len(line_ends)]
+    if len(offsets) != len(ids):
+        raise ValueError(f'{path} has line breaks within its values, so cannot be indexed.')
+    return ids, offsets.astype(np.int64)
+
+
+def _read_lines_forwards(f, offsets, block_size=1 << 20):
+    '''
+    Read the lines starting at increasing offsets of a stream that can only be
+    read forwards, in blocks, slicing each line out of the bytes read.
+    '''
+    # The bytes read and not yet passed, and the offset of the first.
+    lines, data, start = [], b'', 0
+    for offset in offsets:
+        while start + len(data) <= offset:
+            start, data = start + len(data), f.read(block_size)
+            if not data:
+                raise ValueError(f'Offset {offset} is beyond the end of the table.')
+        position = offset - start
+        end = data.find(b'\n', position)
+        while end < 0:
+            block = f.read(block_size)
+            if not block:
+                end = len(data) - 1
+                break
+            # Keep only the line so far, and search only the new bytes.
+            data, start, searched = data[position:] + block, offset, len(data) - position
+            position = 0
+            end = data.find(b'\n', searched)
+        lines.append(data[position:end + 1])
+    return lines
+
+
+def _open_csv(path, compression):
+    '''
+    Open a CSV table, decompressing it if necessary, for reading as bytes.
+    '''
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        zstandard = _import_optional('zstandard', 'zstd-compressed CSV')
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))  # pylint: disable=consider-using-with
+    return open(path, 'rb')  # pylint: disable=consider-using-with
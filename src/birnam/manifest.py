@@ -0,0 +1,158 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the run manifest used to resume super-matches, re-creating
+only those chunks whose inputs, parameters or outputs have changed.
+'''
+
+import hashlib
+import json
+import os
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+__all__ = ['RunManifest', 'fingerprint_files']
+
+MANIFEST_FILENAME = 'super_match_manifest.jsonl'
+
+
+class RunManifest():
+    '''
+    A record, for each completed chunk of a super-match, of the inputs and
+    parameters from which its output was created.
+
+    Entries are appended to a JSON-lines file as each chunk completes, so the
+    manifest of an interrupted run records every chunk finished before the
+    interruption. Later entries for a chunk supersede earlier ones.
+
+    Parameters
+    ----------
+    path : string
+        Location on disk of the manifest file.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.chunks = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    # Ignore any partially-written final line of a killed run.
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.chunks[entry['chunk']] = entry
+
+    def record(self, chunk_folder, inputs, parameters, output):
+        '''
+        Add, or replace, the entry of a successfully completed chunk.
+
+        Parameters
+        ----------
+        chunk_folder : string
+            The name of the chunk's folder.
+        inputs : dict
+            The fingerprint of the chunk's input files, as per
+            `fingerprint_files`, at the time the chunk was run.
+        parameters : dict
+            The parameters used to create the chunk's super-match.
+        output : string
+            Location on disk of the chunk's saved super-match table.
+        '''
+        entry = {'chunk': chunk_folder, 'inputs': inputs, 'parameters': _jsonable(parameters),
+                 'output': output, 'output_fingerprint': fingerprint_files([output])}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.chunks[chunk_folder] = entry
+
+    def is_current(self, chunk_folder, inputs, parameters, output):
+        '''
+        Determine whether a chunk's saved output is still valid.
+
+        Parameters
+        ----------
+        chunk_folder : string
+            The name of the chunk's folder.
+        inputs : dict
+            The current fingerprint of the chunk's input files.
+        parameters : dict
+            The parameters the chunk would be created with.
+        output : string
+            Location on disk the chunk's super-match would be saved to.
+
+        Returns
+        -------
+        current : boolean
+            ``True`` if the chunk was previously completed from identical inputs
+            and parameters, and its output is unchanged since.
+        '''
+        entry = self.chunks.get(chunk_folder)
+        return (entry is not None and entry['inputs'] == inputs and
+                entry['parameters'] == _jsonable(parameters) and entry['output'] == output and
+                entry['output_fingerprint'] == fingerprint_files([output]))
+
+
+def fingerprint_files(locations, hash_contents=False, n_threads=1):
+    '''
+    Summarise the current state of a set of files, to detect later changes.
+
+    Parameters
+    ----------
+    locations : list of strings
+        Full locations on disk of the files.
+    hash_contents : boolean, optional
+        If ``True``, fingerprint each file by the SHA-256 hash of its contents;
+        otherwise by its size and modification time.
+    n_threads : integer, optional
+        Number of threads with which to hash files.
+
+    Returns
+    -------
+    fingerprint : dict
+        Mapping of location to a description of the file, or ``None`` for
+        files that do not exist.
+    '''
+    if hash_contents and n_threads > 1:
+        with ThreadPool(n_threads) as pool:
+            descriptions = pool.map(_hash_file, locations)
+    else:
+        descriptions = [_hash_file(loc) if hash_contents else _stat_file(loc) for loc in locations]
+    return dict(zip(locations, descriptions))
+
+
+def _stat_file(loc):
+    '''
+    Describe a file by its size and modification time.
+    '''
+    if not os.path.exists(loc):
+        return None
+    stat = os.stat(loc)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _hash_file(loc):
+    '''
+    Describe a file by its size and the SHA-256 hash of its contents.
+    '''
+    if not os.path.exists(loc):
+        return None
+    sha256 = hashlib.sha256()
+    with open(loc, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+    return {'size': os.path.getsize(loc), 'sha256': sha256.hexdigest()}
+
+
+def _jsonable(value):
+    '''
+    Convert parameters, which may include NumPy arrays and scalars, to the
+    plain Python types they are saved to JSON as.
+    '''
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
@@ -0,0 +1,111 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the pipelined creation of a sequence of chunk-level
+super-matches, overlapping the reading, combination and saving of chunks.
+'''
+
+import os
+import threading
+import time
+import traceback
+from multiprocessing.pool import ThreadPool
+
+__all__ = ['ChunkPipeline']
+
+
+class ChunkPipeline():  # pylint: disable=too-few-public-methods
+    '''
+    Create the super-matches of a sequence of chunks within one process, with
+    file access overlapped with computation.
+
+    The primary catalogue and every cross-match table of a chunk are loaded
+    concurrently, and folded into the super-match in turn as they arrive.
+    While a chunk is combined the next chunk's inputs are loaded, and each
+    super-match table is saved by a background thread while the next chunk
+    is combined. At most three chunks -- one loading, one being combined and
+    one being saved -- are held in memory at once.
+
+    Parameters
+    ----------
+    super_match : SuperMatch
+        The configured super-match, providing the loading, combination and
+        saving of each chunk.
+    n_io_threads : integer
+        The maximum number of files read or written at once.
+    '''
+
+    def __init__(self, super_match, n_io_threads):
+        self.super_match = super_match
+        self.n_io_threads = n_io_threads
+        self.io_semaphore = threading.BoundedSemaphore(n_io_threads)
+
+    def run(self, chunk_folders, report):
+        '''
+        Create the super-match of each of a sequence of chunks.
+
+        Parameters
+        ----------
+        chunk_folders : iterable of strings
+            The names of the chunks' folders, in the order in which to run
+            them. Each is only requested once the previous chunk has started.
+        report : callable
+            Called, possibly from a background thread, with the chunk folder,
+            the time taken in seconds, and the traceback of any failure -- or
+            ``None`` -- once each chunk is saved or has failed.
+        '''
+        chunk_folders = iter(chunk_folders)
+        with ThreadPool(self.n_io_threads) as loader, ThreadPool(1) as writer:
+            chunk_folder = next(chunk_folders, None)
+            loads = self._load(loader, chunk_folder)
+            save = None
+            while chunk_folder is not None:
+                start = time.perf_counter()
+                # Prefetch the next chunk's inputs while this chunk is combined;
+                # its loads queue behind those of the current chunk.
+                next_chunk_folder = next(chunk_folders, None)
+                next_loads = self._load(loader, next_chunk_folder)
+                try:
+                    super_match = self.super_match.combine_cross_matches(
+                        loads[0].get(), (load.get() for load in loads[1:]))
+                except Exception:  # pylint: disable=broad-exception-caught
+                    report(chunk_folder, time.perf_counter() - start, traceback.format_exc())
+                else:
+                    # Wait for the previous chunk to be saved, so that only one
+                    # table is ever waiting to be written.
+                    if save is not None:
+                        save.wait()
+                    save = writer.apply_async(self._save, (chunk_folder, super_match, start, report))
+                chunk_folder, loads = next_chunk_folder, next_loads
+            if save is not None:
+                save.wait()
+
+    def _load(self, loader, chunk_folder):
+        '''
+        Start loading each input of a chunk.
+        '''
+        if chunk_folder is None:
+            return []
+        return [loader.apply_async(self._limit_io, (load,))
+                for load in self.super_match.chunk_loaders(chunk_folder)]
+
+    def _limit_io(self, function, *args):
+        '''
+        Call a function that reads or writes a file once fewer than
+        ``n_io_threads`` other such calls are in progress.
+        '''
+        with self.io_semaphore:
+            return function(*args)
+
+    def _save(self, chunk_folder, super_match, start, report):
+        '''
+        Save the super-match of a chunk and report its completion.
+        '''
+        try:
+            super_match_save_filename = self.super_match.chunk_locations(chunk_folder)[2]
+            os.makedirs(os.path.dirname(super_match_save_filename), exist_ok=True)
+            self._limit_io(self.super_match.save_super_match, super_match,
+                           super_match_save_filename)
+        except Exception:  # pylint: disable=broad-exception-caught
+            report(chunk_folder, time.perf_counter() - start, traceback.format_exc())
+        else:
+            report(chunk_folder, time.perf_counter() - start, None)
@@ -0,0 +1,246 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the input backends used to load columns of catalogues and
+cross-match outputs from disk.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['read_catalogue_columns', 'iter_catalogue_columns', 'determine_input_format']
+
+
+def read_catalogue_columns(loc, ids, dtypes=None, input_format=None, cache=None):
+    '''
+    Load several columns from a catalogue on disk, reading the file only once.
+
+    Binary formats are read without parsing the whole file: ``.npy`` files and
+    FITS binary tables are memory-mapped, and only the requested columns of
+    Parquet files are read, without copying numerical data where possible.
+
+    Parameters
+    ----------
+    loc : string
+        Full location on disk of file to load columns of.
+    ids : list of ints
+        The zero-indexed columns of the file at ``loc`` to load. For ``.npy``
+        files these index the second axis of a two-dimensional array, or the
+        fields of a structured array.
+    dtypes : dict, optional
+        Mapping of column index to the data type that column should be loaded
+        as, e.g. ``numpy.float64`` for probabilities, or ``object`` for ID
+        columns to be returned as strings even if every entry is an integer.
+        Columns not given are treated as ID columns, returned as integers if
+        the column is integer and as strings otherwise.
+    input_format : string, optional
+        One of ``'csv'``, ``'npy'``, ``'fits'`` or ``'parquet'``. If not given,
+        the format is determined from the extension of ``loc``.
+    cache : ColumnCache, optional
+        If given, columns of CSV files are loaded from the cache where
+        present, and only the remaining columns are parsed, and then cached.
+
+    Returns
+    -------
+    columns : list of numpy.ndarray
+        One-dimensional arrays of the values in each of the ``ids`` columns
+        in each row of the file, in the order of ``ids``.
+    '''
+    dtypes = {} if dtypes is None else dtypes
+    input_format = _check_input_format(loc, input_format)
+    # Binary formats are read without parsing, so are not cached.
+    if cache is None or input_format != 'csv':
+        loaded = READERS[input_format](loc, list(dict.fromkeys(ids)), dtypes)
+        return _finalise_columns(loaded, ids, dtypes)
+    columns = {id_: cache.get(loc, id_, dtypes.get(id_)) for id_ in dict.fromkeys(ids)}
+    missing = [id_ for id_, column in columns.items() if column is None]
+    if missing:
+        parsed = _finalise_columns(READERS[input_format](loc, missing, dtypes), missing, dtypes)
+        for id_, column in zip(missing, parsed):
+            cache.put(loc, id_, dtypes.get(id_), column)
+            columns[id_] = column
+    return [columns[id_] for id_ in ids]
+
+
+def iter_catalogue_columns(loc, ids, block_size, dtypes=None, input_format=None):
+    '''
+    Load several columns from a catalogue on disk in blocks of rows, holding
+    at most one block in memory at a time.
+
+    Parameters
+    ----------
+    loc : string
+        Full location on disk of file to load columns of.
+    ids : list of ints
+        The zero-indexed columns of the file at ``loc`` to load.
+    block_size : integer
+        The maximum number of rows to load at once.
+    dtypes : dict, optional
+        Mapping of column index to the data type that column should be loaded
+        as, as per `~birnam.read_catalogue_columns`.
+    input_format : string, optional
+        One of ``'csv'``, ``'npy'``, ``'fits'`` or ``'parquet'``. If not given,
+        the format is determined from the extension of ``loc``.
+
+    Yields
+    ------
+    columns : list of numpy.ndarray
+        One-dimensional arrays of the values in each of the ``ids`` columns
+        for each row of the block, in the order of ``ids``.
+    '''
+    dtypes = {} if dtypes is None else dtypes
+    input_format = _check_input_format(loc, input_format)
+    unique_ids = list(dict.fromkeys(ids))
+    if input_format == 'csv':
+        try:
+            with pd.read_csv(loc, header=None, usecols=unique_ids, chunksize=block_size,
+                             dtype={id_: dtypes[id_] for id_ in unique_ids if id_ in dtypes}) as reader:
+                for csv in reader:
+                    yield _finalise_columns({id_: csv[id_].to_numpy() for id_ in unique_ids}, ids, dtypes)
+        except pd.errors.EmptyDataError:
+            return
+    elif input_format == 'parquet':
+        pq = _import_pyarrow_parquet()
+        parquet_file = pq.ParquetFile(loc, memory_map=True)
+        names = parquet_file.schema_arrow.names
+        for batch in parquet_file.iter_batches(batch_size=block_size,
+                                               columns=[names[id_] for id_ in unique_ids]):
+            yield _finalise_columns({id_: batch.column(names[id_]).to_numpy(zero_copy_only=False)
+                                     for id_ in unique_ids}, ids, dtypes)
+    else:
+        # Memory-mapped formats only read the rows of each block from disk.
+        loaded = READERS[input_format](loc, unique_ids, dtypes)
+        n_rows = len(loaded[unique_ids[0]])
+        for start in range(0, n_rows, block_size):
+            yield _finalise_columns({id_: loaded[id_][start:start + block_size] for id_ in unique_ids},
+                                    ids, dtypes)
+
+
+def determine_input_format(loc):
+    '''
+    Determine the format of a catalogue on disk from its filename extension.
+
+    Parameters
+    ----------
+    loc : string
+        Full location on disk of the file.
+
+    Returns
+    -------
+    input_format : string
+        One of ``'npy'``, ``'fits'`` or ``'parquet'`` for recognised binary
+        extensions, and ``'csv'`` otherwise.
+    '''
+    name = os.path.basename(loc).lower()
+    for extension, input_format in EXTENSIONS.items():
+        if name.endswith(extension):
+            return input_format
+    return 'csv'
+
+
+def _read_csv(loc, ids, dtypes):
+    '''
+    Load columns from a header-less comma-separated values file.
+    '''
+    # TODO: add header toggle.  # pylint: disable=fixme
+    try:
+        csv = pd.read_csv(loc, header=None, usecols=ids,
+                          dtype={id_: dtypes[id_] for id_ in ids if id_ in dtypes})
+    except pd.errors.EmptyDataError:
+        # A cross-match with e.g. no non-matches in this chunk.
+        return {id_: np.empty(0, dtype=dtypes.get(id_, np.int64)) for id_ in ids}
+    return {id_: csv[id_].to_numpy() for id_ in ids}
+
+
+def _read_npy(loc, ids, dtypes):  # pylint: disable=unused-argument
+    '''
+    Memory-map columns of a two-dimensional or structured ``.npy`` array.
+    '''
+    array = np.load(loc, mmap_mode='r')
+    if array.dtype.names is not None:
+        return {id_: array[array.dtype.names[id_]] for id_ in ids}
+    if array.ndim != 2:
+        raise ValueError(f'{loc} must contain a two-dimensional or structured array.')
+    return {id_: array[:, id_] for id_ in ids}
+
+
+def _read_fits(loc, ids, dtypes):  # pylint: disable=unused-argument
+    '''
+    Memory-map columns of the first binary table extension of a FITS file.
+    '''
+    try:
+        from astropy.io import fits  # pylint: disable=import-outside-toplevel
+    except ImportError as e:
+        raise ImportError('astropy is required to load FITS catalogues.') from e
+    data = fits.getdata(loc, ext=1, memmap=True)
+    return {id_: np.asarray(data.field(id_)) for id_ in ids}
+
+
+def _read_parquet(loc, ids, dtypes):  # pylint: disable=unused-argument
+    '''
+    Load only the requested columns of a Parquet file.
+    '''
+    pq = _import_pyarrow_parquet()
+    names = pq.read_schema(loc).names
+    table = pq.read_table(loc, columns=[names[id_] for id_ in ids], memory_map=True)
+    return {id_: table.column(names[id_]).to_numpy() for id_ in ids}
+
+
+def _import_pyarrow_parquet():
+    '''
+    Import the optional dependency needed to load Parquet files.
+    '''
+    try:
+        import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+    except ImportError as e:
+        raise ImportError('pyarrow is required to load Parquet catalogues.') from e
+    return pq
+
+
+READERS = {'csv': _read_csv, 'npy': _read_npy, 'fits': _read_fits, 'parquet': _read_parquet}
+EXTENSIONS = {'.npy': 'npy', '.fits': 'fits', '.fit': 'fits', '.fits.gz': 'fits',
+              '.parquet': 'parquet', '.pq': 'parquet'}
+
+
+def _check_input_format(loc, input_format):
+    '''
+    Determine the format of a file, if not given, and check it is supported.
+    '''
+    if input_format is None:
+        input_format = determine_input_format(loc)
+    if input_format not in READERS:
+        raise ValueError(f'input_format must be one of {", ".join(READERS)}, not {input_format}.')
+    return input_format
+
+
+def _finalise_columns(loaded, ids, dtypes):
+    '''
+    Convert loaded columns to their requested types, in the order of ``ids``.
+    '''
+    return [_as_id_array(loaded[id_]) if id_ not in dtypes else
+            _as_string_id_array(loaded[id_]) if dtypes[id_] is object else
+            loaded[id_].astype(dtypes[id_], copy=False) for id_ in ids]
+
+
+def _as_id_array(column):
+    '''
+    Convert a loaded column of IDs to an array of integers, if the column is
+    integer, or Python strings otherwise.
+    '''
+    if np.issubdtype(column.dtype, np.integer):
+        return column.astype(np.int64, copy=False)
+    if column.dtype == object:
+        return column
+    if column.dtype.kind == 'S':
+        column = np.char.decode(column, 'utf-8')
+    return column.astype(str).astype(object)
+
+
+def _as_string_id_array(column):
+    '''
+    Convert a loaded column of IDs to an array of Python strings, whatever the
+    type of the column.
+    '''
+    column = _as_id_array(column)
+    return column if column.dtype == object else column.astype(str).astype(object)
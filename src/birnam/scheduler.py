@@ -0,0 +1,342 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the scheduling of chunk-level super-matches across a pool
+of worker processes.
+'''
+
+import functools
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+
+from .pipeline import ChunkPipeline
+
+__all__ = ['ChunkResult', 'estimate_chunk_cost', 'estimate_chunk_memory', 'schedule_chunks',
+           'run_chunks']
+
+# The peak memory of parsing an input table, relative to its size on disk,
+# allowing for the temporary objects made by the parser.
+PARSE_MEMORY_FACTOR = 4
+# The memory held per catalogue by a chunk's super-match table, relative to
+# the size of its primary catalogue on disk: a secondary ID and probability
+# per primary object, plus the primary IDs and combined columns.
+TABLE_MEMORY_FACTOR = 1
+
+# The SuperMatch whose chunks a worker process runs, shared once per worker
+# by the pool initializer rather than being sent with every chunk.
+_WORKER_SUPER_MATCH = None
+# The queues from which pipelined workers take chunks, and to which they
+# report each chunk's outcome.
+_WORKER_QUEUES = None
+# The queue to which budgeted workers report the process running each chunk,
+# so that chunks whose worker is killed are found.
+_WORKER_STARTED = None
+
+
+class ChunkResult():
+    '''
+    The outcome of the super-match of a single chunk.
+
+    Parameters
+    ----------
+    chunk_folder : string
+        The name of the chunk's folder.
+    cost : integer
+        The estimated cost of the chunk, as per `estimate_chunk_cost`.
+    duration : float
+        Time, in seconds, taken to run the chunk.
+    error : string, optional
+        The traceback of the exception raised by the chunk, if it failed.
+    skipped : boolean, optional
+        Whether the chunk was not run, its existing output being up to date.
+    profile : ChunkProfile, optional
+        The timings, memory use and file reads of the chunk's stages, if the
+        run was instrumented.
+    '''
+
+    # pylint: disable-next=too-many-arguments
+    def __init__(self, chunk_folder, cost, duration, error=None, skipped=False, profile=None):
+        self.chunk_folder = chunk_folder
+        self.cost = cost
+        self.duration = duration
+        self.error = error
+        self.skipped = skipped
+        self.profile = profile
+
+    @property
+    def success(self):
+        '''
+        Whether the chunk's super-match was created without error.
+        '''
+        return self.error is None
+
+    def __repr__(self):
+        status = 'skipped' if self.skipped else 'succeeded' if self.success else 'failed'
+        return f'ChunkResult({self.chunk_folder!r}, {status} in {self.duration:.2f}s)'
+
+
+def estimate_chunk_cost(locations):
+    '''
+    Estimate the relative cost of creating a chunk's super-match from the total
+    size of its input files.
+
+    Parameters
+    ----------
+    locations : list of strings
+        Full locations on disk of each of the chunk's input files.
+
+    Returns
+    -------
+    cost : integer
+        The total size, in bytes, of those ``locations`` that exist.
+    '''
+    return sum(os.path.getsize(loc) for loc in locations if os.path.exists(loc))
+
+
+def estimate_chunk_memory(locations, n_catalogues):
+    '''
+    Estimate the peak memory of creating a chunk's super-match in memory from
+    the sizes of its input files and its number of catalogues.
+
+    Cross-matches are loaded one at a time, so the estimate is that of
+    parsing the largest of the primary catalogue and each cross-match's
+    match and non-match tables, plus that of the super-match table, which
+    grows with the number of primary objects and of catalogues.
+
+    Parameters
+    ----------
+    locations : list of strings
+        Full locations on disk of each of the chunk's input files: the primary
+        catalogue, followed by each cross-match's match and non-match files,
+        as per `~birnam.SuperMatch.chunk_input_files`.
+    n_catalogues : integer
+        The number of catalogues cross-matched to the primary catalogue.
+
+    Returns
+    -------
+    memory : integer
+        The estimated peak memory, in bytes.
+    '''
+    sizes = [os.path.getsize(loc) if os.path.exists(loc) else 0 for loc in locations]
+    largest_input = max([sizes[0]] + [sum(sizes[i:i + 2]) for i in range(1, len(sizes), 2)])
+    return (PARSE_MEMORY_FACTOR * largest_input +
+            TABLE_MEMORY_FACTOR * sizes[0] * (n_catalogues + 1))
+
+
+def schedule_chunks(costs):
+    '''
+    Order chunks for processing, most expensive first, so that the largest
+    chunks do not start last and leave the remaining workers idle.
+
+    Parameters
+    ----------
+    costs : dict
+        Mapping of chunk folder name to estimated cost.
+
+    Returns
+    -------
+    chunk_folders : list of strings
+        The chunk folders in descending order of cost, ties broken by name.
+    '''
+    return sorted(costs, key=lambda chunk_folder: (-costs[chunk_folder], chunk_folder))
+
+
+# pylint: disable-next=too-many-arguments
+def run_chunks(super_match, costs, n_pool, callback=None, n_io_threads=None, memory_budget=None):
+    '''
+    Create the super-match of each chunk in parallel, dispatching chunks one
+    at a time, most expensive first, to whichever worker is free.
+
+    If ``n_io_threads`` is given each worker instead runs its chunks through
+    a `~birnam.ChunkPipeline`, taking the next chunk from a shared queue as
+    soon as it starts the current one, so that its inputs can be prefetched.
+
+    If ``memory_budget`` is given, a chunk is only started while the total
+    estimated peak memory of the chunks running, as per
+    `estimate_chunk_memory`, stays within the budget, so that workers are
+    left idle rather than exceed it. The most expensive chunk that fits is
+    started first; chunks larger than the budget by themselves are run
+    first, each alone. A chunk whose worker process exits while running it,
+    e.g. when killed for running out of memory, is reported as failed.
+
+    Parameters
+    ----------
+    super_match : SuperMatch
+        The configured super-match, whose ``single_chunk_super_match`` is run
+        for each chunk.
+    costs : dict
+        Mapping of chunk folder name to estimated cost.
+    n_pool : integer
+        Number of worker processes.
+    callback : callable, optional
+        Called with the `ChunkResult` of each chunk as it completes.
+    n_io_threads : integer, optional
+        The maximum number of files each pipelined worker reads or writes at
+        once; if not given, chunks are not pipelined.
+    memory_budget : integer, optional
+        The total memory, in bytes, the chunks running at once may be
+        estimated to use. Not available with ``n_io_threads``.
+
+    Returns
+    -------
+    results : dict
+        Mapping of chunk folder name to `ChunkResult`, for every chunk.
+    '''
+    if n_io_threads is not None:
+        if memory_budget is not None:
+            raise ValueError('memory_budget is not supported with n_io_threads.')
+        return _run_pipelined_chunks(super_match, costs, n_pool, callback, n_io_threads)
+    if memory_budget is not None:
+        return _run_budgeted_chunks(super_match, costs, n_pool, callback, memory_budget)
+    results = {}
+    with multiprocessing.Pool(n_pool, initializer=_initialise_worker,
+                              initargs=(super_match,)) as pool:
+        for chunk_folder, duration, error, profile in pool.imap_unordered(
+                _run_chunk, schedule_chunks(costs), chunksize=1):
+            results[chunk_folder] = ChunkResult(chunk_folder, costs[chunk_folder], duration, error,
+                                                profile=profile)
+            if callback is not None:
+                callback(results[chunk_folder])
+    return results
+
+
+def _run_budgeted_chunks(super_match, costs, n_pool, callback, memory_budget):
+    '''
+    Create the super-match of each chunk in parallel, starting chunks only
+    while their total estimated memory stays within the budget.
+    '''
+    memory = {chunk_folder: estimate_chunk_memory(super_match.chunk_input_files(chunk_folder),
+                                                  len(super_match.list_of_catalogue_names))
+              for chunk_folder in costs}
+    # Chunks too large for the budget are run first, rather than waiting for
+    # a moment when nothing else is running, so the largest still start first.
+    pending = sorted(schedule_chunks(costs),
+                     key=lambda chunk_folder: memory[chunk_folder] <= memory_budget)
+    running, starts, workers = {}, {}, {}
+    finished, started = queue.Queue(), multiprocessing.SimpleQueue()
+    results = {}
+    with multiprocessing.Pool(n_pool, initializer=_initialise_worker,
+                              initargs=(super_match, None, started)) as pool:
+        while pending or running:
+            for chunk_folder in list(pending):
+                if len(running) == n_pool:
+                    break
+                if running and sum(running.values()) + memory[chunk_folder] > memory_budget:
+                    # A chunk too large for the budget waits until it can run
+                    # alone, and chunks after it wait for it.
+                    if memory[chunk_folder] > memory_budget:
+                        break
+                    continue
+                pending.remove(chunk_folder)
+                running[chunk_folder], starts[chunk_folder] = memory[chunk_folder], time.perf_counter()
+                pool.apply_async(_run_chunk, (chunk_folder,), callback=finished.put,
+                                 error_callback=functools.partial(_report_failure, finished,
+                                                                  chunk_folder))
+            try:
+                chunk_folder, duration, error, profile = finished.get(timeout=1)
+            except queue.Empty:
+                lost = _find_lost_chunks(running, workers, started)
+                if not lost:
+                    continue
+                chunk_folder, duration, profile = lost[0], time.perf_counter() - starts[lost[0]], None
+                error = ('The worker process running the chunk exited unexpectedly, e.g. killed '
+                         'for running out of memory.')
+            if chunk_folder not in running:
+                # The outcome of a chunk already reported as lost.
+                continue
+            del running[chunk_folder]
+            results[chunk_folder] = ChunkResult(chunk_folder, costs[chunk_folder], duration, error,
+                                                profile=profile)
+            if callback is not None:
+                callback(results[chunk_folder])
+    return results
+
+
+def _find_lost_chunks(running, workers, started):
+    '''
+    Find the running chunks whose worker process has exited, recording the
+    worker of each chunk as it starts.
+    '''
+    while not started.empty():
+        chunk_folder, pid = started.get()
+        workers[chunk_folder] = pid
+    alive = {process.pid for process in multiprocessing.active_children()}
+    return [chunk_folder for chunk_folder in running
+            if chunk_folder in workers and workers[chunk_folder] not in alive]
+
+
+def _report_failure(finished, chunk_folder, error):
+    '''
+    Record the failure of a chunk whose outcome could not be returned from
+    its worker.
+    '''
+    finished.put((chunk_folder, 0, repr(error), None))
+
+
+def _run_pipelined_chunks(super_match, costs, n_pool, callback, n_io_threads):
+    '''
+    Create the super-match of each chunk in parallel, each worker running a
+    `~birnam.ChunkPipeline` over chunks taken from a shared queue.
+    '''
+    tasks, outcomes = multiprocessing.Queue(), multiprocessing.Queue()
+    for chunk_folder in schedule_chunks(costs):
+        tasks.put(chunk_folder)
+    # One end-of-queue marker per worker.
+    for _ in range(n_pool):
+        tasks.put(None)
+    results = {}
+    with multiprocessing.Pool(n_pool, initializer=_initialise_worker,
+                              initargs=(super_match, (tasks, outcomes))) as pool:
+        pipelines = pool.map_async(_run_pipeline, [n_io_threads] * n_pool, chunksize=1)
+        while len(results) < len(costs):
+            finished = pipelines.ready()
+            try:
+                chunk_folder, duration, error = outcomes.get(timeout=1)
+            except queue.Empty:
+                if finished:
+                    # Re-raise any failure of a pipeline itself.
+                    pipelines.get()
+                    raise RuntimeError('Workers finished without reporting every chunk.') from None
+                continue
+            results[chunk_folder] = ChunkResult(chunk_folder, costs[chunk_folder], duration, error)
+            if callback is not None:
+                callback(results[chunk_folder])
+    return results
+
+
+def _initialise_worker(super_match, queues=None, started=None):
+    '''
+    Store the shared super-match configuration, the queues of pipelined runs,
+    and the queue of chunks started by budgeted runs, in a worker process.
+    '''
+    global _WORKER_SUPER_MATCH, _WORKER_QUEUES, _WORKER_STARTED  # pylint: disable=global-statement
+    _WORKER_SUPER_MATCH = super_match
+    _WORKER_QUEUES = queues
+    _WORKER_STARTED = started
+
+
+def _run_chunk(chunk_folder):
+    '''
+    Run a single chunk in a worker process, capturing any failure and
+    returning any profile of the chunk to the parent process.
+    '''
+    start = time.perf_counter()
+    if _WORKER_STARTED is not None:
+        _WORKER_STARTED.put((chunk_folder, os.getpid()))
+    try:
+        profile = _WORKER_SUPER_MATCH.single_chunk_super_match(chunk_folder)
+    except Exception:  # pylint: disable=broad-exception-caught
+        return chunk_folder, time.perf_counter() - start, traceback.format_exc(), None
+    return chunk_folder, time.perf_counter() - start, None, profile
+
+
+def _run_pipeline(n_io_threads):
+    '''
+    Run chunks from the shared queue through a pipeline in a worker process
+    until the queue is exhausted.
+    '''
+    tasks, outcomes = _WORKER_QUEUES
+    ChunkPipeline(_WORKER_SUPER_MATCH, n_io_threads).run(
+        iter(tasks.get, None), lambda *outcome: outcomes.put(outcome))
@@ -0,0 +1,236 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the division of a super-match's chunks between several
+independent processes, for example the tasks of a SLURM job array or an MPI
+job spread across many nodes, and the verification that every chunk was run.
+'''
+
+import json
+import os
+import subprocess
+import tempfile
+
+__all__ = ['shard_chunks', 'shard_from_environment', 'verify_shards', 'launch_local_shards']
+
+SHARD_FOLDER = 'super_match_shards'
+
+# Pairs of environment variables holding the rank and number of shards, in
+# order of precedence: birnam's own, SLURM job arrays, SLURM tasks, OpenMPI,
+# MPICH and Intel MPI, and MVAPICH.
+SHARD_ENVIRONMENT_VARIABLES = [('BIRNAM_SHARD_RANK', 'BIRNAM_SHARD_SIZE'),
+                               ('SLURM_ARRAY_TASK_ID', 'SLURM_ARRAY_TASK_COUNT'),
+                               ('SLURM_PROCID', 'SLURM_NTASKS'),
+                               ('OMPI_COMM_WORLD_RANK', 'OMPI_COMM_WORLD_SIZE'),
+                               ('PMI_RANK', 'PMI_SIZE'),
+                               ('MV2_COMM_WORLD_RANK', 'MV2_COMM_WORLD_SIZE')]
+
+
+def shard_chunks(chunk_folders, rank, n_shards):
+    '''
+    Select the chunks to be run by one of a number of shards.
+
+    Chunks are assigned to shards in turn, in alphabetical order, so every
+    shard makes the same assignment from the same chunks, regardless of the
+    order in which they were listed.
+
+    Parameters
+    ----------
+    chunk_folders : list of strings
+        The names of the folders of every chunk.
+    rank : integer
+        The zero-indexed number of the shard.
+    n_shards : integer
+        The total number of shards.
+
+    Returns
+    -------
+    shard_chunk_folders : list of strings
+        The names of the folders of the chunks of shard ``rank``.
+    '''
+    _check_shard(rank, n_shards)
+    return sorted(chunk_folders)[rank::n_shards]
+
+
+def shard_from_environment(environ=None):
+    '''
+    Determine the rank and number of shards of this process from environment
+    variables set by a job scheduler or MPI launcher.
+
+    ``BIRNAM_SHARD_RANK`` and ``BIRNAM_SHARD_SIZE`` are used if set; otherwise
+    the variables of a SLURM job array (``SLURM_ARRAY_TASK_ID``, offset by
+    ``SLURM_ARRAY_TASK_MIN``, and ``SLURM_ARRAY_TASK_COUNT``), of SLURM tasks,
+    or of the OpenMPI, MPICH, Intel MPI or MVAPICH launchers.
+
+    Parameters
+    ----------
+    environ : dict, optional
+        The environment variables, by default those of this process.
+
+    Returns
+    -------
+    rank : integer
+        The zero-indexed number of the shard of this process.
+    n_shards : integer
+        The total number of shards.
+    '''
+    environ = os.environ if environ is None else environ
+    for rank_variable, size_variable in SHARD_ENVIRONMENT_VARIABLES:
+        if rank_variable in environ and size_variable in environ:
+            rank, n_shards = int(environ[rank_variable]), int(environ[size_variable])
+            # Job array task IDs need not start at zero.
+            if rank_variable == 'SLURM_ARRAY_TASK_ID':
+                rank -= int(environ.get('SLURM_ARRAY_TASK_MIN', 0))
+            _check_shard(rank, n_shards)
+            return rank, n_shards
+    raise ValueError('No shard rank and size found in the environment; set BIRNAM_SHARD_RANK and '
+                     'BIRNAM_SHARD_SIZE, or run as a SLURM job array or under MPI.')
+
+
+def write_shard_marker(super_match_save_folder, rank, n_shards, chunk_results):
+    '''
+    Record the completion of one shard, and the outcome of each of its chunks.
+
+    Parameters
+    ----------
+    super_match_save_folder : string
+        Location on disk of the super-match's output folder.
+    rank : integer
+        The zero-indexed number of the shard.
+    n_shards : integer
+        The total number of shards.
+    chunk_results : dict
+        Mapping of chunk folder name to the `~birnam.ChunkResult` of each of
+        the shard's chunks.
+    '''
+    marker_folder = os.path.join(super_match_save_folder, SHARD_FOLDER)
+    os.makedirs(marker_folder, exist_ok=True)
+    marker = {'rank': rank, 'n_shards': n_shards,
+              'chunks': {chunk_folder: 'skipped' if result.skipped else
+                         'succeeded' if result.success else 'failed'
+                         for chunk_folder, result in chunk_results.items()}}
+    # Write under a temporary name, so a marker is only ever seen complete.
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=marker_folder, suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as f:
+            json.dump(marker, f)
+        os.replace(temporary_path, os.path.join(marker_folder, _marker_filename(rank, n_shards)))
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def remove_shard_marker(super_match_save_folder, rank, n_shards):
+    '''
+    Remove any completion marker of one shard, left by a previous run, so
+    that the shard is only seen as completed once the current run completes.
+
+    Parameters
+    ----------
+    super_match_save_folder : string
+        Location on disk of the super-match's output folder.
+    rank : integer
+        The zero-indexed number of the shard.
+    n_shards : integer
+        The total number of shards.
+    '''
+    try:
+        os.remove(os.path.join(super_match_save_folder, SHARD_FOLDER,
+                               _marker_filename(rank, n_shards)))
+    except FileNotFoundError:
+        pass
+
+
+def verify_shards(super_match_save_folder, chunk_folders, n_shards):
+    '''
+    Check that every shard of a super-match has completed, and that together
+    they successfully ran every chunk.
+
+    Parameters
+    ----------
+    super_match_save_folder : string
+        Location on disk of the super-match's output folder.
+    chunk_folders : list of strings
+        The names of the folders of every chunk.
+    n_shards : integer
+        The total number of shards.
+
+    Returns
+    -------
+    chunk_statuses : dict
+        Mapping of chunk folder name to ``'succeeded'``, or ``'skipped'`` for
+        chunks whose existing outputs were up to date.
+    '''
+    marker_folder = os.path.join(super_match_save_folder, SHARD_FOLDER)
+    chunk_statuses, problems = {}, []
+    for rank in range(n_shards):
+        marker_path = os.path.join(marker_folder, _marker_filename(rank, n_shards))
+        if not os.path.exists(marker_path):
+            problems.append(f'shard {rank} of {n_shards} has not completed')
+            continue
+        with open(marker_path, 'r', encoding='utf-8') as f:
+            chunk_statuses.update(json.load(f)['chunks'])
+    missing = sorted(set(chunk_folders) - set(chunk_statuses))
+    failed = sorted(chunk_folder for chunk_folder, status in chunk_statuses.items()
+                    if status == 'failed')
+    if missing and not problems:
+        problems.append(f'chunks not run by any shard: {", ".join(missing)}')
+    if failed:
+        problems.append(f'chunks failed: {", ".join(failed)}')
+    if problems:
+        raise RuntimeError('Sharded super-match is incomplete: ' + '; '.join(problems) + '.')
+    return chunk_statuses
+
+
+def launch_local_shards(command, n_shards, env=None):
+    '''
+    Run a command as each of a number of shards, as concurrent processes on
+    this machine, standing in for a job scheduler or MPI launcher.
+
+    Each process is given its rank and the number of shards through
+    ``BIRNAM_SHARD_RANK`` and ``BIRNAM_SHARD_SIZE``, as read by
+    `shard_from_environment`.
+
+    Parameters
+    ----------
+    command : list of strings
+        The program, and its arguments, run by each shard.
+    n_shards : integer
+        The total number of shards.
+    env : dict, optional
+        The environment of the processes, by default that of this process.
+
+    Returns
+    -------
+    returncodes : list of integers
+        The exit status of each shard's process, in order of rank.
+    '''
+    env = dict(os.environ if env is None else env)
+    processes = [subprocess.Popen(  # pylint: disable=consider-using-with
+        command, env={**env, 'BIRNAM_SHARD_RANK': str(rank), 'BIRNAM_SHARD_SIZE': str(n_shards)})
+        for rank in range(n_shards)]
+    return [process.wait() for process in processes]
+
+
+def shard_filename(filename, rank, n_shards):
+    '''
+    Determine the name of a per-shard version of a file, so that concurrent
+    shards never write to the same file.
+    '''
+    root, extension = os.path.splitext(filename)
+    return f'{root}.shard_{rank}_of_{n_shards}{extension}'
+
+
+def _marker_filename(rank, n_shards):
+    '''
+    Determine the name of the completion marker of a shard.
+    '''
+    return f'shard_{rank}_of_{n_shards}.json'
+
+
+def _check_shard(rank, n_shards):
+    '''
+    Ensure a shard's rank and the number of shards are consistent.
+    '''
+    if n_shards < 1 or not 0 <= rank < n_shards:
+        raise ValueError(f'Shard rank must be between 0 and {n_shards - 1}, with at least one '
+                         f'shard, not rank {rank} of {n_shards}.')
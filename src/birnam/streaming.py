@@ -0,0 +1,115 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the on-disk partitioning tools used to create super-matches
+of chunks too large to hold in memory.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['SpillFile', 'hash_partition', 'scatter_to_spill']
+
+
+class SpillFile():
+    '''
+    A temporary file to which blocks of rows of a set of columns are appended,
+    to be read back in full later.
+
+    Parameters
+    ----------
+    path : string
+        Location on disk of the file.
+    empty : list of numpy.ndarray
+        Zero-length arrays, one per column, returned by ``read`` if no rows
+        have been appended.
+    '''
+
+    def __init__(self, path, empty):
+        self.path = path
+        self.empty = empty
+
+    def append(self, columns):
+        '''
+        Append a block of rows to the file.
+
+        Parameters
+        ----------
+        columns : list of numpy.ndarray
+            The columns of the block, in the same order as ``empty``.
+        '''
+        with open(self.path, 'ab') as f:
+            for column in columns:
+                np.save(f, column, allow_pickle=True)
+
+    def read(self):
+        '''
+        Load all rows appended to the file.
+
+        Returns
+        -------
+        columns : list of numpy.ndarray
+            The concatenation of each column across all appended blocks.
+        '''
+        if not os.path.exists(self.path):
+            return list(self.empty)
+        blocks = list(self.read_blocks())
+        return [np.concatenate([block[j] for block in blocks]) for j in range(len(blocks[0]))]
+
+    def read_blocks(self):
+        '''
+        Load each block of rows appended to the file in turn.
+
+        Yields
+        ------
+        columns : list of numpy.ndarray
+            The columns of one block, as passed to ``append``.
+        '''
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            while f.tell() < size:
+                yield [np.load(f, allow_pickle=True) for _ in self.empty]
+
+
+def hash_partition(ids, n_partitions):
+    '''
+    Assign each of a set of IDs to one of a number of partitions, such that a
+    given ID is always assigned to the same partition.
+
+    Parameters
+    ----------
+    ids : numpy.ndarray
+        The IDs to assign to partitions.
+    n_partitions : integer
+        The total number of partitions.
+
+    Returns
+    -------
+    partitions : numpy.ndarray
+        The zero-indexed partition of each of ``ids``.
+    '''
+    return (pd.util.hash_array(np.asarray(ids)) % np.uint64(n_partitions)).astype(np.int64)
+
+
+def scatter_to_spill(columns, partitions, spill_files):
+    '''
+    Append each row of a block to the spill file of its partition.
+
+    Parameters
+    ----------
+    columns : list of numpy.ndarray
+        The columns of the block of rows.
+    partitions : numpy.ndarray
+        The zero-indexed partition of each row.
+    spill_files : list of SpillFile
+        The spill file of each partition.
+    '''
+    order = np.argsort(partitions, kind='stable')
+    bounds = np.searchsorted(partitions[order], np.arange(len(spill_files) + 1))
+    for k, spill_file in enumerate(spill_files):
+        if bounds[k + 1] > bounds[k]:
+            rows = order[bounds[k]:bounds[k + 1]]
+            spill_file.append([column[rows] for column in columns])
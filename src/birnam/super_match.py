@@ -1,18 +1,42 @@
 # Licensed under a 3-clause BSD style license - see LICENSE
+# pylint: disable=too-many-lines
 '''
 This module provides the high-level framework for the creation of multi-catalogue
 "super-matches" for one primary dataset.
 '''
 
-import itertools
-import multiprocessing
+import contextlib
+import functools
 import os
+import shutil
+import tempfile
+import time
 
 import numpy as np
-import pandas as pd
 
+from .combine import _convert_super_match, _fold_cross_match, _update_probabilities, combine_super_match
+from .instrumentation import REPORT_FILENAME, profile_chunk, record_read, stage, write_run_report
+from .join import PrimaryIDIndex
+from .manifest import MANIFEST_FILENAME, RunManifest, fingerprint_files
+from .readers import iter_catalogue_columns, read_catalogue_columns
+from .scheduler import ChunkResult, estimate_chunk_cost, run_chunks
+from .sharding import (
+    remove_shard_marker,
+    shard_chunks,
+    shard_filename,
+    shard_from_environment,
+    verify_shards,
+    write_shard_marker,
+)
+from .streaming import SpillFile, hash_partition, scatter_to_spill
+from .table import SuperMatchTable, _promote_id_columns
+from .validation import VALIDATION_FILENAME, validate_inputs
+from .writers import get_writer
 
-class SuperMatch():
+__all__ = ['SuperMatch']
+
+
+class SuperMatch():  # pylint: disable=too-many-instance-attributes
     '''
     A class to create super-matches, the mergers of multiple associations to
     one photometric catalogue across a number of other datasets.
@@ -71,15 +95,122 @@ class SuperMatch():
         catalogues.
     n_pool : integer
         Number of threads to use for chunk-level super-match multiprocessing.
+    output_format : string or SuperMatchWriter subclass, optional
+        The format in which to save each chunk's super-match table: ``'csv'``,
+        ``'parquet'`` or ``'hdf5'``, or a custom `~birnam.SuperMatchWriter`.
+    compression : string, optional
+        Compression to apply to the saved super-match tables, passed through
+        to the writer of ``output_format``; for example ``'gzip'`` for
+        ``'csv'`` outputs.
+    input_format : string, optional
+        The format of all input catalogues and cross-match tables: ``'csv'``,
+        ``'npy'``, ``'fits'`` or ``'parquet'``. By default the format of each
+        file is determined from its extension, with unrecognised extensions
+        read as CSV.
+    block_size : integer, optional
+        If given, each chunk is processed out-of-core, holding approximately
+        ``block_size`` primary catalogue rows -- and their cross-matches -- in
+        memory at once, using `~birnam.SuperMatch.run_streaming_super_match`.
+        Otherwise each chunk is loaded into memory in full.
+    progress_callback : callable, optional
+        Called in the parent process with the `~birnam.ChunkResult` of each
+        chunk as it completes. Chunks are run largest first, as estimated
+        from the size of their input files; once all chunks have run, the
+        result of every chunk is available as ``chunk_results``, and a
+        `RuntimeError` is raised if any chunk failed.
+    resume : boolean, optional
+        Every completed chunk is recorded in a manifest inside
+        ``super_match_save_folder``, along with the state of its input files
+        and the parameters used. If ``True``, chunks whose recorded inputs,
+        parameters and output are all unchanged are skipped, so only new,
+        stale, failed or missing chunks are re-created.
+    hash_inputs : boolean, optional
+        If ``True``, input files are compared by the SHA-256 hash of their
+        contents; otherwise, by their size and modification time.
+    save_state : boolean, optional
+        If ``True``, each chunk's compact super-match table, including the
+        lowest probability of each object, the catalogue it is in and the
+        product of its other probabilities, is also saved alongside its
+        output, as ``<primary_catalogue_name>_super_match_state.npz``, so that
+        catalogues can later be added with ``append``.
+    append : boolean, optional
+        If ``True``, ``list_of_catalogue_names`` and the cross-match parameters
+        describe only *new* catalogues, which are added to the existing
+        super-match in ``super_match_save_folder`` -- previously created with
+        ``save_state`` -- by loading only their own cross-matches. Implies
+        ``save_state``.
+    n_io_threads : integer, optional
+        If given, each worker runs its chunks as a pipeline, using
+        `~birnam.ChunkPipeline`: all of a chunk's input files are loaded
+        concurrently, the next chunk's inputs are loaded while the current
+        chunk is combined, and super-match tables are saved in the background.
+        At most ``n_io_threads`` files are read or written at once by each
+        worker, and up to three chunks are held in memory. Not available with
+        ``block_size`` or ``append``.
+    instrument : boolean, optional
+        If ``True``, the duration and peak memory of each stage of every chunk,
+        and the number of rows and bytes of each file read, are recorded, as
+        the ``profile`` of each chunk's `~birnam.ChunkResult`, and saved as a
+        run report, ``super_match_report.json``, inside
+        ``super_match_save_folder``. See `~birnam.write_run_report`.
+    chunk_hook : callable, optional
+        Called in the worker process with the name of each chunk's folder,
+        returning either a context manager, entered for the duration of the
+        chunk's super-match, or ``None``; for example, a
+        `~birnam.CProfileHook`.
+    lazy : boolean, optional
+        If ``True``, the super-match is only planned on creation -- its inputs
+        validated and its chunks determined -- and each chunk's table is only
+        created, and saved, by `~birnam.SuperMatch.run`; alternatively
+        `~birnam.SuperMatch.chunk_super_match` and
+        `~birnam.SuperMatch.iter_chunk_super_matches` return tables in memory
+        without saving them. Otherwise the super-match is run immediately.
+    shard : tuple of integers or string, optional
+        If given, only one shard of the chunks is run, allowing the
+        super-match to be spread across many independent processes, for
+        example on different nodes. Either the zero-indexed rank of the
+        shard and the total number of shards, or ``'environment'`` to take
+        them from the environment variables of a SLURM job array or MPI
+        launcher, as per `~birnam.shard_from_environment`. Chunks are assigned
+        to shards as per `~birnam.shard_chunks`; each shard keeps its own
+        manifest and report, and saves a completion marker once run, which
+        `~birnam.SuperMatch.verify_shards` checks.
+    bad_catalogue_threshold : float, optional
+        The probability below which a catalogue may be considered an object's
+        bad catalogue: that in which it has its lowest probability, as per
+        `~birnam.combine_probabilities`.
+    writer_options : dict, optional
+        Further keyword arguments of the writer of ``output_format``; for
+        example ``{'float_precision': 6, 'header': True}`` for ``'csv'``
+        outputs, as per `~birnam.CSVWriter`.
+    validate : boolean, optional
+        If ``True``, `~birnam.SuperMatch.run` first checks the inputs of every
+        chunk, as per `~birnam.validate_inputs`, saving the report as
+        ``super_match_validation.json`` inside ``super_match_save_folder``,
+        and raises an error, running no chunk, if any are invalid.
+    memory_budget : integer, optional
+        If given, chunks are only started while the estimated total memory, in
+        bytes, of those running stays within it, as per `~birnam.run_chunks`;
+        chunks larger than the budget are run alone. Not with ``n_io_threads``.
+    column_cache : ColumnCache, optional
+        If given, the columns parsed from CSV inputs are cached on disk, and
+        re-loaded from there while the inputs are unchanged, rather than
+        parsed again; see `~birnam.ColumnCache`.
     '''
 
+    # pylint: disable-next=too-many-arguments
     def __init__(self, top_level_folder, primary_catalogue_name, primary_catalogue_input_location,
                  primary_catalogue_input_column_id, primary_catalogue_filename,
                  super_match_save_folder, list_of_catalogue_names, list_of_secondary_match_folders,
                  list_of_match_filenames, list_of_non_match_filenames,
                  list_of_match_primary_column_ids, list_of_match_secondary_column_ids,
                  list_of_match_probability_ids, list_of_non_match_primary_column_ids,
-                 list_of_non_match_probability_ids, n_pool):
+                 list_of_non_match_probability_ids, n_pool, output_format='csv', compression=None,
+                 input_format=None, block_size=None, progress_callback=None, resume=False,
+                 hash_inputs=False, save_state=False, append=False, n_io_threads=None,
+                 instrument=False, chunk_hook=None, lazy=False, shard=None,
+                 bad_catalogue_threshold=0.5, writer_options=None, validate=False,
+                 memory_budget=None, column_cache=None):
         '''
         At the top level of the super-match we assume that *all* cross-matches
         have the same structure within their top-level folder, so we might have
@@ -101,60 +232,442 @@ class SuperMatch():
         from our search pattern inputs.
         '''
 
+        self.top_level_folder = top_level_folder
+        self.primary_catalogue_name = primary_catalogue_name
+        self.primary_catalogue_input_location = primary_catalogue_input_location
+        self.primary_catalogue_input_column_id = primary_catalogue_input_column_id
+        self.primary_catalogue_filename = primary_catalogue_filename
+        self.super_match_save_folder = super_match_save_folder
+        self.list_of_catalogue_names = list_of_catalogue_names
+        self.list_of_secondary_match_folders = list_of_secondary_match_folders
+        self.list_of_match_filenames = list_of_match_filenames
+        self.list_of_non_match_filenames = list_of_non_match_filenames
+        self.list_of_match_primary_column_ids = list_of_match_primary_column_ids
+        self.list_of_match_secondary_column_ids = list_of_match_secondary_column_ids
+        self.list_of_match_probability_ids = list_of_match_probability_ids
+        self.list_of_non_match_primary_column_ids = list_of_non_match_primary_column_ids
+        self.list_of_non_match_probability_ids = list_of_non_match_probability_ids
+        self.n_pool = n_pool
+
+        self.writer = get_writer(output_format)
+        self.compression = compression
+        self.writer_options = {} if writer_options is None else dict(writer_options)
+        self.input_format = input_format
+        self.block_size = block_size
+        self.save_state = save_state or append
+        self.append = append
+        if self.save_state and block_size is not None:
+            raise ValueError('save_state and append are not supported with block_size.')
+        self.n_io_threads = n_io_threads
+        if n_io_threads is not None and (block_size is not None or append):
+            raise ValueError('n_io_threads is not supported with block_size or append.')
+        self.memory_budget = memory_budget
+        self.column_cache = column_cache
+        if n_io_threads is not None and memory_budget is not None:
+            raise ValueError('memory_budget is not supported with n_io_threads.')
+        self.instrument = instrument
+        self.chunk_hook = chunk_hook
+        if n_io_threads is not None and (instrument or chunk_hook is not None):
+            raise ValueError('instrument and chunk_hook are not supported with n_io_threads.')
+
+        self.progress_callback = progress_callback
+        self.resume = resume
+        self.hash_inputs = hash_inputs
+        if not 0 <= bad_catalogue_threshold <= 1:
+            raise ValueError('bad_catalogue_threshold must be between 0 and 1, not '
+                             f'{bad_catalogue_threshold}.')
+        self.bad_catalogue_threshold = bad_catalogue_threshold
+        self.validate = validate
+
+        n_catalogues = len(list_of_catalogue_names)
+        for name, values in [('list_of_secondary_match_folders', list_of_secondary_match_folders),
+                             ('list_of_match_filenames', list_of_match_filenames),
+                             ('list_of_non_match_filenames', list_of_non_match_filenames),
+                             ('list_of_match_primary_column_ids', list_of_match_primary_column_ids),
+                             ('list_of_match_secondary_column_ids',
+                              list_of_match_secondary_column_ids),
+                             ('list_of_match_probability_ids', list_of_match_probability_ids),
+                             ('list_of_non_match_primary_column_ids',
+                              list_of_non_match_primary_column_ids),
+                             ('list_of_non_match_probability_ids',
+                              list_of_non_match_probability_ids)]:
+            if len(values) != n_catalogues:
+                raise ValueError(f'{name} has {len(values)} entries, but list_of_catalogue_names '
+                                 f'has {n_catalogues}.')
+
         # Determine the chunk folders from the primary input catalogue folder,
         # since they should all be enforced to be the same.
-        chunk_folders = os.listdir(primary_catalogue_input_location)
-
-        # TODO: folder creation, checking, etc.  # pylint: disable=fixme
-        counter = np.arange(0, len(chunk_folders))
-        expand_constants = [itertools.repeat(item) for item in [
-            primary_catalogue_input_location, chunk_folders, primary_catalogue_filename, top_level_folder,
-            list_of_secondary_match_folders, super_match_save_folder, primary_catalogue_name,
-            primary_catalogue_input_column_id, list_of_catalogue_names, list_of_match_filenames,
-            list_of_non_match_filenames, list_of_match_primary_column_ids,
-            list_of_match_secondary_column_ids, list_of_match_probability_ids,
-            list_of_non_match_primary_column_ids, list_of_non_match_probability_ids]]
-        iter_group = zip(counter, *expand_constants)
-        with multiprocessing.Pool(n_pool) as pool:
-            for _ in pool.imap_unordered(self.single_chunk_super_match, iter_group,
-                                         chunksize=max(1, len(counter) // n_pool)):
-                pass
-
-    def single_chunk_super_match(self, p):
-        '''
-        Helper function for the parallel loop, extracting a individual chunks
-        and passing through to the single-chunk function.
+        self.all_chunk_folders = sorted(os.listdir(primary_catalogue_input_location))
+        self.shard = shard_from_environment() if shard == 'environment' else shard
+        self.chunk_folders = (self.all_chunk_folders if self.shard is None else
+                              shard_chunks(self.all_chunk_folders, *self.shard))
+
+        self.chunk_results = {}
+        if not lazy:
+            self.run()
+
+    def __getstate__(self):
+        # The progress callback is only called in the parent process, so is not
+        # sent to worker processes, to which it may not be picklable.
+        state = self.__dict__.copy()
+        state['progress_callback'] = None
+        return state
+
+    def run(self):
+        '''
+        Create, and save, the super-match of every chunk, in parallel.
+
+        Returns
+        -------
+        chunk_results : dict
+            Mapping of chunk folder name to the `~birnam.ChunkResult` of each
+            chunk, also available as ``chunk_results``.
+        '''
+        chunk_folders = self.chunk_folders
+        os.makedirs(self.super_match_save_folder, exist_ok=True)
+        # A previous run's marker must not outlive a failure of this one.
+        if self.shard is not None:
+            remove_shard_marker(self.super_match_save_folder, *self.shard)
+        if self.validate:
+            report = validate_inputs(self, chunk_folders)
+            report.save(os.path.join(self.super_match_save_folder,
+                                     self._shard_filename(VALIDATION_FILENAME)))
+            report.raise_if_invalid()
+        manifest = RunManifest(os.path.join(self.super_match_save_folder,
+                                            self._shard_filename(MANIFEST_FILENAME)))
+        parameters = self.run_parameters()
+        fingerprints = {chunk_folder: fingerprint_files(
+            self.chunk_input_files(chunk_folder), hash_contents=self.hash_inputs,
+            n_threads=self.n_pool) for chunk_folder in chunk_folders}
+        chunk_costs = {chunk_folder: estimate_chunk_cost(self.chunk_input_files(chunk_folder))
+                       for chunk_folder in chunk_folders}
+        # When resuming, chunks whose output is still valid are not re-run.
+        skipped = [chunk_folder for chunk_folder in chunk_folders if self.resume and
+                   manifest.is_current(chunk_folder, fingerprints[chunk_folder], parameters,
+                                       self.chunk_locations(chunk_folder)[2])]
+        progress_callback = self.progress_callback
+
+        def record_chunk(result):
+            if result.success:
+                manifest.record(result.chunk_folder, fingerprints[result.chunk_folder], parameters,
+                                self.chunk_locations(result.chunk_folder)[2])
+            if progress_callback is not None:
+                progress_callback(result)
+
+        self.chunk_results = {}
+        for chunk_folder in skipped:
+            self.chunk_results[chunk_folder] = ChunkResult(chunk_folder, chunk_costs[chunk_folder], 0,
+                                                           skipped=True)
+            if progress_callback is not None:
+                progress_callback(self.chunk_results[chunk_folder])
+        # The configuration is shared with each worker once, and chunks are
+        # then handed out individually, largest first, to balance the load.
+        self.chunk_results.update(run_chunks(
+            self, {chunk_folder: chunk_costs[chunk_folder] for chunk_folder in chunk_folders
+                   if chunk_folder not in skipped}, self.n_pool, callback=record_chunk,
+            n_io_threads=self.n_io_threads, memory_budget=self.memory_budget))
+        if self.instrument:
+            write_run_report(self.chunk_results, os.path.join(
+                self.super_match_save_folder, self._shard_filename(REPORT_FILENAME)))
+        if self.shard is not None:
+            write_shard_marker(self.super_match_save_folder, *self.shard, self.chunk_results)
+        failures = [result for result in self.chunk_results.values() if not result.success]
+        if len(failures) > 0:
+            raise RuntimeError(f'{len(failures)} of {len(chunk_folders)} chunks failed:\n' +
+                               '\n'.join(f'{result.chunk_folder}:\n{result.error}'
+                                         for result in failures))
+        return self.chunk_results
+
+    def verify_shards(self, n_shards=None):
+        '''
+        Check that every shard of a sharded super-match has completed, and that
+        together they successfully ran every chunk, as per
+        `~birnam.verify_shards`.
 
         Parameters
         ----------
-        p : list
-            List of the variables needed to extract one chunk's information.
-        '''
-        [i, primary_catalogue_input_location, chunk_folders, primary_catalogue_filename, top_level_folder,
-         list_of_secondary_match_folders, super_match_save_folder, primary_catalogue_name,
-         primary_catalogue_input_column_id, list_of_catalogue_names, list_of_match_filenames,
-         list_of_non_match_filenames, list_of_match_primary_column_ids,
-         list_of_match_secondary_column_ids, list_of_match_probability_ids,
-         list_of_non_match_primary_column_ids, list_of_non_match_probability_ids] = p
+        n_shards : integer, optional
+            The total number of shards, by default that of ``shard``.
+
+        Returns
+        -------
+        chunk_statuses : dict
+            Mapping of every chunk folder name to ``'succeeded'``, or
+            ``'skipped'`` if its existing output was up to date.
+        '''
+        if n_shards is None:
+            if self.shard is None:
+                raise ValueError('n_shards must be given for a super-match created without shard.')
+            n_shards = self.shard[1]
+        return verify_shards(self.super_match_save_folder, self.all_chunk_folders, n_shards)
+
+    def _shard_filename(self, filename):
+        '''
+        Determine the name of a file written by every shard, so that no two
+        shards write to the same file.
+        '''
+        return filename if self.shard is None else shard_filename(filename, *self.shard)
+
+    def chunk_super_match(self, chunk_folder, output='dataframe'):
+        '''
+        Create the super-match of a single chunk in memory, without saving it.
+
+        Parameters
+        ----------
+        chunk_folder : string
+            The name of the chunk's folder.
+        output : string, optional
+            The form in which to return the table: ``'dataframe'`` for a
+            `~pandas.DataFrame`, ``'structured'`` for a NumPy structured array,
+            or ``'table'`` for the compact `~birnam.SuperMatchTable`.
+
+        Returns
+        -------
+        super_match : pandas.DataFrame, numpy.ndarray or SuperMatchTable
+            The chunk's super-match table, with the same columns as saved by
+            `~birnam.SuperMatch.run`.
+        '''
+        if self.append:
+            raise ValueError('In-memory super-matches cannot be created with append.')
+        loaders = self.chunk_loaders(chunk_folder)
+        return _convert_super_match(self.combine_cross_matches(
+            loaders[0](), (load() for load in loaders[1:])), output)
+
+    def iter_chunk_super_matches(self, output='dataframe'):
+        '''
+        Create the super-match of each chunk in memory in turn, without saving
+        them.
+
+        Parameters
+        ----------
+        output : string, optional
+            The form in which to return each table, as per
+            `~birnam.SuperMatch.chunk_super_match`.
+
+        Yields
+        ------
+        chunk_folder : string
+            The name of the chunk's folder, in alphabetical order, from the
+            chunks of ``shard`` if given.
+        super_match : pandas.DataFrame, numpy.ndarray or SuperMatchTable
+            The chunk's super-match table.
+        '''
+        for chunk_folder in self.chunk_folders:
+            yield chunk_folder, self.chunk_super_match(chunk_folder, output=output)
+
+    def run_parameters(self):
+        '''
+        Collate the parameters that determine the contents of each chunk's
+        super-match, against which previous runs' outputs are validated.
+
+        Returns
+        -------
+        parameters : dict
+            The super-match's column, naming, input and output parameters.
+        '''
+        return {'primary_catalogue_name': self.primary_catalogue_name,
+                'primary_catalogue_input_column_id': self.primary_catalogue_input_column_id,
+                'list_of_catalogue_names': self.list_of_catalogue_names,
+                'list_of_match_primary_column_ids': self.list_of_match_primary_column_ids,
+                'list_of_match_secondary_column_ids': self.list_of_match_secondary_column_ids,
+                'list_of_match_probability_ids': self.list_of_match_probability_ids,
+                'list_of_non_match_primary_column_ids': self.list_of_non_match_primary_column_ids,
+                'list_of_non_match_probability_ids': self.list_of_non_match_probability_ids,
+                'input_format': self.input_format,
+                'output_format': f'{self.writer.__module__}.{self.writer.__qualname__}',
+                'compression': self.compression,
+                'writer_options': self.writer_options,
+                'append': self.append,
+                'bad_catalogue_threshold': self.bad_catalogue_threshold}
+
+    def chunk_locations(self, chunk_folder):
+        '''
+        Determine the locations on disk of the inputs and output of a chunk.
+
+        Parameters
+        ----------
+        chunk_folder : string
+            The name of the chunk's folder.
+
+        Returns
+        -------
+        primary_catalogue_chunk_location : string
+            Location of the chunk's primary catalogue file.
+        list_of_secondary_chunk_folders : list of strings
+            The chunk's folder within each cross-match's folder, in the order
+            of ``list_of_catalogue_names``.
+        super_match_chunk_save_filename : string
+            Location to which to save the chunk's super-match table.
+        '''
         # /primary/catalogue/input/location/chunk_folder/primary_catalogue_filename
         primary_catalogue_chunk_location = os.path.join(
-            primary_catalogue_input_location, chunk_folders[i], primary_catalogue_filename)
+            self.primary_catalogue_input_location, chunk_folder, self.primary_catalogue_filename)
         # /top/level/folder/match_pair_folder/chunk_folder/
         list_of_secondary_chunk_folders = [
-            os.path.join(top_level_folder, list_of_secondary_match_folders[j], chunk_folders[i])
-            for j in range(len(list_of_secondary_match_folders))]
+            os.path.join(self.top_level_folder, secondary_match_folder, chunk_folder)
+            for secondary_match_folder in self.list_of_secondary_match_folders]
         # /super/match/save/folder/chunk_folder/name_super_match.csv
         super_match_chunk_save_filename = os.path.join(
-            super_match_save_folder, chunk_folders[i],
-            f'{primary_catalogue_name}_super_match.csv')
+            self.super_match_save_folder, chunk_folder,
+            f'{self.primary_catalogue_name}_super_match.'
+            f'{self.writer.file_extension(self.compression)}')
+        return (primary_catalogue_chunk_location, list_of_secondary_chunk_folders,
+                super_match_chunk_save_filename)
+
+    def chunk_input_files(self, chunk_folder):
+        '''
+        Determine the locations on disk of every input file of a chunk.
+
+        Parameters
+        ----------
+        chunk_folder : string
+            The name of the chunk's folder.
+
+        Returns
+        -------
+        locations : list of strings
+            The primary catalogue file, followed by each cross-match's match
+            and non-match files in turn.
+        '''
+        primary_catalogue_chunk_location, list_of_secondary_chunk_folders, _ = \
+            self.chunk_locations(chunk_folder)
+        locations = [primary_catalogue_chunk_location]
+        for folder, match_filename, non_match_filename in zip(
+                list_of_secondary_chunk_folders, self.list_of_match_filenames,
+                self.list_of_non_match_filenames):
+            locations.extend([os.path.join(folder, match_filename),
+                              os.path.join(folder, non_match_filename)])
+        return locations
+
+    def single_chunk_super_match(self, chunk_folder):
+        '''
+        Helper function for the parallel loop, determining the locations of an
+        individual chunk and passing through to the single-chunk function.
+
+        Parameters
+        ----------
+        chunk_folder : string
+            The name of the chunk's folder.
+
+        Returns
+        -------
+        profile : ChunkProfile
+            The record of the chunk's stages and file reads, if ``instrument``
+            is set, otherwise ``None``.
+        '''
+        (primary_catalogue_chunk_location, list_of_secondary_chunk_folders,
+         super_match_chunk_save_filename) = self.chunk_locations(chunk_folder)
         os.makedirs(os.path.dirname(super_match_chunk_save_filename), exist_ok=True)
-        self.run_super_match(
-            primary_catalogue_name, primary_catalogue_chunk_location,
-            primary_catalogue_input_column_id, super_match_chunk_save_filename,
-            list_of_catalogue_names, list_of_secondary_chunk_folders, list_of_match_filenames,
-            list_of_non_match_filenames, list_of_match_primary_column_ids,
-            list_of_match_secondary_column_ids, list_of_match_probability_ids,
-            list_of_non_match_primary_column_ids, list_of_non_match_probability_ids)
+        if self.append:
+            run_super_match = self.run_append_super_match
+        elif self.block_size is not None:
+            run_super_match = self.run_streaming_super_match
+        else:
+            run_super_match = self.run_super_match
+        with contextlib.ExitStack() as stack:
+            hook = self.chunk_hook(chunk_folder) if self.chunk_hook is not None else None
+            if hook is not None:
+                stack.enter_context(hook)
+            profile = stack.enter_context(profile_chunk(chunk_folder)) if self.instrument else None
+            run_super_match(
+                self.primary_catalogue_name, primary_catalogue_chunk_location,
+                self.primary_catalogue_input_column_id, super_match_chunk_save_filename,
+                self.list_of_catalogue_names, list_of_secondary_chunk_folders,
+                self.list_of_match_filenames, self.list_of_non_match_filenames,
+                self.list_of_match_primary_column_ids, self.list_of_match_secondary_column_ids,
+                self.list_of_match_probability_ids, self.list_of_non_match_primary_column_ids,
+                self.list_of_non_match_probability_ids)
+        return profile
+
+    def chunk_loaders(self, chunk_folder):
+        '''
+        Determine the functions loading each input of a chunk, so that they
+        may be run concurrently.
+
+        Parameters
+        ----------
+        chunk_folder : string
+            The name of the chunk's folder.
+
+        Returns
+        -------
+        loaders : list of callables
+            Functions, taking no arguments, returning the chunk's primary
+            catalogue IDs, followed by each cross-match as returned by
+            `~birnam.SuperMatch.load_cross_match`.
+        '''
+        primary_catalogue_chunk_location, list_of_secondary_chunk_folders, _ = \
+            self.chunk_locations(chunk_folder)
+        loaders = [functools.partial(self.load_catalogue_column, primary_catalogue_chunk_location,
+                                     self.primary_catalogue_input_column_id)]
+        for i, folder in enumerate(list_of_secondary_chunk_folders):
+            loaders.append(functools.partial(
+                self.load_cross_match, os.path.join(folder, self.list_of_match_filenames[i]),
+                os.path.join(folder, self.list_of_non_match_filenames[i]),
+                self.list_of_match_primary_column_ids[i],
+                self.list_of_match_secondary_column_ids[i], self.list_of_match_probability_ids[i],
+                self.list_of_non_match_primary_column_ids[i],
+                self.list_of_non_match_probability_ids[i]))
+        return loaders
+
+    def combine_cross_matches(self, primary_ids, cross_matches):
+        '''
+        Create the super-match of one chunk from its loaded inputs.
+
+        Parameters
+        ----------
+        primary_ids : numpy.ndarray
+            The IDs of each primary catalogue object of the chunk.
+        cross_matches : iterable of tuples
+            Each cross-match, in the order of ``list_of_catalogue_names``, as
+            returned by `~birnam.SuperMatch.load_cross_match`.
+
+        Returns
+        -------
+        super_match : SuperMatchTable
+            The chunk's super-match table.
+        '''
+        return combine_super_match(self.primary_catalogue_name, primary_ids,
+                                   self.list_of_catalogue_names, cross_matches,
+                                   bad_catalogue_threshold=self.bad_catalogue_threshold)
+
+    def open_writer(self, super_match_save_filename):
+        '''
+        Create the writer of one chunk's super-match table.
+
+        Parameters
+        ----------
+        super_match_save_filename : string
+            Location on disk to which to save out the super-match table.
+
+        Returns
+        -------
+        writer : SuperMatchWriter
+            The writer of ``output_format``, with ``compression`` and
+            ``writer_options``, to be used as a context manager.
+        '''
+        return self.writer(super_match_save_filename, compression=self.compression,
+                           **self.writer_options)
+
+    def save_super_match(self, super_match, super_match_save_filename):
+        '''
+        Save the super-match table of one chunk through the chosen writer,
+        followed by its state if ``save_state`` is set.
+
+        Parameters
+        ----------
+        super_match : SuperMatchTable
+            The chunk's super-match table.
+        super_match_save_filename : string
+            Location on disk to which to save out the super-match table.
+        '''
+        with stage('write'), self.open_writer(super_match_save_filename) as writer:
+            writer.write_table(super_match)
+        # The table is saved before the state, so an interrupted append can
+        # simply be repeated.
+        if self.save_state:
+            with stage('save state'):
+                super_match.save(_state_filename(super_match_save_filename))
 
     def run_super_match(self, primary_catalogue_name, primary_catalogue_input_location,
                         primary_catalogue_input_column_id, super_match_save_filename,
@@ -213,85 +726,266 @@ class SuperMatch():
             catalogues.
         '''
 
-        # Create output data array in memory.
-        primary_input_catalogue_ids = self.load_catalogue_column(
-            primary_catalogue_input_location, primary_catalogue_input_column_id)
-        n_rows = len(primary_input_catalogue_ids)
-        # shape should be n_rows by (primary ID, ID*n, p_tot, ID_bad, and p_bad),
-        # but the structured array handles the column width internally.
-        shape = (n_rows,)
-        dtype = [(f'{primary_catalogue_name} ID', object),
-                 *((f'{secondary_catalogue_name} ID', object) for secondary_catalogue_name in
-                   list_of_catalogue_names),
-                 ('Probability', float), ('Bad catalogue', object),
-                 ('Probability without bad catalogue', float)]
-
-        super_match = np.empty(shape=shape, dtype=dtype)
-
-        # Populate left-hand primary ID, p(tot) = 1, p(without bad) = 1.
-        super_match[f'{primary_catalogue_name} ID'] = primary_input_catalogue_ids
-        super_match['Probability'] = 1
-        super_match['Probability without bad catalogue'] = 1
-        super_match['Bad catalogue'] = 'N/A'
-
-        # Loop over catalogues, updating ID and p(tot), also updating
-        # p(without bad) and bad_ID.
+        with stage('load primary'):
+            primary_input_catalogue_ids = self.load_catalogue_column(
+                primary_catalogue_input_location, primary_catalogue_input_column_id)
+
+        def load_cross_match(i):
+            with stage(f'load {list_of_catalogue_names[i]}'):
+                return self.load_cross_match(
+                    os.path.join(list_of_cross_match_folders[i], list_of_match_filenames[i]),
+                    os.path.join(list_of_cross_match_folders[i], list_of_non_match_filenames[i]),
+                    list_of_match_primary_column_ids[i], list_of_match_secondary_column_ids[i],
+                    list_of_match_probability_ids[i], list_of_non_match_primary_column_ids[i],
+                    list_of_non_match_probability_ids[i])
+
+        # Load each cross-match only as it is folded into the super-match.
+        cross_matches = (load_cross_match(i) for i in range(len(list_of_catalogue_names)))
+        super_match = combine_super_match(primary_catalogue_name, primary_input_catalogue_ids,
+                                          list_of_catalogue_names, cross_matches,
+                                          bad_catalogue_threshold=self.bad_catalogue_threshold)
+
+        # Save out column-by-column through the chosen writer.
+        self.save_super_match(super_match, super_match_save_filename)
+
+    def run_append_super_match(self, primary_catalogue_name, primary_catalogue_input_location,
+                               primary_catalogue_input_column_id, super_match_save_filename,
+                               list_of_catalogue_names, list_of_cross_match_folders,
+                               list_of_match_filenames, list_of_non_match_filenames,
+                               list_of_match_primary_column_ids, list_of_match_secondary_column_ids,
+                               list_of_match_probability_ids, list_of_non_match_primary_column_ids,
+                               list_of_non_match_probability_ids):
+        '''
+        Function to add further catalogues to a single, existing chunk of a
+        super-match, without re-loading the catalogues already combined.
+
+        The chunk's state, saved alongside ``super_match_save_filename`` by a
+        previous run with ``save_state``, is loaded and only the cross-matches
+        of ``list_of_catalogue_names`` are added to it, giving the same
+        result as re-creating the super-match from every catalogue. The
+        super-match table and its state are then saved again.
+
+        Parameters are as for `~birnam.SuperMatch.run_super_match`, with
+        ``list_of_catalogue_names`` and the cross-match parameters describing
+        only the new catalogues. The primary catalogue is not loaded.
+        '''
+        # pylint: disable=unused-argument
+        state_filename = _state_filename(super_match_save_filename)
+        if not os.path.exists(state_filename):
+            raise FileNotFoundError(f'No saved super-match state found at {state_filename}; '
+                                    'create the super-match with save_state=True first.')
+        with stage('load state'):
+            super_match = SuperMatchTable.load(state_filename)
+        if super_match.primary_catalogue_name != primary_catalogue_name:
+            raise ValueError(f'Saved super-match state is of primary catalogue '
+                             f'{super_match.primary_catalogue_name}, not {primary_catalogue_name}.')
+        if super_match.worst is None:
+            raise ValueError(f'Saved super-match state at {state_filename} does not hold the '
+                             'worst catalogue of each object; re-create the super-match with '
+                             'save_state=True.')
+        primary_index = PrimaryIDIndex(super_match.primary_ids)
         for i in range(len(list_of_catalogue_names)):  # pylint: disable=consider-using-enumerate
-            # Extract the match and non-match IDs (match x2, non-match x1) and
-            # (non-)match probabilities.
-            primary_match_ids = self.load_catalogue_column(
-                os.path.join(list_of_cross_match_folders[i], list_of_match_filenames[i]),
-                list_of_match_primary_column_ids[i])
-            secondary_match_ids = self.load_catalogue_column(
-                os.path.join(list_of_cross_match_folders[i], list_of_match_filenames[i]),
-                list_of_match_secondary_column_ids[i])
-            match_probs = self.load_catalogue_column(
-                os.path.join(list_of_cross_match_folders[i], list_of_match_filenames[i]),
-                list_of_match_probability_ids[i])
-
-            primary_non_match_ids = self.load_catalogue_column(
-                os.path.join(list_of_cross_match_folders[i], list_of_non_match_filenames[i]),
-                list_of_non_match_primary_column_ids[i])
-            non_match_probs = self.load_catalogue_column(
-                os.path.join(list_of_cross_match_folders[i], list_of_non_match_filenames[i]),
-                list_of_non_match_probability_ids[i])
-
-            for j in range(len(primary_match_ids)):  # pylint: disable=consider-using-enumerate
-                ind = np.where(primary_match_ids[j] == primary_input_catalogue_ids)[0][0]
-                super_match[
-                    f'{list_of_catalogue_names[i]} ID'][ind] = secondary_match_ids[j]
-                super_match['Probability'][ind] *= match_probs[j]
-
-                # If this is the worst posterior we've seen -- but it's also
-                # below 50% -- then we change the 'bad catalogue' columns,
-                # otherwise we just keep ticking that extra posterior over.
-                # TODO: relax hard-coded 50% criterion for 'badness'.  # pylint: disable=fixme
-                if (match_probs[j] < super_match['Probability without bad catalogue'][ind] and
-                        match_probs[j] < 0.5):
-                    super_match['Probability without bad catalogue'][ind] = super_match[
-                        'Probability'][ind] / match_probs[j]
-                    super_match['Bad catalogue'][ind] = list_of_catalogue_names[i]
-                else:
-                    super_match['Probability without bad catalogue'][ind] *= match_probs[j]
-
-            for j in range(len(primary_non_match_ids)):  # pylint: disable=consider-using-enumerate
-                ind = np.where(primary_non_match_ids[j] == primary_input_catalogue_ids)[0][0]
-                super_match[f'{list_of_catalogue_names[i]} ID'][ind] = 'N/A'
-                super_match['Probability'][ind] *= non_match_probs[j]
-
-                if (non_match_probs[j] < super_match[
-                        'Probability without bad catalogue'][ind] and non_match_probs[j] < 0.5):
-                    super_match['Probability without bad catalogue'][ind] = super_match[
-                        'Probability'][ind] / non_match_probs[j]
-                    super_match['Bad catalogue'][ind] = list_of_catalogue_names[i]
-                else:
-                    super_match['Probability without bad catalogue'][ind] *= non_match_probs[j]
-
-        # Save out via Pandas DataFrame.
-        # dtype is a list of tuples of (name, dtype), so we can just pull the
-        # column names from the list directly.
-        x = pd.DataFrame(super_match, columns=[p[0] for p in dtype])
-        x.to_csv(super_match_save_filename, encoding='utf-8', index=False, header=False)
+            catalogue_index = super_match.add_catalogue(list_of_catalogue_names[i])
+            with stage(f'load {list_of_catalogue_names[i]}'):
+                cross_match = self.load_cross_match(
+                    os.path.join(list_of_cross_match_folders[i], list_of_match_filenames[i]),
+                    os.path.join(list_of_cross_match_folders[i], list_of_non_match_filenames[i]),
+                    list_of_match_primary_column_ids[i], list_of_match_secondary_column_ids[i],
+                    list_of_match_probability_ids[i], list_of_non_match_primary_column_ids[i],
+                    list_of_non_match_probability_ids[i])
+            with stage(f'combine {list_of_catalogue_names[i]}'):
+                super_match.add_probabilities(
+                    catalogue_index, *_fold_cross_match(super_match, primary_index, catalogue_index,
+                                                        cross_match))
+        # The bad catalogue is re-determined from every catalogue, old and new.
+        _update_probabilities(super_match, self.bad_catalogue_threshold)
+
+        self.save_super_match(super_match, super_match_save_filename)
+
+    def run_streaming_super_match(self, primary_catalogue_name, primary_catalogue_input_location,
+                                  primary_catalogue_input_column_id, super_match_save_filename,
+                                  list_of_catalogue_names, list_of_cross_match_folders,
+                                  list_of_match_filenames, list_of_non_match_filenames,
+                                  list_of_match_primary_column_ids, list_of_match_secondary_column_ids,
+                                  list_of_match_probability_ids, list_of_non_match_primary_column_ids,
+                                  list_of_non_match_probability_ids):
+        '''
+        Function to run the creation of a single chunk of a super-match
+        out-of-core, holding approximately ``block_size`` rows in memory at once.
+
+        The primary catalogue and each cross-match table are read in blocks and
+        their rows spilled to disk, partitioned by a hash of the primary ID.
+        Each partition is then combined in turn and its rows re-distributed
+        into blocks of contiguous primary catalogue rows, which are finally
+        saved in order, so the output is identical to that of
+        ``run_super_match``. Spill files are kept in a temporary folder inside
+        the folder of ``super_match_save_filename``.
+
+        Parameters are as for `~birnam.SuperMatch.run_super_match`.
+        '''
+        block_size = self.block_size
+        n_catalogues = len(list_of_catalogue_names)
+        save_folder, save_basename = os.path.split(super_match_save_filename)
+        spill_folder = tempfile.mkdtemp(dir=save_folder or '.', prefix=f'.{save_basename}.spill_')
+        try:
+            n_rows, string_ids = self._scan_primary_catalogue(primary_catalogue_input_location,
+                                                              primary_catalogue_input_column_id)
+            n_partitions = max(1, -(-n_rows // block_size))
+
+            def spill_files(name, empty):
+                return [SpillFile(os.path.join(spill_folder, f'{name}_{k}.npy'), empty)
+                        for k in range(n_partitions)]
+
+            # Partition the primary IDs, and their row numbers, by ID hash.
+            id_empty = np.empty(0, dtype=object)
+            prob_empty = np.empty(0, dtype=np.float64)
+            primary_spills = spill_files('primary', [id_empty, np.empty(0, dtype=np.int64)])
+            with stage('partition primary'):
+                self._spill_primary_catalogue(primary_catalogue_input_location,
+                                              primary_catalogue_input_column_id, primary_spills,
+                                              string_ids)
+
+            # Partition each cross-match's match and non-match rows identically.
+            match_spills, non_match_spills, string_secondary_ids = [], [], []
+            for i in range(n_catalogues):
+                with stage(f'partition {list_of_catalogue_names[i]}'):
+                    match_spills.append(spill_files(f'match_{i}', [id_empty, id_empty, prob_empty]))
+                    string_secondary_ids.append(self._spill_catalogue(
+                        os.path.join(list_of_cross_match_folders[i], list_of_match_filenames[i]),
+                        [list_of_match_primary_column_ids[i], list_of_match_secondary_column_ids[i],
+                         list_of_match_probability_ids[i]],
+                        {list_of_match_probability_ids[i]: np.float64}, match_spills[i], string_ids))
+                    non_match_spills.append(spill_files(f'non_match_{i}', [id_empty, prob_empty]))
+                    self._spill_catalogue(
+                        os.path.join(list_of_cross_match_folders[i], list_of_non_match_filenames[i]),
+                        [list_of_non_match_primary_column_ids[i], list_of_non_match_probability_ids[i]],
+                        {list_of_non_match_probability_ids[i]: np.float64}, non_match_spills[i],
+                        string_ids)
+
+            # Combine each partition, sending the resulting rows to the block
+            # of the primary catalogue they came from.
+            empty_super_match = combine_super_match(primary_catalogue_name, id_empty,
+                                                    list_of_catalogue_names, ())
+            block_spills = spill_files('block', [np.empty(0, dtype=np.int64),
+                                                 *empty_super_match.columns.values()])
+            with stage('combine partitions'):
+                for k in range(n_partitions):
+                    primary_ids, rows = primary_spills[k].read()
+                    cross_matches = ((*match_spills[i][k].read(), *non_match_spills[i][k].read())
+                                     for i in range(n_catalogues))
+                    super_match = combine_super_match(
+                        primary_catalogue_name, primary_ids, list_of_catalogue_names,
+                        cross_matches, bad_catalogue_threshold=self.bad_catalogue_threshold)
+                    scatter_to_spill([rows, *(super_match.columns[name] for name in
+                                              super_match.column_names)],
+                                     rows // block_size, block_spills)
+
+            with stage('write'):
+                with self.open_writer(super_match_save_filename) as writer:
+                    if n_rows == 0:
+                        writer.write_table(empty_super_match)
+                    for block_spill in block_spills:
+                        # Each partition's rows of this block may have been saved
+                        # with different compact ID types, so join them as tables.
+                        blocks = list(block_spill.read_blocks())
+                        if not blocks:
+                            continue
+                        rows = np.concatenate([block[0] for block in blocks])
+                        super_match = SuperMatchTable.concatenate([SuperMatchTable(
+                            primary_catalogue_name, list_of_catalogue_names,
+                            dict(zip(empty_super_match.column_names, block[1:]))) for block in blocks])
+                        writer.write_table(_as_string_secondary_ids(
+                            super_match.take(np.argsort(rows)), string_secondary_ids))
+        finally:
+            shutil.rmtree(spill_folder)
+
+    def _scan_primary_catalogue(self, loc, id_):
+        '''
+        Count the rows of a primary catalogue in blocks, and determine whether
+        any of its IDs are strings.
+        '''
+        n_rows, string_ids = 0, False
+        for ids, in iter_catalogue_columns(loc, [id_], self.block_size,
+                                           input_format=self.input_format):
+            n_rows += len(ids)
+            string_ids = string_ids or ids.dtype == object
+        return n_rows, string_ids
+
+    def _spill_primary_catalogue(self, loc, id_, spill_files, string_ids):
+        '''
+        Read the IDs of a primary catalogue in blocks, appending each, and its
+        row number, to the spill file of its partition.
+        '''
+        start = 0
+        for ids, in iter_catalogue_columns(loc, [id_], self.block_size,
+                                           dtypes=_string_id_dtypes([id_], string_ids),
+                                           input_format=self.input_format):
+            scatter_to_spill([ids, np.arange(start, start + len(ids))],
+                             hash_partition(ids, len(spill_files)), spill_files)
+            start += len(ids)
+
+    def _spill_catalogue(self, loc, ids, dtypes, spill_files, string_ids):
+        '''
+        Read a cross-match table in blocks, appending each row to the spill
+        file of the partition of its primary ID, the first of ``ids``, read as
+        a string if ``string_ids``, and determine whether any of its other ID
+        columns were strings in any block.
+        '''
+        start, n_rows, strings = time.perf_counter(), 0, False
+        dtypes = {**_string_id_dtypes(ids[:1], string_ids), **dtypes}
+        for columns in iter_catalogue_columns(loc, ids, self.block_size, dtypes=dtypes,
+                                              input_format=self.input_format):
+            scatter_to_spill(columns, hash_partition(columns[0], len(spill_files)), spill_files)
+            n_rows += len(columns[0])
+            strings = strings or any(column.dtype == object for column, id_ in
+                                     zip(columns[1:], ids[1:]) if id_ not in dtypes)
+        # The duration includes the partitioning of the rows.
+        record_read(loc, n_rows, time.perf_counter() - start)
+        return strings
+
+    def load_cross_match(self, match_location, non_match_location, match_primary_column_id,
+                         match_secondary_column_id, match_probability_id,
+                         non_match_primary_column_id, non_match_probability_id):
+        '''
+        Load the columns of one cross-match's match and non-match tables needed
+        to create a super-match.
+
+        Parameters
+        ----------
+        match_location : string
+            Full location on disk of the cross-match's "match" output file.
+        non_match_location : string
+            Full location on disk of the cross-match's primary "non-match"
+            output file.
+        match_primary_column_id : int
+            The zero-indexed column of the ID of the primary catalogue in the
+            match table.
+        match_secondary_column_id : int
+            The zero-indexed column of the ID of the secondary catalogue in the
+            match table.
+        match_probability_id : int
+            The zero-indexed column of the match probability in the match table.
+        non_match_primary_column_id : int
+            The zero-indexed column of the ID of the primary catalogue in the
+            non-match table.
+        non_match_probability_id : int
+            The zero-indexed column of the non-match probability in the
+            non-match table.
+
+        Returns
+        -------
+        cross_match : tuple of numpy.ndarray
+            The primary IDs, secondary IDs and probabilities of the matches,
+            followed by the primary IDs and probabilities of the non-matches.
+        '''
+        primary_match_ids, secondary_match_ids, match_probs = self.load_catalogue_columns(
+            match_location, [match_primary_column_id, match_secondary_column_id,
+                             match_probability_id], dtypes={match_probability_id: np.float64})
+        primary_non_match_ids, non_match_probs = self.load_catalogue_columns(
+            non_match_location, [non_match_primary_column_id, non_match_probability_id],
+            dtypes={non_match_probability_id: np.float64})
+        return (primary_match_ids, secondary_match_ids, match_probs, primary_non_match_ids,
+                non_match_probs)
 
     def load_catalogue_column(self, loc, id_):
         '''
@@ -310,7 +1004,68 @@ class SuperMatch():
             One-dimensional array of the value in the chosen ``ID``-th column
             in each row of the file.
         '''
-        # TODO: relax .csv hard-coded assumption.  # pylint: disable=fixme
-        # TODO: add header toggle.  # pylint: disable=fixme
-        csv_column = pd.read_csv(loc, header=None, usecols=[id_])[id_].values
+        csv_column, = self.load_catalogue_columns(loc, [id_])
         return csv_column
+
+    def load_catalogue_columns(self, loc, ids, dtypes=None):
+        '''
+        Load several columns from a catalogue on disk into memory, reading the
+        file only once.
+
+        Parameters
+        ----------
+        loc : string
+            Full location on disk of file to load columns of.
+        ids : list of ints
+            The zero-indexed columns of the file at ``loc`` to load.
+        dtypes : dict, optional
+            Mapping of column index to the data type that column should be
+            loaded as, e.g. ``numpy.float64`` for probabilities. Columns not
+            given are loaded as ID columns, returned as integers if every
+            entry is an integer and as strings otherwise.
+
+        Returns
+        -------
+        columns : list of numpy.ndarray
+            One-dimensional arrays of the values in each of the ``ids`` columns
+            in each row of the file, in the order of ``ids``.
+        '''
+        start = time.perf_counter()
+        columns = read_catalogue_columns(loc, ids, dtypes=dtypes, input_format=self.input_format,
+                                         cache=self.column_cache)
+        record_read(loc, len(columns[0]), time.perf_counter() - start)
+        return columns
+
+
+def _string_id_dtypes(ids, string_ids):
+    '''
+    Determine the data types with which to read ID columns in blocks.
+
+    The type of text IDs is inferred separately for each block, so IDs that
+    are strings anywhere in a primary catalogue, and so when loading the whole
+    file, are read as strings throughout, so equal IDs are partitioned alike.
+    '''
+    return dict.fromkeys(ids, object) if string_ids else {}
+
+
+def _as_string_secondary_ids(table, string_secondary_ids):
+    '''
+    Convert to strings the integer secondary IDs of a block of a streamed
+    super-match, of each catalogue whose IDs were strings in any block, so
+    that each column is saved with the same type in every block.
+    '''
+    for name, strings in zip(table.list_of_catalogue_names, string_secondary_ids):
+        if strings:
+            column_name = f'{name} ID'
+            table.columns[column_name], _ = _promote_id_columns([table.columns[column_name],
+                                                                 np.empty(0, dtype=np.bytes_)])
+    return table
+
+
+def _state_filename(super_match_save_filename):
+    '''
+    Determine the location of the saved state of a chunk's super-match from
+    the location of its saved table.
+    '''
+    folder, basename = os.path.split(super_match_save_filename)
+    return os.path.join(folder, basename.split('_super_match.')[0] + '_super_match_state.npz')
@@ -0,0 +1,402 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the compact in-memory representation of super-match tables.
+'''
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['SuperMatchTable', 'compact_ids']
+
+# Sentinel values of integer secondary ID columns, for primary objects that
+# were non-matches in, or entirely absent from, a cross-match.
+NON_MATCH_INT = np.iinfo(np.int64).min
+NO_ENTRY_INT = NON_MATCH_INT + 1
+# The equivalent sentinels of bytes secondary ID columns.
+NON_MATCH_BYTES = b'N/A'
+NO_ENTRY_BYTES = b''
+# Sentinel of the bad catalogue column, for objects without a bad catalogue.
+NO_BAD_CATALOGUE = -1
+# The names under which the running worst catalogue state is saved.
+_WORST_NAMES = ('__worst_probability', '__worst_catalogue', '__probability_without_worst')
+
+
+def compact_ids(ids):
+    '''
+    Convert an array of IDs to a compact, non-object representation.
+
+    Parameters
+    ----------
+    ids : numpy.ndarray
+        The IDs, as integers or Python strings.
+
+    Returns
+    -------
+    compact : numpy.ndarray
+        ``ids`` as 64-bit integers if integer, fixed-width bytes if every ID is
+        ASCII, and fixed-width unicode otherwise.
+    '''
+    ids = np.asarray(ids)
+    if np.issubdtype(ids.dtype, np.integer):
+        return ids.astype(np.int64, copy=False)
+    if ids.dtype.kind in 'SU':
+        return ids
+    try:
+        return ids.astype(np.bytes_) if len(ids) > 0 else np.empty(0, dtype='S1')
+    except UnicodeEncodeError:
+        return ids.astype(np.str_)
+
+
+class SuperMatchTable():
+    '''
+    A super-match table held column-by-column in compact, non-object arrays.
+
+    IDs are stored as integers or fixed-width strings, as per `compact_ids`,
+    with non-matches and primary objects absent from a cross-match held as
+    sentinel values of each secondary ID column. The bad catalogue is stored
+    as an integer index into ``list_of_catalogue_names``, ``-1`` indicating no
+    bad catalogue. Human-readable values are only produced by
+    ``decoded_columns``, for output.
+
+    The running state from which the bad catalogue columns are updated as
+    further catalogues are added may also be held, as ``worst``: one value
+    per row, however many catalogues are added.
+
+    Parameters
+    ----------
+    primary_catalogue_name : string
+        The name of the "primary" photometric catalogue.
+    list_of_catalogue_names : list or numpy.ndarray of strings
+        The names of each catalogue cross-matched to the primary catalogue.
+    columns : dict
+        Mapping of column name to one-dimensional array, in the order of
+        ``column_names``.
+    worst : tuple of numpy.ndarray, optional
+        The lowest probability of each row in any cross-match -- infinite
+        before any cross-match is added -- the index into
+        ``list_of_catalogue_names`` of that cross-match, ties going to the
+        earliest, and the product of the row's probabilities in every other
+        cross-match.
+    '''
+
+    def __init__(self, primary_catalogue_name, list_of_catalogue_names, columns, worst=None):
+        self.primary_catalogue_name = primary_catalogue_name
+        self.list_of_catalogue_names = list(list_of_catalogue_names)
+        self.columns = columns
+        self.worst = worst
+
+    @classmethod
+    def initialise(cls, primary_catalogue_name, list_of_catalogue_names, primary_ids):
+        '''
+        Create a table for a set of primary objects not yet cross-matched
+        to any catalogue, with unit probabilities, no bad catalogue and no
+        worst catalogue.
+
+        Parameters
+        ----------
+        primary_catalogue_name : string
+            The name of the "primary" photometric catalogue.
+        list_of_catalogue_names : list or numpy.ndarray of strings
+            The names of each catalogue cross-matched to the primary catalogue.
+        primary_ids : numpy.ndarray
+            The IDs of each primary catalogue object.
+
+        Returns
+        -------
+        table : SuperMatchTable
+            The initialised table.
+        '''
+        n_rows = len(primary_ids)
+        columns = {f'{primary_catalogue_name} ID': compact_ids(primary_ids)}
+        for name in list_of_catalogue_names:
+            columns[f'{name} ID'] = np.full(n_rows, NO_ENTRY_INT, dtype=np.int64)
+        columns['Probability'] = np.ones(n_rows, dtype=np.float64)
+        columns['Bad catalogue'] = np.full(n_rows, NO_BAD_CATALOGUE, dtype=np.int16)
+        columns['Probability without bad catalogue'] = np.ones(n_rows, dtype=np.float64)
+        worst = (np.full(n_rows, np.inf), np.full(n_rows, NO_BAD_CATALOGUE, dtype=np.int16),
+                 np.ones(n_rows, dtype=np.float64))
+        return cls(primary_catalogue_name, list_of_catalogue_names, columns, worst)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Load a table saved by ``save``.
+
+        Parameters
+        ----------
+        path : string
+            Location on disk of the saved table.
+
+        Returns
+        -------
+        table : SuperMatchTable
+            The loaded table.
+        '''
+        with np.load(path, allow_pickle=False) as saved:
+            primary_catalogue_name = str(saved['__primary_catalogue_name'])
+            list_of_catalogue_names = [str(name) for name in
+                                       np.asarray(saved['__list_of_catalogue_names'])]
+            table = cls(primary_catalogue_name, list_of_catalogue_names, {})
+            table.columns = {name: saved[name] for name in table.column_names}
+            if _WORST_NAMES[0] in saved:
+                table.worst = tuple(saved[name] for name in _WORST_NAMES)
+        return table
+
+    def save(self, path):
+        '''
+        Save the table, including its probability and bad catalogue state and
+        any ``worst`` state, in NumPy's ``.npz`` format, from which further
+        catalogues can later be added with ``add_catalogue``. The file is
+        written under a temporary name and moved into place once complete.
+
+        Parameters
+        ----------
+        path : string
+            Location on disk to which to save the table.
+        '''
+        directory, basename = os.path.split(path)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=directory or '.',
+                                                           prefix=f'.{basename}.', suffix='.tmp')
+        try:
+            extra = {} if self.worst is None else dict(zip(_WORST_NAMES, self.worst))
+            with os.fdopen(file_descriptor, 'wb') as f:
+                np.savez(f, __primary_catalogue_name=np.array(self.primary_catalogue_name),
+                         __list_of_catalogue_names=np.array(self.list_of_catalogue_names, dtype=str),
+                         **extra, **self.columns)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    def add_catalogue(self, catalogue_name):
+        '''
+        Add a further, not yet cross-matched, catalogue to the table. Its
+        probabilities are then given by ``add_probabilities``.
+
+        Parameters
+        ----------
+        catalogue_name : string
+            The name of the new catalogue.
+
+        Returns
+        -------
+        catalogue_index : integer
+            The index into ``list_of_catalogue_names`` of the new catalogue.
+        '''
+        if catalogue_name in self.list_of_catalogue_names:
+            raise ValueError(f'Catalogue {catalogue_name} is already part of the super-match.')
+        self.list_of_catalogue_names.append(catalogue_name)
+        self.columns[f'{catalogue_name} ID'] = np.full(len(self), NO_ENTRY_INT, dtype=np.int64)
+        # Keep the columns in output order.
+        self.columns = {name: self.columns[name] for name in self.column_names}
+        return len(self.list_of_catalogue_names) - 1
+
+    @property
+    def primary_ids(self):
+        '''
+        The decoded IDs of each primary catalogue object.
+        '''
+        return _decode_ids(self.columns[f'{self.primary_catalogue_name} ID'])
+
+    @property
+    def column_names(self):
+        '''
+        The names of the columns of the table, in output order.
+        '''
+        return [f'{self.primary_catalogue_name} ID',
+                *(f'{name} ID' for name in self.list_of_catalogue_names),
+                'Probability', 'Bad catalogue', 'Probability without bad catalogue']
+
+    def __len__(self):
+        return len(self.columns['Probability'])
+
+    def set_secondary_ids(self, catalogue_index, match_rows, secondary_ids, non_match_rows):
+        '''
+        Record the counterparts, and non-matches, of one cross-match.
+
+        Parameters
+        ----------
+        catalogue_index : integer
+            The index into ``list_of_catalogue_names`` of the cross-match.
+        match_rows : numpy.ndarray
+            The rows of the table with a counterpart in the catalogue.
+        secondary_ids : numpy.ndarray
+            The ID of the counterpart of each of ``match_rows``.
+        non_match_rows : numpy.ndarray
+            The rows of the table without a counterpart in the catalogue.
+        '''
+        name = f'{self.list_of_catalogue_names[catalogue_index]} ID'
+        secondary_ids = compact_ids(secondary_ids)
+        column = _promote_id_columns([self.columns[name], secondary_ids])[0]
+        column[match_rows] = secondary_ids
+        column[non_match_rows] = (NON_MATCH_INT if column.dtype.kind == 'i' else
+                                  column.dtype.type(NON_MATCH_BYTES.decode()))
+        self.columns[name] = column
+
+    def add_probabilities(self, catalogue_index, rows, probabilities):
+        '''
+        Multiply the probabilities of one cross-match into the table's
+        ``Probability`` column, and update its ``worst`` state, without the
+        probabilities of any other cross-match. The bad catalogue columns are
+        left to be computed from the updated state.
+
+        Parameters
+        ----------
+        catalogue_index : integer
+            The index into ``list_of_catalogue_names`` of the cross-match.
+        rows : numpy.ndarray
+            The rows of the table in the cross-match's match or non-match
+            tables; all other rows have a probability of ``1``.
+        probabilities : numpy.ndarray
+            The match or non-match probability of each of ``rows``.
+        '''
+        cross_match_probabilities = np.ones(len(self), dtype=np.float64)
+        cross_match_probabilities[rows] = probabilities
+        probability = self.columns['Probability']
+        worst_probability, worst_catalogue, probability_without_worst = self.worst
+        # Ties go to the earlier catalogue, as with a row-wise argmin.
+        new_worst = cross_match_probabilities < worst_probability
+        self.worst = (np.where(new_worst, cross_match_probabilities, worst_probability),
+                      np.where(new_worst, catalogue_index, worst_catalogue).astype(np.int16),
+                      np.where(new_worst, probability,
+                               probability_without_worst * cross_match_probabilities))
+        self.columns['Probability'] = probability * cross_match_probabilities
+
+    def take(self, rows):
+        '''
+        Select a subset of the rows of the table.
+
+        Parameters
+        ----------
+        rows : numpy.ndarray
+            The indices, or boolean mask, of the rows to select.
+
+        Returns
+        -------
+        table : SuperMatchTable
+            A new table containing only ``rows``.
+        '''
+        return SuperMatchTable(self.primary_catalogue_name, self.list_of_catalogue_names,
+                               {name: column[rows] for name, column in self.columns.items()},
+                               None if self.worst is None else tuple(a[rows] for a in self.worst))
+
+    @classmethod
+    def concatenate(cls, tables):
+        '''
+        Join the rows of several tables of the same super-match.
+
+        Parameters
+        ----------
+        tables : list of SuperMatchTable
+            The tables to join, all with the same catalogues.
+
+        Returns
+        -------
+        table : SuperMatchTable
+            The rows of each of ``tables`` in turn.
+        '''
+        first = tables[0]
+        columns = {name: np.concatenate(_promote_id_columns([t.columns[name] for t in tables]))
+                   for name in first.column_names}
+        # The worst catalogue state is only kept if every table has it.
+        worst = (None if any(t.worst is None for t in tables) else
+                 tuple(np.concatenate(arrays) for arrays in zip(*(t.worst for t in tables))))
+        return cls(first.primary_catalogue_name, first.list_of_catalogue_names, columns, worst)
+
+    def decoded_columns(self):
+        '''
+        Convert the table to human-readable columns for output.
+
+        Returns
+        -------
+        columns : dict
+            Mapping of column name to one-dimensional array in output order,
+            with string IDs as Python strings, non-matches as ``'N/A'``,
+            absent entries as ``None``, and the bad catalogue by name.
+        '''
+        decoded = {}
+        primary_name = f'{self.primary_catalogue_name} ID'
+        decoded[primary_name] = _decode_ids(self.columns[primary_name])
+        for name in self.list_of_catalogue_names:
+            decoded[f'{name} ID'] = _decode_ids(self.columns[f'{name} ID'], sentinels=True)
+        decoded['Probability'] = self.columns['Probability']
+        bad_names = np.array(['N/A', *self.list_of_catalogue_names], dtype=object)
+        decoded['Bad catalogue'] = bad_names[self.columns['Bad catalogue'].astype(np.intp) + 1]
+        decoded['Probability without bad catalogue'] = self.columns['Probability without bad catalogue']
+        return decoded
+
+    def to_dataframe(self):
+        '''
+        Convert the table to a decoded `~pandas.DataFrame`.
+
+        Returns
+        -------
+        dataframe : pandas.DataFrame
+            The table, as per ``decoded_columns``.
+        '''
+        return pd.DataFrame(self.decoded_columns(), copy=False)
+
+    def to_structured(self):
+        '''
+        Convert the table to a decoded NumPy structured array.
+
+        Returns
+        -------
+        super_match : numpy.ndarray
+            The table, as per ``decoded_columns``.
+        '''
+        decoded = self.decoded_columns()
+        super_match = np.empty(len(self), dtype=[(name, column.dtype) for name, column in
+                                                 decoded.items()])
+        for name, column in decoded.items():
+            super_match[name] = column
+        return super_match
+
+
+def _promote_id_columns(columns):
+    '''
+    Convert a set of secondary ID columns to a common type, converting integer
+    columns to strings -- preserving their sentinels -- if any column is of
+    strings.
+    '''
+    kinds = {column.dtype.kind for column in columns}
+    if not kinds & {'S', 'U'}:
+        return list(columns)
+    string_type = np.str_ if 'U' in kinds else np.bytes_
+    promoted = []
+    for column in columns:
+        if column.dtype.kind == 'i':
+            as_string = np.where(column == NON_MATCH_INT, NON_MATCH_BYTES,
+                                 NO_ENTRY_BYTES).astype(string_type)
+            real = (column != NON_MATCH_INT) & (column != NO_ENTRY_INT)
+            if np.any(real):
+                values = column[real].astype(string_type)
+                as_string = as_string.astype(np.result_type(as_string, values))
+                as_string[real] = values
+            column = as_string
+        promoted.append(column.astype(string_type, copy=False))
+    # Strings must be at least wide enough to hold the non-match sentinel.
+    dtype = np.result_type(np.dtype(string_type).type(NON_MATCH_BYTES.decode()).dtype,
+                           *(column.dtype for column in promoted))
+    return [column.astype(dtype, copy=False) for column in promoted]
+
+
+def _decode_ids(column, sentinels=False):
+    '''
+    Convert a compact ID column to Python objects, optionally replacing the
+    non-match and absent-entry sentinels by ``'N/A'`` and ``None``.
+    '''
+    if column.dtype.kind == 'S':
+        decoded = np.char.decode(column, 'utf-8').astype(object)
+    else:
+        decoded = column.astype(object)
+    if sentinels:
+        if column.dtype.kind == 'i':
+            decoded[column == NON_MATCH_INT] = 'N/A'
+            decoded[column == NO_ENTRY_INT] = None
+        else:
+            decoded[column == column.dtype.type(NO_ENTRY_BYTES.decode())] = None
+    return decoded
@@ -0,0 +1,192 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the pre-flight validation of the inputs of every chunk of
+a super-match, finding missing files, unreadable columns and inconsistent IDs
+before any super-match is created.
+'''
+
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from .join import _preview
+
+__all__ = ['ValidationReport', 'validate_inputs']
+
+VALIDATION_FILENAME = 'super_match_validation.json'
+
+
+class ValidationReport():
+    '''
+    The problems found with the inputs of each chunk of a super-match.
+
+    Parameters
+    ----------
+    issues : dict
+        Mapping of chunk folder name to a list of descriptions of the problems
+        with that chunk's inputs, empty if there are none.
+    '''
+
+    def __init__(self, issues):
+        self.issues = issues
+
+    @property
+    def valid(self):
+        '''
+        Whether the inputs of every chunk are free of problems.
+        '''
+        return not any(self.issues.values())
+
+    def __str__(self):
+        invalid = {chunk_folder: issues for chunk_folder, issues in self.issues.items() if issues}
+        if not invalid:
+            return f'The inputs of all {len(self.issues)} chunks are valid.'
+        return (f'The inputs of {len(invalid)} of {len(self.issues)} chunks are invalid:\n' +
+                '\n'.join(f'{chunk_folder}:\n' + '\n'.join(f'    {issue}' for issue in issues)
+                          for chunk_folder, issues in invalid.items()))
+
+    def save(self, path):
+        '''
+        Save the report as JSON.
+
+        Parameters
+        ----------
+        path : string
+            Location on disk to which to save the report.
+        '''
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'valid': self.valid, 'chunks': self.issues}, f, indent=1)
+
+    def raise_if_invalid(self):
+        '''
+        Raise an error describing every problem found, if there are any.
+        '''
+        if not self.valid:
+            raise ValueError(str(self))
+
+
+def validate_inputs(super_match, chunk_folders=None, n_pool=None):
+    '''
+    Check the inputs of the chunks of a super-match, in parallel, before
+    creating any of them.
+
+    For each chunk, every input file must exist, and hold the columns given;
+    the primary catalogue's IDs must be unique; and for each cross-match,
+    every primary object must appear exactly once across its match and
+    non-match tables, which must hold no other IDs, and every match and
+    non-match probability must be a number between zero and one.
+
+    Parameters
+    ----------
+    super_match : SuperMatch
+        The super-match whose inputs to check.
+    chunk_folders : list of strings, optional
+        The chunks to check, by default the ``chunk_folders`` of
+        ``super_match``.
+    n_pool : integer, optional
+        The number of processes, by default the ``n_pool`` of
+        ``super_match``.
+
+    Returns
+    -------
+    report : ValidationReport
+        The problems found with each chunk's inputs.
+    '''
+    chunk_folders = super_match.chunk_folders if chunk_folders is None else chunk_folders
+    with multiprocessing.Pool(super_match.n_pool if n_pool is None else n_pool) as pool:
+        issues = pool.starmap(_validate_chunk, [(super_match, chunk_folder)
+                                                for chunk_folder in chunk_folders])
+    return ValidationReport(dict(zip(chunk_folders, issues)))
+
+
+def _validate_chunk(super_match, chunk_folder):
+    '''
+    Determine the problems with the inputs of one chunk.
+    '''
+    issues = []
+    primary_location, cross_match_folders, _ = super_match.chunk_locations(chunk_folder)
+    primary_ids = _load_columns(super_match, primary_location,
+                                [super_match.primary_catalogue_input_column_id], issues)
+    if primary_ids is not None:
+        primary_index = pd.Index(primary_ids[0])
+        duplicates = primary_index[primary_index.duplicated()].unique()
+        if len(duplicates) > 0:
+            issues.append(f'{primary_location} contains {len(duplicates)} duplicated ID(s), '
+                          f'e.g. {_preview(duplicates)}.')
+            primary_index = primary_index.unique()
+    for i, folder in enumerate(cross_match_folders):
+        if not os.path.isdir(folder):
+            issues.append(f'{folder} does not exist.')
+            continue
+        match_location = os.path.join(folder, super_match.list_of_match_filenames[i])
+        non_match_location = os.path.join(folder, super_match.list_of_non_match_filenames[i])
+        match_probability_id = super_match.list_of_match_probability_ids[i]
+        matches = _load_columns(super_match, match_location, [
+            super_match.list_of_match_primary_column_ids[i],
+            super_match.list_of_match_secondary_column_ids[i], match_probability_id], issues,
+            dtypes={match_probability_id: np.float64})
+        non_match_probability_id = super_match.list_of_non_match_probability_ids[i]
+        non_matches = _load_columns(super_match, non_match_location, [
+            super_match.list_of_non_match_primary_column_ids[i], non_match_probability_id], issues,
+            dtypes={non_match_probability_id: np.float64})
+        if matches is not None:
+            issues.extend(_check_probabilities(matches[2], match_location))
+        if non_matches is not None:
+            issues.extend(_check_probabilities(non_matches[1], non_match_location))
+        if primary_ids is not None and matches is not None and non_matches is not None:
+            issues.extend(_check_coverage(primary_index, matches[0], non_matches[0],
+                                          f'{super_match.list_of_catalogue_names[i]} match and '
+                                          'non-match tables'))
+    return issues
+
+
+def _load_columns(super_match, loc, ids, issues, dtypes=None):
+    '''
+    Load columns of an input file, as for the super-match, recording, rather
+    than raising, any failure to, e.g. of non-numeric probabilities.
+    '''
+    if not os.path.isfile(loc):
+        issues.append(f'{loc} does not exist.')
+        return None
+    try:
+        return super_match.load_catalogue_columns(loc, ids, dtypes=dtypes)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        issues.append(f'Columns {", ".join(str(id_) for id_ in ids)} of {loc} could not be '
+                      f'loaded: {type(e).__name__}: {e}')
+        return None
+
+
+def _check_probabilities(probabilities, loc):
+    '''
+    Check that every probability of a match or non-match table is a number
+    between zero and one.
+    '''
+    invalid = ~((probabilities >= 0) & (probabilities <= 1))
+    if np.any(invalid):
+        return [f'{np.sum(invalid)} probabilities in {loc} are missing or not between 0 and 1, '
+                f'e.g. {_preview(probabilities[invalid])}.']
+    return []
+
+
+def _check_coverage(primary_index, match_ids, non_match_ids, description):
+    '''
+    Check that the match and non-match tables of a cross-match together hold
+    each primary ID exactly once.
+    '''
+    issues = []
+    rows = primary_index.get_indexer(np.concatenate((match_ids, non_match_ids)))
+    unknown = np.concatenate((match_ids, non_match_ids))[rows < 0]
+    if len(unknown) > 0:
+        issues.append(f'{len(unknown)} ID(s) in {description} are not present in the primary '
+                      f'catalogue, e.g. {_preview(unknown)}.')
+    counts = np.bincount(rows[rows >= 0], minlength=len(primary_index))
+    if np.any(counts > 1):
+        issues.append(f'{np.sum(counts > 1)} primary ID(s) appear more than once in '
+                      f'{description}, e.g. {_preview(primary_index[counts > 1])}.')
+    if np.any(counts == 0):
+        issues.append(f'{np.sum(counts == 0)} primary ID(s) appear in neither of {description}, '
+                      f'e.g. {_preview(primary_index[counts == 0])}.')
+    return issues
@@ -0,0 +1,522 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+This module provides the output backends used to save super-match tables to
+disk.
+'''
+
+import csv
+import gzip
+import io
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .table import NO_ENTRY_BYTES, NO_ENTRY_INT, NON_MATCH_BYTES, NON_MATCH_INT
+
+__all__ = ['SuperMatchWriter', 'CSVWriter', 'ParquetWriter', 'HDF5Writer', 'get_writer']
+
+
+class SuperMatchWriter():
+    '''
+    Base class for the writing of a super-match table to disk.
+
+    Tables are passed to ``write`` as a dictionary of one-dimensional column
+    arrays, and may be written in several blocks of rows. Data are written to a
+    temporary file alongside ``filename``, which is only moved into place once
+    the writer is closed without error, so a partially-written table is never
+    visible under ``filename``.
+
+    Writers should be used as context managers::
+
+        with CSVWriter('super_match.csv') as writer:
+            writer.write({'ID': ids, 'Probability': probabilities})
+
+    Parameters
+    ----------
+    filename : string
+        Location on disk to which to save the table.
+    '''
+
+    #: Filename extension, without leading period, of files produced.
+    extension = None
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.temporary_filename = None
+
+    def __enter__(self):
+        directory, basename = os.path.split(self.filename)
+        file_descriptor, self.temporary_filename = tempfile.mkstemp(
+            dir=directory or '.', prefix=f'.{basename}.', suffix='.tmp')
+        os.close(file_descriptor)
+        try:
+            self.open()
+        except BaseException:
+            os.remove(self.temporary_filename)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.close()
+        except BaseException:
+            os.remove(self.temporary_filename)
+            raise
+        if exc_type is None:
+            os.replace(self.temporary_filename, self.filename)
+        else:
+            os.remove(self.temporary_filename)
+
+    @classmethod
+    def file_extension(cls, compression=None):  # pylint: disable=unused-argument
+        '''
+        Determine the filename extension of files saved by the writer.
+
+        Parameters
+        ----------
+        compression : string, optional
+            The compression the writer will be created with.
+
+        Returns
+        -------
+        extension : string
+            The filename extension, without leading period.
+        '''
+        return cls.extension
+
+    def open(self):
+        '''
+        Prepare ``temporary_filename`` for the writing of blocks of rows.
+        '''
+
+    def write(self, columns):
+        '''
+        Write a block of rows to disk.
+
+        Parameters
+        ----------
+        columns : dict
+            Mapping of column name to one-dimensional array of the values of
+            that column, all of equal length, in output column order.
+        '''
+        raise NotImplementedError
+
+    def write_table(self, table):
+        '''
+        Write the rows of a compact super-match table to disk.
+
+        By default the table is decoded, as per
+        `~birnam.SuperMatchTable.decoded_columns`, and passed to ``write``;
+        writers able to save the compact columns directly may override this.
+
+        Parameters
+        ----------
+        table : SuperMatchTable
+            The rows to write.
+        '''
+        self.write(table.decoded_columns())
+
+    def close(self):
+        '''
+        Finish writing to ``temporary_filename``.
+        '''
+
+
+class CSVWriter(SuperMatchWriter):
+    '''
+    Save a super-match table as comma-separated values.
+
+    Columns are formatted with NumPy, in blocks of ``rows_per_block`` rows,
+    directly from their typed arrays -- including the compact columns of a
+    `~birnam.SuperMatchTable` -- rather than through Python objects. Strings
+    containing commas, quotes or line breaks are quoted.
+
+    Parameters
+    ----------
+    filename : string
+        Location on disk to which to save the table.
+    compression : string, optional
+        If ``'gzip'``, compress the output file with gzip; if ``'zstd'``, with
+        Zstandard, which requires ``zstandard``.
+    float_precision : integer, optional
+        If given, the number of decimal places to which floating point values
+        are saved, which is considerably faster to format; otherwise values
+        are saved in full, in the shortest form that reads back exactly.
+    header : boolean, optional
+        If ``True``, the first row of the file holds the column names.
+    '''
+
+    extension = 'csv'
+
+    #: The number of rows formatted at once.
+    rows_per_block = 65536
+
+    COMPRESSION_EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+    def __init__(self, filename, compression=None, float_precision=None, header=False):
+        if compression not in self.COMPRESSION_EXTENSIONS:
+            raise ValueError(f"compression must be None, 'gzip' or 'zstd', not {compression}.")
+        super().__init__(filename)
+        self.compression = compression
+        self.float_precision = float_precision
+        self.header = header
+        self.zstandard = (_import_optional('zstandard', 'zstd-compressed CSV')
+                          if compression == 'zstd' else None)
+        self.file = None
+        self.header_written = False
+
+    @classmethod
+    def file_extension(cls, compression=None):
+        return f'{cls.extension}{cls.COMPRESSION_EXTENSIONS.get(compression, "")}'
+
+    def open(self):
+        if self.compression == 'gzip':
+            self.file = gzip.open(self.temporary_filename, 'wb')
+        elif self.compression == 'zstd':
+            raw_file = open(self.temporary_filename, 'wb')  # pylint: disable=consider-using-with
+            self.file = self.zstandard.ZstdCompressor().stream_writer(raw_file)
+        else:
+            self.file = open(self.temporary_filename, 'wb')  # pylint: disable=consider-using-with
+
+    def write(self, columns):
+        self._write_header(list(columns))
+        columns = [np.asarray(column) for column in columns.values()]
+        for start in range(0, len(columns[0]) if columns else 0, self.rows_per_block):
+            self.file.write(_join_rows([
+                _format_column(column[start:start + self.rows_per_block], self.float_precision)
+                for column in columns]))
+
+    def write_table(self, table):
+        self._write_header(table.column_names)
+        bad_catalogue_names = _format_column(np.array(['N/A', *table.list_of_catalogue_names]))
+        for start in range(0, len(table), self.rows_per_block):
+            rows = slice(start, start + self.rows_per_block)
+            matrices = []
+            for name, column in table.columns.items():
+                column = column[rows]
+                if name == 'Bad catalogue':
+                    matrices.append(bad_catalogue_names[column.astype(np.intp) + 1])
+                elif column.dtype.kind == 'i':
+                    matrices.append(_format_ids(column))
+                else:
+                    matrices.append(_format_column(column, self.float_precision))
+            self.file.write(_join_rows(matrices))
+
+    def close(self):
+        self.file.close()
+
+    def _write_header(self, names):
+        '''
+        Write the column names, if requested and not already written.
+        '''
+        if self.header and not self.header_written:
+            line = io.StringIO()
+            csv.writer(line, lineterminator='\n').writerow(names)
+            self.file.write(line.getvalue().encode('utf-8'))
+        self.header_written = True
+
+
+class ParquetWriter(SuperMatchWriter):
+    '''
+    Save a super-match table in the Apache Parquet columnar format, with
+    one row group per block of rows written. Requires ``pyarrow``.
+
+    The compact columns of a `~birnam.SuperMatchTable` are converted to Arrow
+    arrays directly, rather than through Python objects: integer IDs are
+    saved as integers, with non-matches and absent entries as nulls, and
+    string IDs as strings, with absent entries as nulls.
+
+    Parameters
+    ----------
+    filename : string
+        Location on disk to which to save the table.
+    compression : string, optional
+        The Parquet compression codec, e.g. ``'snappy'`` or ``'zstd'``.
+    '''
+
+    extension = 'parquet'
+
+    def __init__(self, filename, compression='snappy'):
+        super().__init__(filename)
+        self.compression = 'snappy' if compression is None else compression
+        self.pa = _import_optional('pyarrow', 'Parquet')
+        self.pq = _import_optional('pyarrow.parquet', 'Parquet')
+        self.writer = None
+
+    def write(self, columns):
+        self._write_arrow(self.pa.table({name: _to_arrow(self.pa, column)
+                                         for name, column in columns.items()}))
+
+    def write_table(self, table):
+        bad_catalogue_names = self.pa.array(['N/A', *table.list_of_catalogue_names])
+        arrays = {}
+        for name, column in table.columns.items():
+            if name == 'Bad catalogue':
+                arrays[name] = bad_catalogue_names.take(column.astype(np.int64) + 1)
+            elif column.dtype.kind in 'iSU':
+                arrays[name] = _ids_to_arrow(self.pa, column)
+            else:
+                arrays[name] = self.pa.array(column)
+        self._write_arrow(self.pa.table(arrays))
+
+    def _write_arrow(self, table):
+        '''
+        Write an Arrow table as a row group, opening the file with its schema
+        if not yet open.
+        '''
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.temporary_filename, table.schema,
+                                                compression=self.compression)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class HDF5Writer(SuperMatchWriter):
+    '''
+    Save a super-match table to HDF5, with one extendable dataset per column
+    in the root group. Requires ``h5py``.
+
+    The compact columns of a `~birnam.SuperMatchTable` are saved directly,
+    rather than through Python objects: string columns as UTF-8 strings, from
+    fixed-width bytes, with absent entries as empty strings, and integer IDs
+    as integers, with non-matches and absent entries as the sentinels
+    ``birnam.table.NON_MATCH_INT`` and ``birnam.table.NO_ENTRY_INT``.
+
+    Parameters
+    ----------
+    filename : string
+        Location on disk to which to save the table.
+    compression : string, optional
+        The HDF5 filter to compress each dataset with, e.g. ``'gzip'``.
+    '''
+
+    extension = 'h5'
+
+    def __init__(self, filename, compression=None):
+        super().__init__(filename)
+        self.compression = compression
+        self.h5py = _import_optional('h5py', 'HDF5')
+        self.file = None
+
+    def open(self):
+        self.file = self.h5py.File(self.temporary_filename, 'w')
+
+    def write(self, columns):
+        for name, column in columns.items():
+            column = np.asarray(column)
+            if column.dtype == object:
+                column = np.array(['' if c is None else str(c) for c in column],
+                                  dtype=self.h5py.string_dtype())
+            self._append(name, column)
+
+    def write_table(self, table):
+        bad_catalogue_names = np.array([b'N/A', *(name.encode('utf-8') for name in
+                                                  table.list_of_catalogue_names)])
+        for name, column in table.columns.items():
+            if name == 'Bad catalogue':
+                column = bad_catalogue_names[column.astype(np.intp) + 1]
+            elif column.dtype.kind == 'U':
+                column = np.char.encode(column, 'utf-8')
+            self._append(name, column)
+
+    def _append(self, name, column):
+        '''
+        Append a block of rows to the dataset of a column, creating it if
+        needed, with bytes saved as variable-length UTF-8 strings.
+        '''
+        if name not in self.file:
+            dtype = self.h5py.string_dtype() if column.dtype.kind == 'S' else None
+            self.file.create_dataset(name, data=column, dtype=dtype, maxshape=(None,),
+                                     chunks=True, compression=self.compression)
+        else:
+            dataset = self.file[name]
+            n = dataset.shape[0]
+            dataset.resize((n + len(column),))
+            dataset[n:] = column
+
+    def close(self):
+        self.file.close()
+
+
+WRITERS = {'csv': CSVWriter, 'parquet': ParquetWriter, 'hdf5': HDF5Writer}
+
+
+def get_writer(output_format):
+    '''
+    Determine the writer class for a given output format.
+
+    Parameters
+    ----------
+    output_format : string or SuperMatchWriter subclass
+        One of ``'csv'``, ``'parquet'`` or ``'hdf5'``, or a custom subclass of
+        `~birnam.SuperMatchWriter`.
+
+    Returns
+    -------
+    writer : SuperMatchWriter subclass
+        The class with which to save super-match tables.
+    '''
+    if isinstance(output_format, type) and issubclass(output_format, SuperMatchWriter):
+        return output_format
+    if output_format not in WRITERS:
+        raise ValueError(f'output_format must be one of {", ".join(WRITERS)} or a SuperMatchWriter '
+                         f'subclass, not {output_format}.')
+    return WRITERS[output_format]
+
+
+def _import_optional(module, description):
+    '''
+    Import an optional dependency, raising an informative error if missing.
+    '''
+    try:
+        return __import__(module, fromlist=['_'])
+    except ImportError as e:
+        raise ImportError(f'{module} is required to save super-matches in {description} '
+                          'format.') from e
+
+
+def _to_arrow(pa, column):
+    '''
+    Convert a column to an Arrow array, saving Python object columns as
+    nullable strings.
+    '''
+    column = np.asarray(column)
+    if column.dtype == object:
+        return pa.array(pd.Series(column, dtype=object).astype('string'))
+    return pa.array(column)
+
+
+def _ids_to_arrow(pa, column):
+    '''
+    Convert a compact ID column to an Arrow array, with its sentinels as
+    nulls, except that non-matches in string columns are kept as ``'N/A'``.
+    '''
+    if column.dtype.kind == 'i':
+        return pa.array(column, mask=(column == NON_MATCH_INT) | (column == NO_ENTRY_INT))
+    absent = column == column.dtype.type(NO_ENTRY_BYTES.decode())
+    if column.dtype.kind == 'U':
+        return pa.array(column, type=pa.string(), mask=absent)
+    # Arrow would keep the zero bytes padding fixed-width strings, so the
+    # array is built from the bytes of each string without them.
+    lengths = np.char.str_len(column)
+    matrix = np.ascontiguousarray(column).view(np.uint8).reshape(len(column),
+                                                                  column.dtype.itemsize)
+    data = matrix[np.arange(column.dtype.itemsize) < lengths[:, np.newaxis]]
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int32)
+    validity = np.packbits(~absent, bitorder='little')
+    return pa.StringArray.from_buffers(len(column), pa.py_buffer(offsets), pa.py_buffer(data),
+                                       pa.py_buffer(validity), int(np.sum(absent)))
+
+
+def _format_column(column, float_precision=None):
+    '''
+    Format a column of values as a matrix of the UTF-8 bytes of each, one
+    row per value, padded with zero bytes.
+    '''
+    column = np.asarray(column)
+    if column.dtype.kind in 'iu':
+        return _format_integers(np.abs(column).astype(np.uint64), column < 0)
+    if column.dtype.kind == 'f' and float_precision is not None:
+        return _format_fixed_point(column, float_precision)
+    if column.dtype.kind == 'f':
+        strings = column.astype(np.bytes_)
+    elif column.dtype.kind == 'S':
+        strings = column
+    elif column.dtype.kind == 'U':
+        strings = np.char.encode(column, 'utf-8')
+    else:
+        strings = np.array([b'' if value is None else str(value).encode('utf-8')
+                            for value in column], dtype=np.bytes_)
+    strings = _quote_strings(strings)
+    return np.ascontiguousarray(strings).view(np.uint8).reshape(len(strings),
+                                                                strings.dtype.itemsize)
+
+
+def _format_ids(column):
+    '''
+    Format a compact integer ID column, writing non-matches as ``'N/A'`` and
+    absent entries as empty fields.
+    '''
+    non_match = column == NON_MATCH_INT
+    sentinel = non_match | (column == NO_ENTRY_INT)
+    matrix = _format_column(np.where(sentinel, 0, column))
+    if np.any(sentinel):
+        width = max(matrix.shape[1], len(NON_MATCH_BYTES))
+        matrix = np.pad(matrix, ((0, 0), (width - matrix.shape[1], 0)))
+        matrix[sentinel] = 0
+        matrix[non_match, -len(NON_MATCH_BYTES):] = np.frombuffer(NON_MATCH_BYTES, dtype=np.uint8)
+    return matrix
+
+
+def _format_integers(magnitudes, negative):
+    '''
+    Format integers, given as their magnitudes and signs, as a right-aligned
+    matrix of ASCII digits.
+    '''
+    n_digits = len(str(int(magnitudes.max()))) if len(magnitudes) > 0 else 1
+    matrix = np.zeros((len(magnitudes), n_digits + 1), dtype=np.uint8)
+    remaining = magnitudes.copy()
+    for k in range(n_digits):
+        # Leading zeros are left as padding, except for the units of zero.
+        digits = (remaining % 10).astype(np.uint8) + ord('0')
+        matrix[:, n_digits - k] = digits if k == 0 else np.where(remaining > 0, digits, 0)
+        remaining //= 10
+    if np.any(negative):
+        widths = np.count_nonzero(matrix[negative], axis=1)
+        matrix[np.flatnonzero(negative), n_digits - widths] = ord('-')
+    return matrix
+
+
+def _format_fixed_point(values, decimals):
+    '''
+    Format floating point values to a fixed number of decimal places.
+    '''
+    scale = 10**decimals
+    scaled = np.round(np.abs(values) * scale)
+    # Values too large for integer arithmetic, and non-finite values, are
+    # formatted one by one.
+    if not np.all(scaled < 2**63):
+        return _format_column(np.char.mod(f'%.{decimals}f', values))
+    scaled = scaled.astype(np.uint64)
+    matrices = [_format_integers(scaled // scale, np.signbit(values))]
+    if decimals > 0:
+        fraction = scaled % scale
+        matrices.append(np.full((len(values), 1), ord('.'), dtype=np.uint8))
+        digits = np.empty((len(values), decimals), dtype=np.uint8)
+        for k in range(decimals):
+            digits[:, decimals - 1 - k] = (fraction % 10).astype(np.uint8) + ord('0')
+            fraction //= 10
+        matrices.append(digits)
+    return np.concatenate(matrices, axis=1)
+
+
+def _quote_strings(strings):
+    '''
+    Quote any strings containing a comma, quote or line break.
+    '''
+    special = np.zeros(len(strings), dtype=bool)
+    for character in (b',', b'"', b'\n', b'\r'):
+        special |= np.char.find(strings, character) >= 0
+    if not np.any(special):
+        return strings
+    strings = strings.astype(object)
+    strings[special] = [b'"' + string.replace(b'"', b'""') + b'"' for string in strings[special]]
+    return strings.astype(np.bytes_)
+
+
+def _join_rows(matrices):
+    '''
+    Join formatted columns into comma-separated lines, dropping the padding.
+    '''
+    n_rows = len(matrices[0])
+    pieces = []
+    for i, matrix in enumerate(matrices):
+        separator = ord(',') if i < len(matrices) - 1 else ord('\n')
+        pieces.extend((matrix, np.full((n_rows, 1), separator, dtype=np.uint8)))
+    joined = np.concatenate(pieces, axis=1).ravel()
+    return joined[joined != 0].tobytes()
@@ -0,0 +1,124 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "cache" module.
+'''
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_equal
+
+# pylint: disable-next=import-error
+from birnam import ColumnCache, SuperMatch, read_catalogue_columns
+
+
+class TestColumnCache():
+    def setup_method(self):
+        os.system('rm -r cache_folder')
+        os.makedirs('cache_folder/inputs')
+        pd.DataFrame({0: ['a_1', 'a_2', 'a_3'], 1: [4, 5, 6], 2: [0.25, 0.5, 0.75]}).to_csv(
+            'cache_folder/inputs/table.csv', header=False, index=False)
+
+    def test_read_catalogue_columns(self):
+        cache = ColumnCache('cache_folder/cache')
+        ids, numbers, probabilities = read_catalogue_columns(
+            'cache_folder/inputs/table.csv', [0, 1, 2], dtypes={2: np.float64}, cache=cache)
+        assert len(os.listdir('cache_folder/cache')) == 3
+        assert cache.get('cache_folder/inputs/table.csv', 1) is not None
+        assert cache.get('cache_folder/inputs/table.csv', 1, np.float64) is None
+
+        # Overwrite the file, keeping its size and modification time, so that
+        # only the cached columns would give the original values.
+        stat = os.stat('cache_folder/inputs/table.csv')
+        with open('cache_folder/inputs/table.csv', 'r', encoding='utf-8') as f:
+            text = f.read()
+        with open('cache_folder/inputs/table.csv', 'w', encoding='utf-8') as f:
+            f.write(text.replace('a_', 'b_'))
+        os.utime('cache_folder/inputs/table.csv', ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        cached = read_catalogue_columns('cache_folder/inputs/table.csv', [2, 0, 1, 0],
+                                        dtypes={2: np.float64}, cache=cache)
+        assert_array_equal(cached[0], probabilities)
+        assert cached[1].dtype == object and list(cached[1]) == list(ids) == ['a_1', 'a_2', 'a_3']
+        assert cached[2].dtype == np.int64
+        assert_array_equal(cached[2], numbers)
+        assert cached[3] is cached[1]
+
+        # Any change to the file's size or modification time invalidates it.
+        os.utime('cache_folder/inputs/table.csv', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        reparsed, = read_catalogue_columns('cache_folder/inputs/table.csv', [0], cache=cache)
+        assert list(reparsed) == ['b_1', 'b_2', 'b_3']
+
+    def test_uncacheable_columns(self):
+        cache = ColumnCache('cache_folder/cache')
+        cache.put('cache_folder/inputs/table.csv', 0, None, np.array(['a', np.nan], dtype=object))
+        assert cache.get('cache_folder/inputs/table.csv', 0) is None
+        cache.put('cache_folder/inputs/missing.csv', 0, None, np.arange(3))
+        assert not os.listdir('cache_folder/cache')
+
+    def test_least_recently_used_eviction(self):
+        cache = ColumnCache('cache_folder/cache')
+        column = np.arange(100)
+        for i in range(3):
+            cache.put('cache_folder/inputs/table.csv', i, None, column)
+            time.sleep(0.01)
+        entry_size = os.path.getsize(os.path.join('cache_folder/cache',
+                                                  os.listdir('cache_folder/cache')[0]))
+        # Using the oldest entry makes the second the least recently used.
+        assert cache.get('cache_folder/inputs/table.csv', 0) is not None
+        cache.max_bytes = 3 * entry_size
+        time.sleep(0.01)
+        # Exceeding the cap reduces the cache to below it, to 2.4 entries.
+        cache.put('cache_folder/inputs/table.csv', 3, None, column)
+        assert len(os.listdir('cache_folder/cache')) == 2
+        assert [cache.get('cache_folder/inputs/table.csv', i) is not None
+                for i in range(4)] == [True, False, False, True]
+
+    def test_running_total(self):
+        column = np.arange(100)
+        ColumnCache('cache_folder/cache').put('cache_folder/inputs/table.csv', 0, None, column)
+        entry_size = os.path.getsize(os.path.join('cache_folder/cache',
+                                                  os.listdir('cache_folder/cache')[0]))
+        cache = ColumnCache('cache_folder/cache', max_bytes=5 * entry_size)
+        scans = []
+        entries = cache._entries  # pylint: disable=protected-access
+        cache._entries = lambda: scans.append(None) or entries()  # pylint: disable=protected-access
+        # The cache, with an entry saved by another instance, is counted from
+        # disk once, and then only once it is full.
+        for i in range(1, 5):
+            cache.put('cache_folder/inputs/table.csv', i, None, column)
+        assert len(scans) == 1 and len(os.listdir('cache_folder/cache')) == 5
+        cache.put('cache_folder/inputs/table.csv', 5, None, column)
+        assert len(scans) == 2 and len(os.listdir('cache_folder/cache')) == 4
+
+    def test_cached_super_match(self):
+        rng = np.random.default_rng(seed=5003)
+        for i in range(2):
+            os.makedirs(f'cache_folder/primary/chunk_{i}')
+            os.makedirs(f'cache_folder/cross_matches/cm_a/chunk_{i}')
+            chunk_ids = np.arange(20) + 20 * i
+            pd.DataFrame({0: chunk_ids}).to_csv(
+                f'cache_folder/primary/chunk_{i}/primary.csv', header=False, index=False)
+            pd.DataFrame({0: chunk_ids[:10], 1: [f'A_{x}' for x in chunk_ids[:10]],
+                          2: rng.uniform(0.5, 1, 10)}).to_csv(
+                f'cache_folder/cross_matches/cm_a/chunk_{i}/matches.csv', header=False,
+                index=False)
+            pd.DataFrame({0: chunk_ids[10:], 1: rng.uniform(0, 0.5, 10)}).to_csv(
+                f'cache_folder/cross_matches/cm_a/chunk_{i}/non_matches.csv', header=False,
+                index=False)
+        args = ['cache_folder/cross_matches', 'P', 'cache_folder/primary', 0, 'primary.csv',
+                'cache_folder/super_match', ['A'], ['cm_a'], ['matches.csv'], ['non_matches.csv'],
+                [0], [1], [2], [0], [1], 2]
+        SuperMatch(*args)
+        with open('cache_folder/super_match/chunk_1/P_super_match.csv', 'r',
+                  encoding='utf-8') as f:
+            expected = f.read()
+        for _ in range(2):
+            SuperMatch(*args, column_cache=ColumnCache('cache_folder/cache'))
+            # The primary IDs, and two and three columns of the non-match and
+            # match tables, of each chunk.
+            assert len(os.listdir('cache_folder/cache')) == 12
+            with open('cache_folder/super_match/chunk_1/P_super_match.csv', 'r',
+                      encoding='utf-8') as f:
+                assert f.read() == expected
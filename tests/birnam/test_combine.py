@@ -0,0 +1,55 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "combine" module.
+'''
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+from birnam import combine_probabilities  # pylint: disable=import-error
+
+
+class TestCombine():
+    def test_combine_probabilities(self):
+        probabilities = np.array([[0.3, 0.4, 1.0],
+                                  [0.9, 0.6, 0.8],
+                                  [0.2, 0.9, 0.2],
+                                  [0.0, 0.4, 0.5],
+                                  [1.0, 1.0, 1.0]])
+        probability, bad_catalogue, probability_without_bad = combine_probabilities(probabilities)
+        assert_allclose(probability, [0.12, 0.432, 0.036, 0, 1])
+        # The lowest probability is bad, the earliest catalogue winning ties,
+        # but only if below the threshold.
+        assert_array_equal(bad_catalogue, [0, -1, 0, 0, -1])
+        assert bad_catalogue.dtype == np.int16
+        assert_allclose(probability_without_bad, [0.4, 0.432, 0.18, 0.2, 1])
+
+        _, bad_catalogue, probability_without_bad = combine_probabilities(probabilities,
+                                                                          threshold=0.25)
+        assert_array_equal(bad_catalogue, [-1, -1, 0, 0, -1])
+        assert_allclose(probability_without_bad, [0.12, 0.432, 0.18, 0.2, 1])
+
+    def test_log_space(self):
+        rng = np.random.default_rng(17)
+        probabilities = rng.uniform(0.01, 1, (100, 5))
+        with np.errstate(divide='ignore'):
+            log_results = combine_probabilities(np.log(probabilities), log_space=True)
+        results = combine_probabilities(probabilities)
+        assert_allclose(np.exp(log_results[0]), results[0])
+        assert_array_equal(log_results[1], results[1])
+        assert_allclose(np.exp(log_results[2]), results[2])
+
+        # Sums of logarithms do not underflow where products would.
+        log_probability, _, _ = combine_probabilities(np.full((1, 400), np.log(0.1)),
+                                                      log_space=True)
+        assert_allclose(log_probability, [400 * np.log(0.1)])
+
+    def test_no_catalogues(self):
+        probability, bad_catalogue, probability_without_bad = combine_probabilities(
+            np.ones((2, 0)))
+        assert_array_equal(probability, [1, 1])
+        assert_array_equal(bad_catalogue, [-1, -1])
+        assert_array_equal(probability_without_bad, [1, 1])
+        with pytest.raises(ValueError, match='threshold must be between 0 and 1'):
+            combine_probabilities(np.ones((2, 1)), threshold=1.5)
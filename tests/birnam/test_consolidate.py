@@ -0,0 +1,84 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "consolidate" module.
+'''
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+# pylint: disable-next=import-error
+from birnam import SuperMatch, consolidate_super_match, read_super_match, select_partitions
+
+
+class TestConsolidate():
+    def setup_method(self):
+        os.system('rm -r consolidate_folder')
+        rng = np.random.default_rng(seed=2461)
+        ids = rng.permutation(1000)
+        # Chunks of very different sizes, each with IDs from across the range.
+        for i, chunk_ids in enumerate(np.split(ids, [100, 250])):
+            os.makedirs(f'consolidate_folder/primary/chunk_{i}')
+            os.makedirs(f'consolidate_folder/cross_matches/cm_a/chunk_{i}')
+            pd.DataFrame({0: chunk_ids}).to_csv(
+                f'consolidate_folder/primary/chunk_{i}/primary.csv', header=False, index=False)
+            match = rng.random(len(chunk_ids)) < 0.5
+            pd.DataFrame({0: chunk_ids[match], 1: [f'A_{x}' for x in chunk_ids[match]],
+                          2: rng.uniform(0.5, 1, np.sum(match))}).to_csv(
+                f'consolidate_folder/cross_matches/cm_a/chunk_{i}/matches.csv', header=False,
+                index=False)
+            pd.DataFrame({0: chunk_ids[~match], 1: rng.uniform(0, 0.5, np.sum(~match))}).to_csv(
+                f'consolidate_folder/cross_matches/cm_a/chunk_{i}/non_matches.csv', header=False,
+                index=False)
+        self.args = ['consolidate_folder/cross_matches', 'P', 'consolidate_folder/primary', 0,
+                     'primary.csv', 'consolidate_folder/super_match', ['A'], ['cm_a'],
+                     ['matches.csv'], ['non_matches.csv'], [0], [1], [2], [0], [1], 2]
+
+    @pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+    def test_consolidate_super_match(self, output_format):
+        pytest.importorskip('pyarrow')
+        sm = SuperMatch(*self.args, output_format=output_format)
+        statistics = consolidate_super_match(sm, 'consolidate_folder/consolidated',
+                                             rows_per_partition=300, rows_per_group=64)
+        partitions = statistics['partitions']
+        assert len(partitions) == 4
+        assert sum(partition['rows'] for partition in partitions) == 1000
+        # Partitions hold contiguous, sorted ranges of primary IDs.
+        assert partitions[0]['min_id'] == 0 and partitions[-1]['max_id'] == 999
+        assert all(a['max_id'] < b['min_id'] for a, b in zip(partitions[:-1], partitions[1:]))
+        with open('consolidate_folder/consolidated/_super_match_partitions.json', 'r',
+                  encoding='UTF-8') as f:
+            assert json.load(f) == statistics
+
+        consolidated = pd.read_parquet('consolidate_folder/consolidated')
+        assert_array_equal(consolidated['P ID'], np.arange(1000))
+        chunks = [read_super_match(sm.chunk_locations(chunk_folder)[2], statistics['columns'],
+                                   output_format) for chunk_folder in sm.chunk_folders]
+        ids = np.concatenate([chunk['P ID'] for chunk in chunks])
+        order = np.argsort(ids)
+        for name in ['A ID', 'Bad catalogue']:
+            assert list(consolidated[name]) == list(np.concatenate(
+                [chunk[name] for chunk in chunks])[order])
+        assert_allclose(consolidated['Probability'],
+                        np.concatenate([chunk['Probability'] for chunk in chunks])[order])
+        assert sum(sum(partition['probability_histogram']) for partition in partitions) == 1000
+
+        assert select_partitions('consolidate_folder/consolidated', min_id=310, max_id=320) == [
+            os.path.join('consolidate_folder/consolidated', partitions[1]['filename'])]
+        assert len(select_partitions('consolidate_folder/consolidated', min_probability=0)) == 4
+        assert not select_partitions('consolidate_folder/consolidated', min_id=1000)
+
+    def test_read_super_match(self):
+        sm = SuperMatch(*self.args, writer_options={'header': True})
+        columns = read_super_match(sm.chunk_locations('chunk_0')[2],
+                                   ['P ID', 'A ID', 'Probability', 'Bad catalogue',
+                                    'Probability without bad catalogue'], header=True)
+        assert columns['P ID'].dtype == np.int64
+        assert len(columns['A ID']) == 100
+        assert set(columns['Bad catalogue']) <= {'A', 'N/A'}
+        with pytest.raises(ValueError, match='output_format must be one of'):
+            read_super_match(sm.chunk_locations('chunk_0')[2], ['P ID'], 'fits')
@@ -0,0 +1,79 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "instrumentation" module.
+'''
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# pylint: disable-next=import-error
+from birnam import ChunkResult, CProfileHook, write_run_report
+
+# pylint: disable-next=import-error,no-name-in-module
+from birnam.instrumentation import profile_chunk, record_read, stage
+
+
+class TestInstrumentation():
+    def make_profile(self):
+        os.makedirs('instrumentation_folder', exist_ok=True)
+        with open('instrumentation_folder/a.csv', 'w', encoding='UTF-8') as f:
+            f.write('1,0.5\n2,0.25\n')
+        with profile_chunk('chunk_1') as profile:
+            with stage('load'):
+                record_read('instrumentation_folder/a.csv', 2, 0.01)
+            for _ in range(3):
+                with stage('combine'):
+                    pass
+        return profile
+
+    def test_profile_chunk(self):
+        profile = self.make_profile()
+        assert list(profile.stages) == ['load', 'combine', 'total']
+        assert profile.stages['combine']['calls'] == 3
+        assert profile.stages['total']['duration'] >= profile.stages['load']['duration']
+        assert profile.reads == [{'location': 'instrumentation_folder/a.csv', 'rows': 2,
+                                  'bytes': 13, 'duration': 0.01}]
+        # Outside a profiled chunk nothing is recorded.
+        with stage('load'):
+            record_read('instrumentation_folder/a.csv', 2, 0.01)
+        assert len(profile.reads) == 1
+
+    @pytest.mark.skipif(not os.path.exists('/proc/self/statm'), reason='requires Linux')
+    def test_stage_memory(self):
+        with profile_chunk('chunk_1') as profile:
+            with stage('heavy'):
+                heavy = np.ones(50_000_000 // 8)
+            del heavy
+            with stage('light'):
+                light = np.ones(1000)
+        assert light.sum() == 1000
+        # A stage after a heavier one records its own memory, not the peak.
+        assert profile.stages['heavy']['rss_increase'] >= 40_000_000
+        assert profile.stages['light']['rss_increase'] < 10_000_000
+
+    def test_write_run_report(self):
+        results = {'chunk_1': ChunkResult('chunk_1', 10, 0.5, profile=self.make_profile()),
+                   'chunk_2': ChunkResult('chunk_2', 20, 1.5, error='Traceback...')}
+        write_run_report(results, 'instrumentation_folder/report.json')
+        with open('instrumentation_folder/report.json', 'r', encoding='UTF-8') as f:
+            report = json.load(f)
+        # Slowest chunks come first.
+        assert [chunk['chunk'] for chunk in report['chunks']] == ['chunk_2', 'chunk_1']
+        assert not report['chunks'][0]['success'] and 'stages' not in report['chunks'][0]
+        assert [s['stage'] for s in report['chunks'][1]['stages']] == ['load', 'combine', 'total']
+
+        write_run_report(results, 'instrumentation_folder/report.csv')
+        report = pd.read_csv('instrumentation_folder/report.csv')
+        assert list(report['record']) == ['chunk', 'chunk', 'stage', 'stage', 'stage', 'read']
+        assert report['rows'].iloc[-1] == 2
+
+    def test_cprofile_hook(self):
+        hook = CProfileHook(['chunk_1'], 'instrumentation_folder/profiles')
+        assert hook('chunk_2') is None
+        with hook('chunk_1'):
+            sum(range(100))
+        assert os.path.exists('instrumentation_folder/profiles/chunk_1.prof')
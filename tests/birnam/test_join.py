@@ -0,0 +1,42 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "join" module.
+'''
+
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from birnam import PrimaryIDIndex  # pylint: disable=import-error
+
+
+class TestPrimaryIDIndex():
+    def setup_method(self):
+        rng = np.random.default_rng(seed=45345)
+        self.primary_ids = np.array([f'ID_{x}' for x in rng.choice(99999, size=500, replace=False)],
+                                    dtype=object)
+        self.index = PrimaryIDIndex(self.primary_ids)
+
+    def test_lookup(self):
+        rows = np.array([4, 0, 499, 123, 7])
+        assert_array_equal(self.index.lookup(self.primary_ids[rows]), rows)
+        assert len(self.index) == 500
+
+    def test_integer_lookup(self):
+        index = PrimaryIDIndex(np.array([10, 3, 7, 1]))
+        assert_array_equal(index.lookup(np.array([1, 10, 7])), [3, 0, 2])
+
+    def test_missing_ids(self):
+        with pytest.raises(ValueError, match='2 ID\\(s\\) in A matches are not present'):
+            self.index.lookup(np.array(['ID_-1', self.primary_ids[3], 'ID_-2'], dtype=object),
+                              'A matches')
+
+    def test_duplicate_primary_ids(self):
+        with pytest.raises(ValueError, match='1 duplicated ID'):
+            PrimaryIDIndex(np.array(['a', 'b', 'a', 'c'], dtype=object))
+
+    def test_lookup_unique(self):
+        ids = self.primary_ids[[5, 9, 5]]
+        assert_array_equal(self.index.lookup(ids), [5, 9, 5])
+        with pytest.raises(ValueError, match='appear more than once in B tables'):
+            self.index.lookup_unique(ids, 'B tables')
@@ -0,0 +1,98 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "lookup" module.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+# pylint: disable-next=import-error
+from birnam import SuperMatch, SuperMatchIndex, build_super_match_index, read_super_match
+
+
+class TestLookup():
+    def setup_method(self):
+        os.system('rm -r lookup_folder')
+        rng = np.random.default_rng(seed=8813)
+        ids = rng.permutation(1000)
+        for i, chunk_ids in enumerate(np.split(ids, [100, 250])):
+            os.makedirs(f'lookup_folder/primary/chunk_{i}')
+            os.makedirs(f'lookup_folder/cross_matches/cm_a/chunk_{i}')
+            pd.DataFrame({0: chunk_ids}).to_csv(
+                f'lookup_folder/primary/chunk_{i}/primary.csv', header=False, index=False)
+            match = rng.random(len(chunk_ids)) < 0.5
+            pd.DataFrame({0: chunk_ids[match], 1: [f'A_{x}' for x in chunk_ids[match]],
+                          2: rng.uniform(0.5, 1, np.sum(match))}).to_csv(
+                f'lookup_folder/cross_matches/cm_a/chunk_{i}/matches.csv', header=False,
+                index=False)
+            pd.DataFrame({0: chunk_ids[~match], 1: rng.uniform(0, 0.5, np.sum(~match))}).to_csv(
+                f'lookup_folder/cross_matches/cm_a/chunk_{i}/non_matches.csv', header=False,
+                index=False)
+        self.args = ['lookup_folder/cross_matches', 'P', 'lookup_folder/primary', 0,
+                     'primary.csv', 'lookup_folder/super_match', ['A'], ['cm_a'],
+                     ['matches.csv'], ['non_matches.csv'], [0], [1], [2], [0], [1], 2]
+
+    @pytest.mark.parametrize('kwargs', [{}, {'compression': 'gzip'}, {'compression': 'zstd'},
+                                        {'writer_options': {'header': True}},
+                                        {'output_format': 'parquet'}, {'output_format': 'hdf5'}])
+    def test_lookup(self, kwargs):
+        if kwargs.get('compression') == 'zstd':
+            pytest.importorskip('zstandard')
+        if kwargs.get('output_format') == 'parquet':
+            pytest.importorskip('pyarrow')
+        if kwargs.get('output_format') == 'hdf5':
+            pytest.importorskip('h5py')
+        sm = SuperMatch(*self.args, **kwargs)
+        sm.run()
+        index = build_super_match_index(sm)
+        assert len(index) == 1000
+        assert os.path.isfile('lookup_folder/super_match/super_match_index/ids.npy')
+
+        column_names = index.description['columns']
+        chunks = {chunk_folder: read_super_match(
+            sm.chunk_locations(chunk_folder)[2], column_names, sm.writer,
+            sm.writer_options.get('header', False)) for chunk_folder in sm.chunk_folders}
+        # Unknown and repeated IDs, in no particular order.
+        ids = np.array([512, 3, 1000, 999, 3, 0, -5])
+        positions, chunk_folders, rows = index.locate(ids)
+        assert_array_equal(positions, [0, 1, 3, 4, 5])
+        for position, chunk_folder, row in zip(positions, chunk_folders, rows):
+            assert chunks[chunk_folder]['P ID'][row] == ids[position]
+
+        found = index.lookup(ids)
+        assert_array_equal(found['P ID'], [512, 3, 999, 3, 0])
+        for _, row in found.iterrows():
+            chunk = next(chunk for chunk in chunks.values() if row['P ID'] in chunk['P ID'])
+            i = np.flatnonzero(chunk['P ID'] == row['P ID'])[0]
+            assert row['A ID'] == chunk['A ID'][i]
+            assert row['Bad catalogue'] == chunk['Bad catalogue'][i]
+            assert_allclose(row['Probability'], chunk['Probability'][i])
+
+        # Reopening the index from disk gives the same rows.
+        reopened = SuperMatchIndex('lookup_folder/super_match/super_match_index')
+        assert reopened.lookup(ids).equals(found)
+        assert len(index.lookup(np.array(['not an ID']))) == 0
+
+    def test_lookup_many(self):
+        sm = SuperMatch(*self.args)
+        sm.run()
+        index = build_super_match_index(sm, n_pool=1)
+        ids = np.random.default_rng(seed=7).permutation(1000)[:600]
+        found = index.lookup(ids)
+        assert_array_equal(found['P ID'], ids)
+        assert set(found['A ID'].dropna()) <= {'N/A', *(f'A_{x}' for x in ids)}
+
+    def test_stale_index(self):
+        sm = SuperMatch(*self.args)
+        sm.run()
+        index = build_super_match_index(sm)
+        index.lookup(np.array([0]))
+        _, chunk_folders, _ = index.locate(np.array([0]))
+        with open(sm.chunk_locations(chunk_folders[0])[2], 'a', encoding='utf-8') as f:
+            f.write('1000,,0.5,N/A,0.5\n')
+        with pytest.raises(RuntimeError, match='rebuild it with build_super_match_index'):
+            index.lookup(np.array([0]))
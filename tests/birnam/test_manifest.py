@@ -0,0 +1,48 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "manifest" module.
+'''
+
+import os
+
+import numpy as np
+
+from birnam import RunManifest, fingerprint_files  # pylint: disable=import-error
+
+
+class TestManifest():
+    def setup_method(self):
+        os.system('rm -r manifest_folder')
+        os.makedirs('manifest_folder', exist_ok=True)
+        for name in ['input.csv', 'output.csv']:
+            with open(f'manifest_folder/{name}', 'w', encoding='UTF-8') as f:
+                f.write('ID_1,0.5\n')
+
+    def test_fingerprint_files(self):
+        stat = fingerprint_files(['manifest_folder/input.csv', 'manifest_folder/missing.csv'])
+        assert stat['manifest_folder/input.csv']['size'] == 9
+        assert stat['manifest_folder/missing.csv'] is None
+        hashes = fingerprint_files(['manifest_folder/input.csv'], hash_contents=True, n_threads=2)
+        assert len(hashes['manifest_folder/input.csv']['sha256']) == 64
+
+    def test_record_and_reload(self):
+        parameters = {'names': np.array(['A', 'B']), 'column': np.int64(2)}
+        inputs = fingerprint_files(['manifest_folder/input.csv'])
+        manifest = RunManifest('manifest_folder/manifest.jsonl')
+        assert not manifest.is_current('chunk_0', inputs, parameters, 'manifest_folder/output.csv')
+        manifest.record('chunk_0', inputs, parameters, 'manifest_folder/output.csv')
+        # Simulate a run killed part-way through writing an entry.
+        with open('manifest_folder/manifest.jsonl', 'a', encoding='UTF-8') as f:
+            f.write('{"chunk": "chunk_1", "inp')
+
+        manifest = RunManifest('manifest_folder/manifest.jsonl')
+        assert list(manifest.chunks) == ['chunk_0']
+        assert manifest.is_current('chunk_0', inputs, parameters, 'manifest_folder/output.csv')
+        assert not manifest.is_current('chunk_0', inputs, {**parameters, 'column': 3},
+                                       'manifest_folder/output.csv')
+        with open('manifest_folder/input.csv', 'a', encoding='UTF-8') as f:
+            f.write('ID_2,0.25\n')
+        assert not manifest.is_current('chunk_0', fingerprint_files(['manifest_folder/input.csv']),
+                                       parameters, 'manifest_folder/output.csv')
+        os.remove('manifest_folder/output.csv')
+        assert not manifest.is_current('chunk_0', inputs, parameters, 'manifest_folder/output.csv')
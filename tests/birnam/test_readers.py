@@ -0,0 +1,90 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "readers" module.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+# pylint: disable-next=import-error
+from birnam import determine_input_format, iter_catalogue_columns, read_catalogue_columns
+
+
+class TestReaders():
+    def setup_method(self):
+        os.makedirs('readers_folder', exist_ok=True)
+        self.primary_ids = np.array(['ID_1', 'ID_2', 'ID_3'])
+        self.secondary_ids = np.array([5, 17, 9])
+        self.probs = np.array([0.25, 0.5, 1])
+
+    def check_columns(self, loc, input_format=None):
+        pid, sid, prob = read_catalogue_columns(loc, [0, 1, 2], dtypes={2: np.float64},
+                                                input_format=input_format)
+        assert list(pid) == list(self.primary_ids)
+        assert sid.dtype == np.int64
+        assert_array_equal(sid, self.secondary_ids)
+        assert prob.dtype == np.float64
+        assert_allclose(prob, self.probs)
+
+    def test_determine_input_format(self):
+        assert determine_input_format('a/b/matches.csv') == 'csv'
+        assert determine_input_format('a/b/matches.txt') == 'csv'
+        assert determine_input_format('a/b/matches.npy') == 'npy'
+        assert determine_input_format('a/b/matches.FITS') == 'fits'
+        assert determine_input_format('a/b/matches.parquet') == 'parquet'
+
+    def test_csv(self):
+        with open('readers_folder/matches.dat', 'w', encoding='UTF-8') as file:
+            file.write('ID_1,5,0.25\nID_2,17,0.5\nID_3,9,1\n')
+        self.check_columns('readers_folder/matches.dat')
+        sid, = read_catalogue_columns('readers_folder/matches.dat', [1], input_format='csv')
+        assert_array_equal(sid, self.secondary_ids)
+
+    def test_npy(self):
+        structured = np.empty(3, dtype=[('pid', 'S4'), ('sid', np.int32), ('p', np.float64)])
+        structured['pid'] = self.primary_ids
+        structured['sid'] = self.secondary_ids
+        structured['p'] = self.probs
+        np.save('readers_folder/structured.npy', structured)
+        self.check_columns('readers_folder/structured.npy')
+
+        np.save('readers_folder/two_d.npy', np.array([[3, 1, 0.5], [4, 2, 0.25]]))
+        _, prob = read_catalogue_columns('readers_folder/two_d.npy', [0, 2], dtypes={2: np.float64})
+        # Probabilities already of the requested type are memory-mapped, not copied.
+        assert isinstance(prob.base, np.memmap)
+        assert_allclose(prob, [0.5, 0.25])
+
+    def test_parquet(self):
+        pytest.importorskip('pyarrow')
+        pd.DataFrame({'pid': self.primary_ids, 'sid': self.secondary_ids, 'p': self.probs}).to_parquet(
+            'readers_folder/matches.parquet')
+        self.check_columns('readers_folder/matches.parquet')
+
+    def test_fits(self):
+        fits = pytest.importorskip('astropy.io.fits')
+        hdu = fits.BinTableHDU.from_columns([
+            fits.Column(name='pid', format='4A', array=self.primary_ids),
+            fits.Column(name='sid', format='J', array=self.secondary_ids),
+            fits.Column(name='p', format='D', array=self.probs)])
+        hdu.writeto('readers_folder/matches.fits', overwrite=True)
+        self.check_columns('readers_folder/matches.fits')
+
+    def test_iter_catalogue_columns(self):
+        with open('readers_folder/matches.csv', 'w', encoding='UTF-8') as file:
+            file.write('ID_1,5,0.25\nID_2,17,0.5\nID_3,9,1\n')
+        np.save('readers_folder/two_d.npy', np.array([[3, 1, 0.5], [4, 2, 0.25], [5, 3, 1]]))
+        for loc in ['readers_folder/matches.csv', 'readers_folder/two_d.npy']:
+            blocks = list(iter_catalogue_columns(loc, [1, 2], 2, dtypes={2: np.float64}))
+            assert [len(block[0]) for block in blocks] == [2, 1]
+            assert blocks[1][1].dtype == np.float64
+        with open('readers_folder/empty.csv', 'w', encoding='UTF-8') as file:
+            file.write('')
+        assert not list(iter_catalogue_columns('readers_folder/empty.csv', [0], 2))
+
+    def test_bad_input_format(self):
+        with pytest.raises(ValueError, match='input_format must be one of'):
+            read_catalogue_columns('readers_folder/matches.csv', [0], input_format='votable')
@@ -0,0 +1,103 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "scheduler" module.
+'''
+
+import os
+import time
+
+import pytest
+
+# pylint: disable-next=import-error
+from birnam import ChunkResult, estimate_chunk_cost, estimate_chunk_memory, run_chunks, schedule_chunks
+
+
+class _TimedSuperMatch():
+    '''
+    Stand-in for a SuperMatch, recording when each chunk runs.
+    '''
+    list_of_catalogue_names = ['A']
+
+    def chunk_input_files(self, chunk_folder):
+        return [f'scheduler_folder/{chunk_folder}.csv']
+
+    def single_chunk_super_match(self, chunk_folder):
+        start = time.time()
+        time.sleep(0.2)
+        if chunk_folder == 'failing':
+            raise RuntimeError('Simulated failure.')
+        if chunk_folder == 'killed':
+            # As if killed for running out of memory.
+            os._exit(1)
+        with open(f'scheduler_folder/{chunk_folder}.times', 'w', encoding='UTF-8') as f:
+            f.write(f'{start} {time.time()}')
+
+
+class TestScheduler():
+    def test_estimate_chunk_cost(self):
+        os.makedirs('scheduler_folder', exist_ok=True)
+        for name, size in [('a.csv', 10), ('b.csv', 25)]:
+            with open(f'scheduler_folder/{name}', 'w', encoding='UTF-8') as f:
+                f.write('x' * size)
+        assert estimate_chunk_cost(['scheduler_folder/a.csv', 'scheduler_folder/b.csv',
+                                    'scheduler_folder/missing.csv']) == 35
+
+    def test_schedule_chunks(self):
+        costs = {'chunk_1': 10, 'chunk_2': 500, 'chunk_3': 10, 'chunk_4': 70}
+        assert schedule_chunks(costs) == ['chunk_2', 'chunk_4', 'chunk_1', 'chunk_3']
+
+    def test_chunk_result(self):
+        assert ChunkResult('chunk_1', 10, 0.5).success
+        result = ChunkResult('chunk_1', 10, 0.5, error='Traceback...')
+        assert not result.success
+        assert 'failed' in repr(result)
+
+    def test_estimate_chunk_memory(self):
+        os.makedirs('scheduler_folder', exist_ok=True)
+        for name, size in [('p.csv', 100), ('m.csv', 300), ('n.csv', 50)]:
+            with open(f'scheduler_folder/{name}', 'w', encoding='UTF-8') as f:
+                f.write('x' * size)
+        # Parsing the larger of the primary catalogue and the cross-match,
+        # plus a table of the primary objects in each of two catalogues.
+        assert estimate_chunk_memory(['scheduler_folder/p.csv', 'scheduler_folder/m.csv',
+                                      'scheduler_folder/n.csv'], 2) == 4 * 350 + 100 * 3
+        assert estimate_chunk_memory(['scheduler_folder/p.csv'], 0) == 4 * 100 + 100
+
+    def test_memory_budgeted_run(self):
+        os.system('rm -r scheduler_folder')
+        os.makedirs('scheduler_folder')
+        # Each small chunk is estimated to need 600 bytes, and the large one
+        # 6000, more than the whole budget.
+        for name, size in [('small_1', 100), ('small_2', 100), ('small_3', 100),
+                           ('large', 1000), ('failing', 10)]:
+            with open(f'scheduler_folder/{name}.csv', 'w', encoding='UTF-8') as f:
+                f.write('x' * size)
+        # The large chunk is the cheapest, so would otherwise be started last.
+        costs = {'small_1': 2, 'small_2': 2, 'small_3': 2, 'large': 1}
+        results = []
+        outcomes = run_chunks(_TimedSuperMatch(), costs, 3, callback=results.append,
+                              memory_budget=1300)
+        assert sorted(outcomes) == sorted(costs) and len(results) == 4
+        assert all(result.success for result in results)
+        times = {}
+        for name in costs:
+            with open(f'scheduler_folder/{name}.times', 'r', encoding='UTF-8') as f:
+                times[name] = [float(t) for t in f.read().split()]
+        # The large chunk ran first, and alone, and at most two small chunks
+        # at once.
+        assert all(times['large'][1] <= times[name][0] for name in costs if name != 'large')
+        for name in costs:
+            running = [other for other in costs if times[other][0] <= times[name][0] < times[other][1]]
+            assert len(running) <= (1 if name == 'large' else 2)
+            assert name == 'large' or not times['large'][0] <= times[name][0] < times['large'][1]
+
+        outcomes = run_chunks(_TimedSuperMatch(), {'failing': 1, 'small_1': 1}, 2,
+                              memory_budget=10**6)
+        assert not outcomes['failing'].success and 'Simulated failure' in outcomes['failing'].error
+        assert outcomes['small_1'].success
+        outcomes = run_chunks(_TimedSuperMatch(), {'killed': 1, 'small_1': 1}, 2,
+                              memory_budget=10**6)
+        assert not outcomes['killed'].success and 'exited unexpectedly' in outcomes['killed'].error
+        assert outcomes['small_1'].success
+        with pytest.raises(ValueError, match='memory_budget is not supported'):
+            run_chunks(_TimedSuperMatch(), costs, 2, n_io_threads=2, memory_budget=10**6)
@@ -0,0 +1,66 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "sharding" module.
+'''
+
+import os
+
+import pytest
+
+# pylint: disable-next=import-error
+from birnam import ChunkResult, shard_chunks, shard_from_environment, verify_shards
+
+# pylint: disable-next=import-error,no-name-in-module
+from birnam.sharding import remove_shard_marker, write_shard_marker
+
+
+class TestSharding():
+    def setup_method(self):
+        os.system('rm -r sharding_folder')
+
+    def test_shard_chunks(self):
+        chunk_folders = [f'chunk_{i}' for i in range(10)]
+        shards = [shard_chunks(chunk_folders, rank, 3) for rank in range(3)]
+        assert sorted(sum(shards, [])) == sorted(chunk_folders)
+        assert [len(shard) for shard in shards] == [4, 3, 3]
+        # The assignment does not depend on the order the chunks are listed in.
+        assert shard_chunks(chunk_folders[::-1], 1, 3) == shards[1]
+        with pytest.raises(ValueError, match='between 0 and 2'):
+            shard_chunks(chunk_folders, 3, 3)
+
+    def test_shard_from_environment(self):
+        assert shard_from_environment({'SLURM_ARRAY_TASK_ID': '5', 'SLURM_ARRAY_TASK_MIN': '1',
+                                       'SLURM_ARRAY_TASK_COUNT': '8'}) == (4, 8)
+        assert shard_from_environment({'OMPI_COMM_WORLD_RANK': '2',
+                                       'OMPI_COMM_WORLD_SIZE': '4'}) == (2, 4)
+        # Explicit settings take precedence over those of the scheduler.
+        assert shard_from_environment({'BIRNAM_SHARD_RANK': '0', 'BIRNAM_SHARD_SIZE': '2',
+                                       'SLURM_PROCID': '3', 'SLURM_NTASKS': '4'}) == (0, 2)
+        with pytest.raises(ValueError, match='No shard rank and size'):
+            shard_from_environment({'SLURM_PROCID': '3'})
+
+    def test_verify_shards(self):
+        chunk_folders = ['chunk_0', 'chunk_1', 'chunk_2']
+        write_shard_marker('sharding_folder', 0, 2, {
+            'chunk_0': ChunkResult('chunk_0', 1, 0.1),
+            'chunk_2': ChunkResult('chunk_2', 1, 0, skipped=True)})
+        with pytest.raises(RuntimeError, match='shard 1 of 2 has not completed'):
+            verify_shards('sharding_folder', chunk_folders, 2)
+        write_shard_marker('sharding_folder', 1, 2, {
+            'chunk_1': ChunkResult('chunk_1', 1, 0.1, error='Traceback...')})
+        with pytest.raises(RuntimeError, match='chunks failed: chunk_1'):
+            verify_shards('sharding_folder', chunk_folders, 2)
+        write_shard_marker('sharding_folder', 1, 2, {'chunk_1': ChunkResult('chunk_1', 1, 0.1)})
+        assert verify_shards('sharding_folder', chunk_folders, 2) == {
+            'chunk_0': 'succeeded', 'chunk_1': 'succeeded', 'chunk_2': 'skipped'}
+        with pytest.raises(RuntimeError, match='not run by any shard: chunk_3'):
+            verify_shards('sharding_folder', chunk_folders + ['chunk_3'], 2)
+
+    def test_remove_shard_marker(self):
+        write_shard_marker('sharding_folder', 0, 1, {'chunk_0': ChunkResult('chunk_0', 1, 0.1)})
+        assert verify_shards('sharding_folder', ['chunk_0'], 1) == {'chunk_0': 'succeeded'}
+        remove_shard_marker('sharding_folder', 0, 1)
+        with pytest.raises(RuntimeError, match='shard 0 of 1 has not completed'):
+            verify_shards('sharding_folder', ['chunk_0'], 1)
+        # Removing a marker that does not exist is not an error.
+        remove_shard_marker('sharding_folder', 0, 1)
@@ -0,0 +1,46 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "streaming" module.
+'''
+
+import os
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from birnam import SpillFile, hash_partition, scatter_to_spill  # pylint: disable=import-error
+
+
+class TestStreaming():
+    def setup_method(self):
+        os.system('rm -r streaming_folder')
+        os.makedirs('streaming_folder', exist_ok=True)
+
+    def test_hash_partition(self):
+        ids = np.array([f'ID_{i}' for i in range(1000)], dtype=object)
+        partitions = hash_partition(ids, 7)
+        assert np.all((partitions >= 0) & (partitions < 7))
+        assert len(np.unique(partitions)) == 7
+        # The same ID always lands in the same partition, whatever its block.
+        assert_array_equal(hash_partition(ids[500:], 7), partitions[500:])
+        assert_array_equal(hash_partition(np.arange(10), 1), np.zeros(10))
+
+    def test_spill_file(self):
+        spill = SpillFile('streaming_folder/spill.npy',
+                          [np.empty(0, dtype=object), np.empty(0, dtype=float)])
+        ids, probs = spill.read()
+        assert len(ids) == 0 and probs.dtype == float
+        spill.append([np.array(['a', 'b'], dtype=object), np.array([0.1, 0.2])])
+        spill.append([np.array(['c'], dtype=object), np.array([0.3])])
+        ids, probs = spill.read()
+        assert list(ids) == ['a', 'b', 'c']
+        assert_array_equal(probs, [0.1, 0.2, 0.3])
+
+    def test_scatter_to_spill(self):
+        spills = [SpillFile(f'streaming_folder/part_{k}.npy', [np.empty(0, dtype=int)])
+                  for k in range(3)]
+        values = np.arange(10)
+        scatter_to_spill([values], values % 3, spills)
+        scatter_to_spill([values + 10], (values + 10) % 3, spills)
+        for k in range(3):
+            assert_array_equal(spills[k].read()[0], np.arange(k, 20, 3))
@@ -3,12 +3,18 @@
 Tests for the "super_match" module.
 '''
 
+import json
 import os
+import shutil
+import sys
 
 import numpy as np
+import pandas as pd
+import pytest
 from numpy.testing import assert_allclose
 
-from birnam import SuperMatch  # pylint: disable=import-error
+# pylint: disable-next=import-error
+from birnam import CProfileHook, SuperMatch, combine_super_match, launch_local_shards
 
 
 class TestSuperMatch():
@@ -40,7 +46,7 @@ class TestSuperMatch():
             with open(f'{folder}/non_matches.csv', 'w', encoding='UTF-8') as file:
                 file.write(text)
 
-    def test_good_run(self):
+    def make_good_run_inputs(self):
         # pylint: disable-next=fixme
         # TODO: pad the make_match_inputs_outputs with fake astrometry/photometry to change
         # which column each ID is.
@@ -76,6 +82,10 @@ class TestSuperMatch():
                     [primary_id[n_matches:], probs[n_matches:]], n_nonmatches)
             secondary_ids.append(_2nd_ids)
             probabilities.append(_probs)
+        return primary_ids, secondary_ids, probabilities
+
+    def test_good_run(self):
+        primary_ids, secondary_ids, probabilities = self.make_good_run_inputs()
 
         SuperMatch('top_level_folder', 'primary_cat', 'catalogue_folder', 1, 'primary_catalogue.csv',
                    'super_match_save_folder', ['A', 'B'], ['cm_1', 'cm_2'], ['matches.csv', 'matches.csv'],
@@ -101,3 +111,339 @@ class TestSuperMatch():
                         assert id2 == 'N/A'
                     assert_allclose(float(p),
                                     float(probabilities[i][0][j])*float(probabilities[i][1][j]))
+
+    def test_load_catalogue_columns(self):
+        os.makedirs('load_columns_folder', exist_ok=True)
+        with open('load_columns_folder/matches.csv', 'w', encoding='UTF-8') as file:
+            file.write('ID_1,5,0.25\nID_2,17,0.5\nID_3,9,1\n')
+        with open('load_columns_folder/empty.csv', 'w', encoding='UTF-8') as file:
+            file.write('')
+        # Bypass __init__, which would run a full super-match.
+        sm = SuperMatch.__new__(SuperMatch)
+        sm.input_format = None
+        sm.column_cache = None
+        pid, sid, prob = sm.load_catalogue_columns('load_columns_folder/matches.csv', [0, 1, 2],
+                                                   dtypes={2: np.float64})
+        assert list(pid) == ['ID_1', 'ID_2', 'ID_3']
+        assert sid.dtype == np.int64 and list(sid) == [5, 17, 9]
+        assert prob.dtype == np.float64
+        assert_allclose(prob, [0.25, 0.5, 1])
+        assert list(sm.load_catalogue_column('load_columns_folder/matches.csv', 1)) == [5, 17, 9]
+        pid, prob = sm.load_catalogue_columns('load_columns_folder/empty.csv', [0, 1],
+                                              dtypes={1: np.float64})
+        assert len(pid) == 0 and len(prob) == 0
+
+    @pytest.mark.parametrize('output_format,compression,filename,writer_options',
+                             [('csv', 'gzip', 'primary_cat_super_match.csv.gz', None),
+                              ('csv', None, 'primary_cat_super_match.csv',
+                               {'header': True, 'float_precision': 12}),
+                              ('parquet', None, 'primary_cat_super_match.parquet', None)])
+    def test_output_formats(self, output_format, compression, filename, writer_options):
+        if output_format == 'parquet':
+            pytest.importorskip('pyarrow')
+        primary_ids, _, probabilities = self.make_good_run_inputs()
+        SuperMatch('top_level_folder', 'primary_cat', 'catalogue_folder', 1, 'primary_catalogue.csv',
+                   'super_match_save_folder', ['A', 'B'], ['cm_1', 'cm_2'], ['matches.csv', 'matches.csv'],
+                   ['non_matches.csv', 'non_matches.csv'], [0, 0], [1, 1], [2, 2], [0, 0], [1, 1], 2,
+                   output_format=output_format, compression=compression,
+                   writer_options=writer_options)
+        for i in range(3):
+            if output_format == 'parquet':
+                x = pd.read_parquet(f'super_match_save_folder/chunk_{i}/{filename}')
+            elif writer_options is not None:
+                x = pd.read_csv(f'super_match_save_folder/chunk_{i}/{filename}')
+            else:
+                x = pd.read_csv(f'super_match_save_folder/chunk_{i}/{filename}', header=None,
+                                names=['primary_cat ID', 'A ID', 'B ID', 'Probability',
+                                       'Bad catalogue', 'Probability without bad catalogue'])
+            assert list(x['primary_cat ID']) == primary_ids[i]
+            assert_allclose(x['Probability'], probabilities[i][0] * probabilities[i][1])
+
+    def test_streaming_run(self):
+        self.make_good_run_inputs()
+        args = ['top_level_folder', 'primary_cat', 'catalogue_folder', 1, 'primary_catalogue.csv',
+                'super_match_save_folder', ['A', 'B'], ['cm_1', 'cm_2'], ['matches.csv', 'matches.csv'],
+                ['non_matches.csv', 'non_matches.csv'], [0, 0], [1, 1], [2, 2], [0, 0], [1, 1], 2]
+        SuperMatch(*args)
+        in_memory = {}
+        for i in range(3):
+            with open(f'super_match_save_folder/chunk_{i}/primary_cat_super_match.csv', 'r',
+                      encoding='UTF-8') as f:
+                in_memory[i] = f.read()
+        # Blocks much smaller than each chunk force several partitions.
+        SuperMatch(*args, block_size=4)
+        for i in range(3):
+            with open(f'super_match_save_folder/chunk_{i}/primary_cat_super_match.csv', 'r',
+                      encoding='UTF-8') as f:
+                assert f.read() == in_memory[i]
+            assert os.listdir(f'super_match_save_folder/chunk_{i}') == ['primary_cat_super_match.csv']
+
+        # IDs that are mostly integers, but strings in some blocks, must be
+        # read, and saved, as strings in every block of every file.
+        os.system('rm -r streaming_folder')
+        os.makedirs('streaming_folder/primary/chunk_0')
+        os.makedirs('streaming_folder/cross_matches/cm_a/chunk_0')
+        ids = np.array([*(str(x) for x in range(30)), 'X1', 'X2'], dtype=object)
+        # Each table holds one of the string IDs, amongst blocks of integers.
+        rng = np.random.default_rng(seed=2117)
+        order = np.concatenate((rng.permutation(np.arange(0, 32, 2)),
+                                rng.permutation(np.arange(1, 32, 2))))
+        pd.DataFrame({0: ids}).to_csv('streaming_folder/primary/chunk_0/primary.csv', header=False,
+                                      index=False)
+        pd.DataFrame({0: ids[order[:16]], 1: [f'A_{x}' if x == order[9] else x for x in order[:16]],
+                      2: np.linspace(0.5, 1, 16)}).to_csv(
+            'streaming_folder/cross_matches/cm_a/chunk_0/matches.csv', header=False, index=False)
+        pd.DataFrame({0: ids[order[16:]], 1: np.linspace(0, 0.5, 16)}).to_csv(
+            'streaming_folder/cross_matches/cm_a/chunk_0/non_matches.csv', header=False, index=False)
+        args = ['streaming_folder/cross_matches', 'P', 'streaming_folder/primary', 0, 'primary.csv',
+                'streaming_folder/super_match', ['A'], ['cm_a'], ['matches.csv'], ['non_matches.csv'],
+                [0], [1], [2], [0], [1], 1]
+        SuperMatch(*args)
+        with open('streaming_folder/super_match/chunk_0/P_super_match.csv', 'r', encoding='UTF-8') as f:
+            in_memory = f.read()
+        SuperMatch(*args, block_size=8)
+        with open('streaming_folder/super_match/chunk_0/P_super_match.csv', 'r', encoding='UTF-8') as f:
+            assert f.read() == in_memory
+        pq = pytest.importorskip('pyarrow.parquet')
+        SuperMatch(*args, output_format='parquet')
+        in_memory = pq.read_table('streaming_folder/super_match/chunk_0/P_super_match.parquet')
+        SuperMatch(*args, output_format='parquet', block_size=2)
+        assert pq.read_table('streaming_folder/super_match/chunk_0/P_super_match.parquet').equals(
+            in_memory)
+
+    def test_failed_chunk_reporting(self):
+        self.make_good_run_inputs()
+        os.remove('top_level_folder/cm_2/chunk_1/matches.csv')
+        results = []
+        with pytest.raises(RuntimeError, match='1 of 3 chunks failed:\nchunk_1:'):
+            SuperMatch('top_level_folder', 'primary_cat', 'catalogue_folder', 1,
+                       'primary_catalogue.csv', 'super_match_save_folder', ['A', 'B'], ['cm_1', 'cm_2'],
+                       ['matches.csv', 'matches.csv'], ['non_matches.csv', 'non_matches.csv'],
+                       [0, 0], [1, 1], [2, 2], [0, 0], [1, 1], 2, progress_callback=results.append)
+        assert sorted(result.chunk_folder for result in results) == ['chunk_0', 'chunk_1', 'chunk_2']
+        failed, = [result for result in results if not result.success]
+        assert failed.chunk_folder == 'chunk_1' and 'FileNotFoundError' in failed.error
+        # The other chunks still ran to completion.
+        assert os.path.exists('super_match_save_folder/chunk_0/primary_cat_super_match.csv')
+        assert os.path.exists('super_match_save_folder/chunk_2/primary_cat_super_match.csv')
+
+    def test_memory_budgeted_run(self):
+        self.make_good_run_inputs()
+        args = ['top_level_folder', 'primary_cat', 'catalogue_folder', 1, 'primary_catalogue.csv',
+                'super_match_save_folder', ['A', 'B'], ['cm_1', 'cm_2'],
+                ['matches.csv', 'matches.csv'], ['non_matches.csv', 'non_matches.csv'], [0, 0],
+                [1, 1], [2, 2], [0, 0], [1, 1], 2]
+        SuperMatch(*args)
+        sequential = {}
+        for i in range(3):
+            with open(f'super_match_save_folder/chunk_{i}/primary_cat_super_match.csv', 'r',
+                      encoding='UTF-8') as f:
+                sequential[i] = f.read()
+        shutil.rmtree('super_match_save_folder')
+
+        # A budget too small for any chunk runs each alone, with the same output.
+        sm = SuperMatch(*args, memory_budget=1)
+        assert all(result.success for result in sm.chunk_results.values())
+        for i in range(3):
+            with open(f'super_match_save_folder/chunk_{i}/primary_cat_super_match.csv', 'r',
+                      encoding='UTF-8') as f:
+                assert f.read() == sequential[i]
+
+        os.remove('top_level_folder/cm_2/chunk_1/matches.csv')
+        with pytest.raises(RuntimeError, match='1 of 3 chunks failed:\nchunk_1:'):
+            SuperMatch(*args, memory_budget=10**9)
+        with pytest.raises(ValueError, match='memory_budget is not supported'):
+            SuperMatch(*args, n_io_threads=2, memory_budget=10**9)
+
+    def test_resume(self):
+        self.make_good_run_inputs()
+        args = ['top_level_folder', 'primary_cat', 'catalogue_folder', 1, 'primary_catalogue.csv',
+                'super_match_save_folder', ['A', 'B'], ['cm_1', 'cm_2'], ['matches.csv', 'matches.csv'],
+                ['non_matches.csv', 'non_matches.csv'], [0, 0], [1, 1], [2, 2], [0, 0], [1, 1], 2]
+        SuperMatch(*args)
+        results = []
+        SuperMatch(*args, resume=True, progress_callback=results.append)
+        assert all(result.skipped for result in results) and len(results) == 3
+
+        # Changing an input of one chunk, or removing the output of another,
+        # re-runs only those chunks.
+        with open('top_level_folder/cm_1/chunk_1/non_matches.csv', 'a', encoding='UTF-8') as f:
+            f.write('\n')
+        os.remove('super_match_save_folder/chunk_2/primary_cat_super_match.csv')
+        results = []
+        SuperMatch(*args, resume=True, progress_callback=results.append)
+        assert sorted(result.chunk_folder for result in results if not result.skipped) == [
+            'chunk_1', 'chunk_2']
+        assert os.path.exists('super_match_save_folder/chunk_2/primary_cat_super_match.csv')
+
+        # As does changing the parameters.
+        results = []
+        SuperMatch(*args, resume=True, compression='gzip', progress_callback=results.append)
+        assert not any(result.skipped for result in results)
+
+    def test_append_catalogue(self):
+        self.make_good_run_inputs()
+        args = ['top_level_folder', 'primary_cat', 'catalogue_folder', 1, 'primary_catalogue.csv',
+                'super_match_save_folder']
+        SuperMatch(*args, ['A', 'B'], ['cm_1', 'cm_2'], ['matches.csv', 'matches.csv'],
+                   ['non_matches.csv', 'non_matches.csv'], [0, 0], [1, 1], [2, 2], [0, 0], [1, 1], 2)
+        full = {}
+        for i in range(3):
+            with open(f'super_match_save_folder/chunk_{i}/primary_cat_super_match.csv', 'r',
+                      encoding='UTF-8') as f:
+                full[i] = f.read()
+
+        # Creating the super-match from A alone, then appending B, must give
+        # the same table as creating it from both at once.
+        SuperMatch(*args, ['A'], ['cm_1'], ['matches.csv'], ['non_matches.csv'], [0], [1], [2], [0],
+                   [1], 2, save_state=True)
+        assert os.path.exists('super_match_save_folder/chunk_0/primary_cat_super_match_state.npz')
+        SuperMatch(*args, ['B'], ['cm_2'], ['matches.csv'], ['non_matches.csv'], [0], [1], [2], [0],
+                   [1], 2, append=True)
+        for i in range(3):
+            with open(f'super_match_save_folder/chunk_{i}/primary_cat_super_match.csv', 'r',
+                      encoding='UTF-8') as f:
+                assert f.read() == full[i]
+
+        # Catalogues already in the super-match cannot be appended again.
+        with pytest.raises(RuntimeError, match='3 of 3 chunks failed'):
+            SuperMatch(*args, ['B'], ['cm_2'], ['matches.csv'], ['non_matches.csv'], [0], [1], [2],
+                       [0], [1], 2, append=True)
+
+    def test_pipelined_run(self):
+        self.make_good_run_inputs()
+        args = ['top_level_folder', 'primary_cat', 'catalogue_folder', 1, 'primary_catalogue.csv',
+                'super_match_save_folder', ['A', 'B'], ['cm_1', 'cm_2'], ['matches.csv', 'matches.csv'],
+                ['non_matches.csv', 'non_matches.csv'], [0, 0], [1, 1], [2, 2], [0, 0], [1, 1], 2]
+        SuperMatch(*args)
+        sequential = {}
+        for i in range(3):
+            with open(f'super_match_save_folder/chunk_{i}/primary_cat_super_match.csv', 'r',
+                      encoding='UTF-8') as f:
+                sequential[i] = f.read()
+        shutil.rmtree('super_match_save_folder')
+
+        # A single worker runs every chunk through one pipeline, prefetching
+        # and saving in the background.
+        SuperMatch(*args[:-1], 1, n_io_threads=2)
+        for i in range(3):
+            with open(f'super_match_save_folder/chunk_{i}/primary_cat_super_match.csv', 'r',
+                      encoding='UTF-8') as f:
+                assert f.read() == sequential[i]
+
+        # A failed load is reported without stopping the pipeline.
+        os.remove('top_level_folder/cm_2/chunk_1/matches.csv')
+        results = []
+        with pytest.raises(RuntimeError, match='1 of 3 chunks failed:\nchunk_1:'):
+            SuperMatch(*args, n_io_threads=2, progress_callback=results.append)
+        assert sorted(result.chunk_folder for result in results) == ['chunk_0', 'chunk_1', 'chunk_2']
+        failed, = [result for result in results if not result.success]
+        assert 'FileNotFoundError' in failed.error
+
+        with pytest.raises(ValueError, match='n_io_threads is not supported'):
+            SuperMatch(*args, n_io_threads=2, block_size=4)
+
+    def test_instrumented_run(self):
+        self.make_good_run_inputs()
+        sm = SuperMatch('top_level_folder', 'primary_cat', 'catalogue_folder', 1,
+                        'primary_catalogue.csv', 'super_match_save_folder', ['A', 'B'],
+                        ['cm_1', 'cm_2'], ['matches.csv', 'matches.csv'],
+                        ['non_matches.csv', 'non_matches.csv'], [0, 0], [1, 1], [2, 2], [0, 0],
+                        [1, 1], 2, instrument=True,
+                        chunk_hook=CProfileHook(['chunk_1'], 'super_match_profiles'))
+        profile = sm.chunk_results['chunk_0'].profile
+        assert list(profile.stages) == ['load primary', 'index primary', 'load A', 'combine A',
+                                        'load B', 'combine B', 'combine probabilities', 'write',
+                                        'total']
+        # The primary catalogue, then each match and non-match table.
+        assert len(profile.reads) == 5
+        assert profile.reads[0]['location'] == 'catalogue_folder/chunk_0/primary_catalogue.csv'
+        with open('super_match_save_folder/super_match_report.json', 'r', encoding='UTF-8') as f:
+            assert len(json.load(f)['chunks']) == 3
+        assert os.listdir('super_match_profiles') == ['chunk_1.prof']
+
+    def test_lazy_run(self):
+        primary_ids, _, probabilities = self.make_good_run_inputs()
+        args = ['top_level_folder', 'primary_cat', 'catalogue_folder', 1, 'primary_catalogue.csv',
+                'super_match_save_folder', ['A', 'B'], ['cm_1', 'cm_2'], ['matches.csv', 'matches.csv'],
+                ['non_matches.csv', 'non_matches.csv'], [0, 0], [1, 1], [2, 2], [0, 0], [1, 1], 2]
+        sm = SuperMatch(*args, lazy=True)
+        assert sm.chunk_folders == ['chunk_0', 'chunk_1', 'chunk_2']
+        assert not os.path.exists('super_match_save_folder')
+
+        # In-memory tables match those later saved to disk.
+        dataframes = dict(sm.iter_chunk_super_matches())
+        assert not os.path.exists('super_match_save_folder')
+        assert list(dataframes['chunk_1'].columns) == [
+            'primary_cat ID', 'A ID', 'B ID', 'Probability', 'Bad catalogue',
+            'Probability without bad catalogue']
+        assert list(dataframes['chunk_1']['primary_cat ID']) == list(primary_ids[1])
+        structured = sm.chunk_super_match('chunk_2', output='structured')
+        assert_allclose(structured['Probability'], probabilities[2][0] * probabilities[2][1])
+
+        sm.run()
+        assert all(result.success for result in sm.chunk_results.values())
+        for chunk_folder, dataframe in dataframes.items():
+            saved = pd.read_csv(f'super_match_save_folder/{chunk_folder}/primary_cat_super_match.csv',
+                                header=None, keep_default_na=False)
+            assert list(saved[0]) == list(dataframe['primary_cat ID'])
+            assert_allclose(saved[3], dataframe['Probability'])
+
+        with pytest.raises(ValueError, match='list_of_match_filenames has 1 entries'):
+            SuperMatch(*args[:8], ['matches.csv'], *args[9:], lazy=True)
+
+    def test_combine_super_match(self):
+        # Arrays already in memory need never be written to disk.
+        super_match = combine_super_match(
+            'P', np.array([10, 11, 12]), ['A', 'B'],
+            [(np.array([12, 10]), np.array(['a', 'b'], dtype=object), np.array([0.9, 0.4]),
+              np.array([11]), np.array([0.8])),
+             (np.array([11]), np.array([5]), np.array([0.7]), np.array([10, 12]),
+              np.array([0.5, 0.6]))], output='dataframe')
+        assert list(super_match['A ID']) == ['b', 'N/A', 'a']
+        assert list(super_match['B ID']) == ['N/A', 5, 'N/A']
+        assert_allclose(super_match['Probability'], [0.2, 0.56, 0.54])
+        assert list(super_match['Bad catalogue']) == ['A', 'N/A', 'N/A']
+        # A lower threshold leaves object 10 without a bad catalogue.
+        super_match = combine_super_match(
+            'P', np.array([10]), ['A', 'B'],
+            [(np.array([10]), np.array([1]), np.array([0.4]), np.array([]), np.array([])),
+             (np.array([]), np.array([]), np.array([]), np.array([10]), np.array([0.5]))],
+            bad_catalogue_threshold=0.3)
+        assert super_match.columns['Bad catalogue'][0] == -1
+        assert_allclose(super_match.columns['Probability without bad catalogue'], [0.2])
+        with pytest.raises(ValueError, match="output must be"):
+            combine_super_match('P', np.array([10]), [], [], output='csv')
+
+    def test_sharded_run(self):
+        self.make_good_run_inputs()
+        args = ['top_level_folder', 'primary_cat', 'catalogue_folder', 1, 'primary_catalogue.csv',
+                'super_match_save_folder', ['A', 'B'], ['cm_1', 'cm_2'], ['matches.csv', 'matches.csv'],
+                ['non_matches.csv', 'non_matches.csv'], [0, 0], [1, 1], [2, 2], [0, 0], [1, 1], 1]
+        # Each shard is a separate process, taking its rank from the
+        # environment as it would under a job scheduler.
+        with open('top_level_folder/run_shard.py', 'w', encoding='UTF-8') as f:
+            f.write(f'from birnam import SuperMatch\nSuperMatch(*{args!r}, shard="environment")\n')
+        assert launch_local_shards([sys.executable, 'top_level_folder/run_shard.py'], 2) == [0, 0]
+
+        sm = SuperMatch(*args, lazy=True)
+        assert sm.verify_shards(n_shards=2) == {f'chunk_{i}': 'succeeded' for i in range(3)}
+        for i in range(3):
+            assert os.path.exists(f'super_match_save_folder/chunk_{i}/primary_cat_super_match.csv')
+        for rank in range(2):
+            assert os.path.exists(
+                f'super_match_save_folder/super_match_manifest.shard_{rank}_of_2.jsonl')
+
+        # A shard of a larger split that has not run is reported.
+        assert SuperMatch(*args, shard=(2, 3), lazy=True).chunk_folders == ['chunk_2']
+        with pytest.raises(RuntimeError, match='shard 0 of 3 has not completed'):
+            sm.verify_shards(n_shards=3)
+
+        # A re-run of a shard that stops part-way does not leave the previous
+        # run's marker claiming the shard completed.
+        shard = SuperMatch(*args, shard=(0, 2), lazy=True, validate=True)
+        os.remove(f'top_level_folder/cm_2/{shard.chunk_folders[0]}/matches.csv')
+        with pytest.raises(ValueError, match='chunks are invalid'):
+            shard.run()
+        with pytest.raises(RuntimeError, match='shard 0 of 2 has not completed'):
+            sm.verify_shards(n_shards=2)
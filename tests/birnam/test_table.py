@@ -0,0 +1,100 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "table" module.
+'''
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+from birnam import SuperMatchTable, compact_ids  # pylint: disable=import-error
+
+
+class TestSuperMatchTable():
+    def make_table(self):
+        table = SuperMatchTable.initialise('P', ['A', 'B', 'C'],
+                                           np.array(['ID_1', 'ID_2', 'ID_3', 'ID_4'], dtype=object))
+        table.set_secondary_ids(0, np.array([2, 0]), np.array(['J1', 'J2'], dtype=object),
+                                np.array([1]))
+        table.set_secondary_ids(1, np.array([1]), np.array([77]), np.array([0, 2, 3]))
+        table.columns['Probability'][:] = [0.1, 0.2, 0.3, 0.4]
+        table.columns['Bad catalogue'][:] = [-1, 1, 0, -1]
+        return table
+
+    def test_compact_ids(self):
+        assert compact_ids(np.array([1, 2], dtype=np.int32)).dtype == np.int64
+        assert compact_ids(np.array(['ab', 'cde'], dtype=object)).dtype == np.dtype('S3')
+        assert compact_ids(np.array(['é'], dtype=object)).dtype.kind == 'U'
+
+    def test_no_object_columns(self):
+        table = self.make_table()
+        assert all(column.dtype != object for column in table.columns.values())
+        assert table.columns['Bad catalogue'].dtype == np.int16
+        assert list(table.columns) == table.column_names
+        assert len(table) == 4
+
+    def test_decoded_columns(self):
+        decoded = self.make_table().decoded_columns()
+        assert list(decoded['P ID']) == ['ID_1', 'ID_2', 'ID_3', 'ID_4']
+        # Two-character IDs must not truncate the three-character non-match.
+        assert list(decoded['A ID']) == ['J2', 'N/A', 'J1', None]
+        assert list(decoded['B ID']) == ['N/A', 77, 'N/A', 'N/A']
+        assert list(decoded['C ID']) == [None] * 4
+        assert list(decoded['Bad catalogue']) == ['N/A', 'B', 'A', 'N/A']
+
+    def test_concatenate(self):
+        table = self.make_table()
+        # The second half has no string counterparts in A, so remains integer.
+        other = SuperMatchTable.initialise('P', ['A', 'B', 'C'], np.array(['ID_5'], dtype=object))
+        other.set_secondary_ids(0, np.array([], dtype=int), np.array([], dtype=np.int64),
+                                np.array([0]))
+        joined = SuperMatchTable.concatenate([table.take(np.array([3, 0])), other])
+        assert list(joined.decoded_columns()['A ID']) == [None, 'J2', 'N/A']
+        assert_allclose(joined.columns['Probability'], [0.4, 0.1, 1])
+
+    def test_add_probabilities(self):
+        # Adding each catalogue's probabilities in turn must match combining
+        # them all at once, including ties, zeros and absent objects.
+        rng = np.random.default_rng(seed=4021)
+        probabilities = rng.choice([0, 0.1, 0.25, 0.4, 0.7, 0.9, 1], (200, 5))
+        probabilities[::7, 2] = 1
+        table = SuperMatchTable.initialise('P', ['A', 'B', 'C', 'D', 'E'], np.arange(200))
+        for i in range(5):
+            rows = np.flatnonzero(probabilities[:, i] < 1)
+            table.add_probabilities(i, rows, probabilities[rows, i])
+        worst_probability, worst_catalogue, probability_without_worst = table.worst
+        expected_worst = np.argmin(probabilities, axis=1)
+        assert_array_equal(worst_catalogue, expected_worst)
+        assert_array_equal(worst_probability, probabilities[np.arange(200), expected_worst])
+        others = probabilities.copy()
+        others[np.arange(200), expected_worst] = 1
+        assert_allclose(probability_without_worst, np.prod(others, axis=1), rtol=1e-15)
+        assert_allclose(table.columns['Probability'], np.prod(probabilities, axis=1), rtol=1e-15)
+
+    def test_conversions(self):
+        table = self.make_table()
+        dataframe = table.to_dataframe()
+        assert list(dataframe.columns) == table.column_names
+        structured = table.to_structured()
+        assert structured.dtype.names == tuple(table.column_names)
+        assert_array_equal(structured['Probability'], dataframe['Probability'])
+
+    def test_save_load_add_catalogue(self):
+        table = self.make_table()
+        table.add_probabilities(1, np.array([0, 2]), np.array([0.5, 0.7]))
+        table.save('super_match_state.npz')
+        loaded = SuperMatchTable.load('super_match_state.npz')
+        assert loaded.list_of_catalogue_names == ['A', 'B', 'C']
+        for name in table.column_names:
+            assert_array_equal(loaded.columns[name], table.columns[name])
+        assert list(loaded.primary_ids) == ['ID_1', 'ID_2', 'ID_3', 'ID_4']
+        # The saved state has one value per row, whatever the number of catalogues.
+        for saved, state in zip(loaded.worst, table.worst):
+            assert saved.shape == (4,)
+            assert_array_equal(saved, state)
+
+        assert loaded.add_catalogue('D') == 3
+        assert list(loaded.columns) == loaded.column_names
+        assert list(loaded.decoded_columns()['D ID']) == [None] * 4
+        with pytest.raises(ValueError, match='Catalogue A is already'):
+            loaded.add_catalogue('A')
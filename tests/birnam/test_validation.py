@@ -0,0 +1,124 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "validation" module.
+'''
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# pylint: disable-next=import-error
+from birnam import SuperMatch, validate_inputs
+
+
+class TestValidation():
+    def setup_method(self):
+        os.system('rm -r validation_folder')
+        rng = np.random.default_rng(seed=3307)
+        for i, chunk_ids in enumerate(np.split(np.arange(60), 3)):
+            os.makedirs(f'validation_folder/primary/chunk_{i}')
+            pd.DataFrame({0: chunk_ids, 1: rng.uniform(0, 1, 20)}).to_csv(
+                f'validation_folder/primary/chunk_{i}/primary.csv', header=False, index=False)
+            for name in ['a', 'b']:
+                os.makedirs(f'validation_folder/cross_matches/cm_{name}/chunk_{i}')
+                pd.DataFrame({0: chunk_ids[:10], 1: [f'{name}_{x}' for x in chunk_ids[:10]],
+                              2: rng.uniform(0.5, 1, 10)}).to_csv(
+                    f'validation_folder/cross_matches/cm_{name}/chunk_{i}/matches.csv',
+                    header=False, index=False)
+                pd.DataFrame({0: chunk_ids[10:], 1: rng.uniform(0, 0.5, 10)}).to_csv(
+                    f'validation_folder/cross_matches/cm_{name}/chunk_{i}/non_matches.csv',
+                    header=False, index=False)
+        self.args = ['validation_folder/cross_matches', 'P', 'validation_folder/primary', 0,
+                     'primary.csv', 'validation_folder/super_match', ['A', 'B'],
+                     ['cm_a', 'cm_b'], ['matches.csv'] * 2, ['non_matches.csv'] * 2, [0, 0],
+                     [1, 1], [2, 2], [0, 0], [1, 1], 2]
+
+    def test_valid_inputs(self):
+        sm = SuperMatch(*self.args, lazy=True)
+        report = validate_inputs(sm)
+        assert report.valid
+        assert report.issues == {'chunk_0': [], 'chunk_1': [], 'chunk_2': []}
+        assert str(report) == 'The inputs of all 3 chunks are valid.'
+        report.raise_if_invalid()
+
+    def test_invalid_inputs(self):
+        # A match missing from the primary catalogue, a duplicated non-match,
+        # and a primary object in neither table.
+        pd.DataFrame({0: [0, 1, 100], 1: ['a_0', 'a_1', 'a_100'], 2: [0.9] * 3}).to_csv(
+            'validation_folder/cross_matches/cm_a/chunk_0/matches.csv', header=False, index=False)
+        pd.DataFrame({0: [*range(10, 20), 10], 1: [0.1] * 11}).to_csv(
+            'validation_folder/cross_matches/cm_a/chunk_0/non_matches.csv', header=False,
+            index=False)
+        os.system('rm -r validation_folder/cross_matches/cm_b/chunk_1')
+        # Too few columns for the probability column.
+        pd.DataFrame({0: range(50, 60)}).to_csv(
+            'validation_folder/cross_matches/cm_b/chunk_2/non_matches.csv', header=False,
+            index=False)
+
+        sm = SuperMatch(*self.args, lazy=True)
+        report = validate_inputs(sm, n_pool=1)
+        assert not report.valid
+        issues = report.issues['chunk_0']
+        assert len(issues) == 3
+        assert issues[0].startswith('1 ID(s) in A match and non-match tables are not present')
+        assert '100' in issues[0]
+        assert issues[1].startswith('1 primary ID(s) appear more than once') and '10' in issues[1]
+        assert issues[2].startswith('8 primary ID(s) appear in neither')
+        assert report.issues['chunk_1'] == [
+            f'{os.path.join("validation_folder/cross_matches", "cm_b", "chunk_1")} does not exist.']
+        assert report.issues['chunk_2'][0].startswith(
+            'Columns 0, 1 of validation_folder/cross_matches/cm_b/chunk_2/non_matches.csv could '
+            'not be loaded')
+        assert str(report).startswith('The inputs of 3 of 3 chunks are invalid:\nchunk_0:\n')
+
+        # No chunk is run when validating before a run.
+        sm = SuperMatch(*self.args, lazy=True, validate=True)
+        with pytest.raises(ValueError, match='chunks are invalid'):
+            sm.run()
+        assert not os.path.exists('validation_folder/super_match/chunk_0')
+        with open('validation_folder/super_match/super_match_validation.json', 'r',
+                  encoding='utf-8') as f:
+            saved = json.load(f)
+        assert not saved['valid'] and saved['chunks'] == report.issues
+
+    def test_duplicated_primary_ids(self):
+        pd.DataFrame({0: [*range(20), 5], 1: [0.5] * 21}).to_csv(
+            'validation_folder/primary/chunk_0/primary.csv', header=False, index=False)
+        sm = SuperMatch(*self.args, lazy=True)
+        report = validate_inputs(sm, chunk_folders=['chunk_0'])
+        assert list(report.issues) == ['chunk_0']
+        assert report.issues['chunk_0'] == [
+            'validation_folder/primary/chunk_0/primary.csv contains 1 duplicated ID(s), e.g. 5.']
+
+    def test_invalid_probabilities(self):
+        # Probabilities that are not numbers, and that are missing or out of
+        # range.
+        pd.DataFrame({0: range(10), 1: [f'a_{x}' for x in range(10)],
+                      2: [f'S{x}' for x in range(10)]}).to_csv(
+            'validation_folder/cross_matches/cm_a/chunk_0/matches.csv', header=False, index=False)
+        pd.DataFrame({0: range(30, 40), 1: [0.1] * 7 + [np.nan, -0.5, 3]}).to_csv(
+            'validation_folder/cross_matches/cm_b/chunk_1/non_matches.csv', header=False,
+            index=False)
+
+        sm = SuperMatch(*self.args, lazy=True)
+        report = validate_inputs(sm, n_pool=1)
+        issues = report.issues['chunk_0']
+        assert len(issues) == 1
+        assert issues[0].startswith(
+            'Columns 0, 1, 2 of validation_folder/cross_matches/cm_a/chunk_0/matches.csv could not '
+            'be loaded: ValueError')
+        assert report.issues['chunk_1'] == [
+            '3 probabilities in validation_folder/cross_matches/cm_b/chunk_1/non_matches.csv are '
+            'missing or not between 0 and 1, e.g. nan, -0.5, 3.0.']
+        assert report.issues['chunk_2'] == []
+
+    def test_validated_run(self):
+        sm = SuperMatch(*self.args, validate=True)
+        assert all(result.success for result in sm.chunk_results.values())
+        with open('validation_folder/super_match/super_match_validation.json', 'r',
+                  encoding='utf-8') as f:
+            assert json.load(f) == {'valid': True,
+                                    'chunks': {'chunk_0': [], 'chunk_1': [], 'chunk_2': []}}
@@ -0,0 +1,146 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+'''
+Tests for the "writers" module.
+'''
+
+import gzip
+import os
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+# pylint: disable-next=import-error
+from birnam import CSVWriter, HDF5Writer, ParquetWriter, SuperMatchTable, SuperMatchWriter, get_writer
+
+
+class TestWriters():
+    def setup_method(self):
+        os.makedirs('writers_folder', exist_ok=True)
+        self.columns = {'P ID': np.array(['ID_1', 'ID_2', 'ID_3'], dtype=object),
+                        'A ID': np.array(['A_5', 'N/A', None], dtype=object),
+                        'Probability': np.array([0.25, 0.5, 1])}
+
+    def test_csv(self):
+        with CSVWriter('writers_folder/table.csv') as writer:
+            writer.write(self.columns)
+            writer.write(self.columns)
+        with open('writers_folder/table.csv', 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        assert lines == ['ID_1,A_5,0.25\n', 'ID_2,N/A,0.5\n', 'ID_3,,1.0\n'] * 2
+
+    def test_gzip_csv(self):
+        assert CSVWriter.file_extension('gzip') == 'csv.gz'
+        with CSVWriter('writers_folder/table.csv.gz', compression='gzip') as writer:
+            writer.write(self.columns)
+        with gzip.open('writers_folder/table.csv.gz', 'rt', encoding='utf-8') as f:
+            assert f.readline() == 'ID_1,A_5,0.25\n'
+
+    def test_csv_table(self):
+        table = SuperMatchTable.initialise('P', ['A', 'B'], np.array([-12, 0, 345]))
+        table.set_secondary_ids(0, np.array([0]), np.array(['a,"b"'], dtype=object), np.array([1]))
+        table.set_secondary_ids(1, np.array([2]), np.array([7]), np.array([0]))
+        table.columns['Probability'][:] = [0.125, -0.5, 1e-7]
+        table.columns['Bad catalogue'][:] = [1, -1, 0]
+        expected = ['-12,"a,""b""",N/A,0.125,B,1.0\n', '0,N/A,,-0.5,N/A,1.0\n',
+                    '345,,7,1e-07,A,1.0\n']
+        # Compact tables are formatted directly, exactly as if decoded.
+        with CSVWriter('writers_folder/table.csv') as writer:
+            writer.rows_per_block = 2
+            writer.write_table(table)
+        with open('writers_folder/table.csv', 'r', encoding='utf-8') as f:
+            assert f.readlines() == expected
+        with CSVWriter('writers_folder/decoded.csv') as writer:
+            writer.write(table.decoded_columns())
+        with open('writers_folder/decoded.csv', 'r', encoding='utf-8') as f:
+            assert f.readlines() == expected
+
+        with CSVWriter('writers_folder/table.csv', float_precision=2, header=True) as writer:
+            writer.write_table(table)
+            writer.write_table(table.take([0]))
+        with open('writers_folder/table.csv', 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        assert lines[0] == ('P ID,A ID,B ID,Probability,Bad catalogue,'
+                            'Probability without bad catalogue\n')
+        assert [line.split(',')[-3] for line in lines[2:]] == ['-0.50', '0.00', '0.12']
+
+    def test_zstd_csv(self):
+        zstandard = pytest.importorskip('zstandard')
+        assert CSVWriter.file_extension('zstd') == 'csv.zst'
+        with CSVWriter('writers_folder/table.csv.zst', compression='zstd') as writer:
+            writer.write(self.columns)
+        with open('writers_folder/table.csv.zst', 'rb') as f:
+            text = zstandard.ZstdDecompressor().stream_reader(f).read().decode('utf-8')
+        assert text.startswith('ID_1,A_5,0.25\n')
+
+    def test_parquet(self):
+        pq = pytest.importorskip('pyarrow.parquet')
+        with ParquetWriter('writers_folder/table.parquet') as writer:
+            writer.write(self.columns)
+            writer.write(self.columns)
+        table = pq.read_table('writers_folder/table.parquet')
+        assert table.num_rows == 6
+        assert table.column('A ID').to_pylist()[:3] == ['A_5', 'N/A', None]
+        assert_allclose(table.column('Probability').to_numpy()[3:], [0.25, 0.5, 1])
+
+    def test_hdf5(self):
+        h5py = pytest.importorskip('h5py')
+        with HDF5Writer('writers_folder/table.h5') as writer:
+            writer.write(self.columns)
+            writer.write(self.columns)
+        with h5py.File('writers_folder/table.h5', 'r') as f:
+            assert f['P ID'].asstr()[:].tolist() == ['ID_1', 'ID_2', 'ID_3'] * 2
+            assert_allclose(f['Probability'][:], [0.25, 0.5, 1] * 2)
+
+    def test_parquet_table(self):
+        pq = pytest.importorskip('pyarrow.parquet')
+        table = SuperMatchTable.initialise('P', ['A', 'B'], np.array([-12, 0, 345]))
+        table.set_secondary_ids(0, np.array([0]), np.array(['a_1'], dtype=object), np.array([1]))
+        table.set_secondary_ids(1, np.array([2]), np.array([7]), np.array([0]))
+        table.columns['Bad catalogue'][:] = [1, -1, 0]
+        with ParquetWriter('writers_folder/table.parquet') as writer:
+            writer.write_table(table)
+            writer.write_table(table.take([2]))
+        saved = pq.read_table('writers_folder/table.parquet')
+        # Integer IDs keep their type, with non-matches and absent entries as
+        # nulls, as do the non-matches of string IDs.
+        assert str(saved.schema.field('P ID').type) == 'int64'
+        assert str(saved.schema.field('B ID').type) == 'int64'
+        assert saved.column('P ID').to_pylist() == [-12, 0, 345, 345]
+        assert saved.column('A ID').to_pylist() == ['a_1', 'N/A', None, None]
+        assert saved.column('B ID').to_pylist() == [None, None, 7, 7]
+        assert saved.column('Bad catalogue').to_pylist() == ['B', 'N/A', 'A', 'A']
+
+    def test_hdf5_table(self):
+        h5py = pytest.importorskip('h5py')
+        table = SuperMatchTable.initialise('P', ['A', 'B'], np.array(['p_1', 'p_2', 'p_3']))
+        table.set_secondary_ids(0, np.array([0]), np.array(['a_1'], dtype=object), np.array([1]))
+        table.set_secondary_ids(1, np.array([2]), np.array([7]), np.array([0]))
+        table.columns['Bad catalogue'][:] = [1, -1, 0]
+        with HDF5Writer('writers_folder/table.h5') as writer:
+            writer.write_table(table)
+            writer.write_table(table.take([2]))
+        with h5py.File('writers_folder/table.h5', 'r') as f:
+            assert f['P ID'].asstr()[:].tolist() == ['p_1', 'p_2', 'p_3', 'p_3']
+            assert f['A ID'].asstr()[:].tolist() == ['a_1', 'N/A', '', '']
+            assert f['B ID'].dtype == np.int64 and f['B ID'][2] == 7
+            assert f['Bad catalogue'].asstr()[:].tolist() == ['B', 'N/A', 'A', 'A']
+
+    def test_failed_write_is_not_visible(self):
+        if os.path.exists('writers_folder/failed.csv'):
+            os.remove('writers_folder/failed.csv')
+        with pytest.raises(RuntimeError):
+            with CSVWriter('writers_folder/failed.csv') as writer:
+                writer.write(self.columns)
+                raise RuntimeError('Simulated failure.')
+        assert os.listdir('writers_folder').count('failed.csv') == 0
+        assert not any(f.endswith('.tmp') for f in os.listdir('writers_folder'))
+
+    def test_get_writer(self):
+        assert get_writer('parquet') is ParquetWriter
+        assert get_writer(CSVWriter) is CSVWriter
+        assert issubclass(get_writer('hdf5'), SuperMatchWriter)
+        with pytest.raises(ValueError, match='output_format must be one of'):
+            get_writer('fits')
+        with pytest.raises(ValueError, match='compression must be'):
+            CSVWriter('writers_folder/table.csv', compression='bz2')